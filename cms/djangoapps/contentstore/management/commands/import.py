@@ -20,6 +20,10 @@ class Command(BaseCommand):
         make_option('--nostatic',
                     action='store_true',
                     help='Skip import of static content'),
+        make_option('--delete-removed',
+                    action='store_true',
+                    dest='delete_removed',
+                    help='Delete the modules of the courses which are not in the imported xml'),
     )
 
     def handle(self, *args, **options):
@@ -47,7 +51,8 @@ class Command(BaseCommand):
         _, course_items = import_from_xml(
             mstore, data_dir, course_dirs, load_error_modules=False,
             static_content_store=contentstore(), verbose=True,
-            do_import_static=do_import_static
+            do_import_static=do_import_static,
+            delete_removed_modules=options.get('delete_removed', False)
         )
 
         for module in course_items:
@@ -1,6 +1,15 @@
-from cache_toolbox.core import get_cached_content, set_cached_content, del_cached_content
+import os
+import shutil
+import tempfile
+import time
+from StringIO import StringIO
+
+from mock import patch
+
+from cache_toolbox import app_settings
+from cache_toolbox.core import get_cached_content, set_cached_content, del_cached_content, set_cached_large_content
 from xmodule.modulestore import Location
-from xmodule.contentstore.content import StaticContent
+from xmodule.contentstore.content import StaticContent, StaticContentStream
 from django.test import TestCase
 
 
@@ -34,3 +43,70 @@ class CachingTestCase(TestCase):
                          'should not be stored in cache with unicodeLocation')
         self.assertEqual(None, get_cached_content(self.nonUnicodeLocation),
                          'should not be stored in cache with nonUnicodeLocation')
+
+
+class LargeContentCachingTestCase(TestCase):
+    """
+    Tests of the local disk cache of large assets.
+    """
+    location = Location(u'c4x', u'mitX', u'800', u'asset', u'lecture.mp4')
+    data = 'video data' * 1000
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        for name, value in (('CACHE_TOOLBOX_CONTENT_DISK_CACHE_DIR', self.directory),
+                            ('CACHE_TOOLBOX_CONTENT_DISK_CACHE_SIZE', 3 * len(self.data))):
+            patcher = patch.object(app_settings, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(del_cached_content, self.location)
+
+    def stream_content(self, location=None, digest='0123abcd'):
+        """Return streamed content like the contentstore's."""
+        return StaticContentStream(
+            location or self.location, 'lecture.mp4', 'video/mp4', StringIO(self.data),
+            length=len(self.data), content_digest=digest
+        )
+
+    def test_put_and_get(self):
+        content = set_cached_large_content(self.stream_content())
+        self.assertEqual(''.join(content.stream_data()), self.data)
+
+        cached = get_cached_content(self.location)
+        self.assertEqual(cached.content_digest, '0123abcd')
+        self.assertEqual(''.join(cached.stream_data_in_range(10, 19)), self.data[10:20])
+
+    def test_missing_file_is_not_cached(self):
+        set_cached_large_content(self.stream_content())
+        shutil.rmtree(self.directory)
+        self.assertIsNone(get_cached_content(self.location))
+
+    def test_delete(self):
+        set_cached_large_content(self.stream_content())
+        del_cached_content(self.location)
+        self.assertIsNone(get_cached_content(self.location))
+
+    def test_least_recently_used_evicted(self):
+        locations = [self.location.replace(name=u'lecture{}.mp4'.format(i)) for i in range(4)]
+        now = time.time()
+        for location, last_used in zip(locations, (now, now - 20, now - 10)):
+            self.addCleanup(del_cached_content, location)
+            content = set_cached_large_content(self.stream_content(location))
+            os.utime(content.path, (last_used, last_used))
+
+        # the cache is full, so caching another asset evicts the least recently used one
+        self.addCleanup(del_cached_content, locations[3])
+        set_cached_large_content(self.stream_content(locations[3]))
+
+        self.assertIsNotNone(get_cached_content(locations[0]))
+        self.assertIsNone(get_cached_content(locations[1]))
+        self.assertIsNotNone(get_cached_content(locations[2]))
+        self.assertIsNotNone(get_cached_content(locations[3]))
+
+    def test_too_large_content_not_cached(self):
+        content = StaticContentStream(
+            self.location, 'lecture.mp4', 'video/mp4', StringIO(self.data),
+            length=4 * len(self.data), content_digest='0123abcd'
+        )
+        self.assertIsNone(set_cached_large_content(content))
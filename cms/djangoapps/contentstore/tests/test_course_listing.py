@@ -1,28 +1,22 @@
 """
-Unit tests for getting the list of courses for a user through iterating all courses and
-by reversing group name formats.
+Unit tests for getting the list of courses for a user by joining the course summaries
+against the user's group names, whatever their format.
 """
-import random
-from chrono import Timer
-from unittest import skip
+from mock import patch
 
 from django.contrib.auth.models import Group
 from django.test import RequestFactory
 
-from contentstore.views.course import _accessible_courses_list, _accessible_courses_list_from_groups
+from contentstore.views.course import _accessible_courses_list
 from contentstore.utils import delete_course_and_groups
 from contentstore.tests.utils import AjaxEnabledTestClient
 from student.tests.factories import UserFactory
 from student.roles import CourseInstructorRole, CourseStaffRole
 from xmodule.modulestore import Location
 from xmodule.modulestore.django import loc_mapper
-from xmodule.modulestore.exceptions import ItemNotFoundError
 from xmodule.modulestore.tests.django_utils import ModuleStoreTestCase
 from xmodule.modulestore.tests.factories import CourseFactory
 
-TOTAL_COURSES_COUNT = 500
-USER_COURSES_COUNT = 50
-
 
 class TestCourseListing(ModuleStoreTestCase):
     """
@@ -81,121 +75,83 @@ class TestCourseListing(ModuleStoreTestCase):
         self.client.logout()
         ModuleStoreTestCase.tearDown(self)
 
-    def test_get_course_list(self):
+    def _listed_locations(self, user):
         """
-        Test getting courses with new access group format e.g. 'instructor_edx.course.run'
+        Return the locations of the courses listed for `user`
         """
         request = self.factory.get('/course')
-        request.user = self.user
+        request.user = user
+        return set(course.location for course in _accessible_courses_list(request))
 
+    def test_get_course_list(self):
+        """
+        Test getting courses with new access group format e.g. 'instructor_edx.course.run'
+        """
         course_location = Location(['i4x', 'Org1', 'Course1', 'course', 'Run1'])
         self._create_course_with_access_groups(course_location, 'group_name_with_dots', self.user)
 
-        # get courses through iterating all courses
+        request = self.factory.get('/course')
+        request.user = self.user
         courses_list = _accessible_courses_list(request)
         self.assertEqual(len(courses_list), 1)
+        self.assertEqual(courses_list[0].location, course_location)
+        self.assertEqual(courses_list[0].display_name, course_location.name)
+        self.assertEqual(courses_list[0].display_org_with_default, course_location.org)
+        self.assertEqual(courses_list[0].display_number_with_default, course_location.course)
 
-        # get courses by reversing group name formats
-        courses_list_by_groups = _accessible_courses_list_from_groups(request)
-        self.assertEqual(len(courses_list_by_groups), 1)
-        # check both course lists have same courses
-        self.assertEqual(courses_list, courses_list_by_groups)
+        # the courses are listed for non staff users by their groups
+        user = UserFactory()
+        user_course_location = Location(['i4x', 'Org2', 'Course2', 'course', 'Run2'])
+        self._create_course_with_access_groups(user_course_location, 'group_name_with_dots', user)
+        self.assertEqual(self._listed_locations(user), set([user_course_location]))
 
     def test_get_course_list_with_old_group_formats(self):
         """
         Test getting all courses with old course role (instructor/staff) groups
         """
-        request = self.factory.get('/course')
-        request.user = self.user
-
-        # create a course with new groups name format e.g. 'instructor_edx.course.run'
-        course_location = Location(['i4x', 'Org_1', 'Course_1', 'course', 'Run_1'])
-        self._create_course_with_access_groups(course_location, 'group_name_with_dots', self.user)
-
-        # create a course with old groups name format e.g. 'instructor_edX/Course/Run'
-        old_course_location = Location(['i4x', 'Org_2', 'Course_2', 'course', 'Run_2'])
-        self._create_course_with_access_groups(old_course_location, 'group_name_with_slashes', self.user)
-
-        # get courses through iterating all courses
-        courses_list = _accessible_courses_list(request)
-        self.assertEqual(len(courses_list), 2)
-
-        # get courses by reversing groups name
-        courses_list_by_groups = _accessible_courses_list_from_groups(request)
-        self.assertEqual(len(courses_list_by_groups), 2)
-
-        # create a new course with older group name format (with dots in names) e.g. 'instructor_edX/Course.name/Run.1'
-        old_course_location = Location(['i4x', 'Org.Foo.Bar', 'Course.number', 'course', 'Run.name'])
-        self._create_course_with_access_groups(old_course_location, 'group_name_with_slashes', self.user)
-        # get courses through iterating all courses
-        courses_list = _accessible_courses_list(request)
-        self.assertEqual(len(courses_list), 3)
-        # get courses by reversing group name formats
-        courses_list_by_groups = _accessible_courses_list_from_groups(request)
-        self.assertEqual(len(courses_list_by_groups), 3)
-
-        # create a new course with older group name format e.g. 'instructor_Run'
-        old_course_location = Location(['i4x', 'Org_3', 'Course_3', 'course', 'Run_3'])
-        self._create_course_with_access_groups(old_course_location, 'group_name_with_course_name_only', self.user)
-
-        # get courses through iterating all courses
-        courses_list = _accessible_courses_list(request)
-        self.assertEqual(len(courses_list), 4)
-
-        # should raise an exception for getting courses with older format of access group by reversing django groups
-        with self.assertRaises(ItemNotFoundError):
-            courses_list_by_groups = _accessible_courses_list_from_groups(request)
+        user = UserFactory()
+        course_locations = [
+            # group name format e.g. 'instructor_edx.course.run'
+            (Location(['i4x', 'Org_1', 'Course_1', 'course', 'Run_1']), 'group_name_with_dots'),
+            # group name format e.g. 'instructor_edX/Course/Run'
+            (Location(['i4x', 'Org_2', 'Course_2', 'course', 'Run_2']), 'group_name_with_slashes'),
+            # group name format with dots in names e.g. 'instructor_edX/Course.name/Run.1'
+            (Location(['i4x', 'Org.Foo.Bar', 'Course.number', 'course', 'Run.name']), 'group_name_with_slashes'),
+            # group name format e.g. 'instructor_Course'
+            (Location(['i4x', 'Org_3', 'Course_3', 'course', 'Run_3']), 'group_name_with_course_name_only'),
+        ]
+        for course_location, group_name_format in course_locations:
+            self._create_course_with_access_groups(course_location, group_name_format, user)
+        # and a course the user has no access to
+        self._create_course_with_access_groups(Location(['i4x', 'Org_4', 'Course_4', 'course', 'Run_4']))
+
+        self.assertEqual(
+            self._listed_locations(user),
+            set(course_location for course_location, __ in course_locations)
+        )
+        self.assertEqual(len(self._listed_locations(self.user)), len(course_locations) + 1)
 
-    def test_course_listing_performance(self):
+    def test_course_listing_does_not_load_courses(self):
         """
-        Create large number of courses and give access of some of these courses to the user and
-        compare the time to fetch accessible courses for the user through traversing all courses and
-        reversing django groups
+        Test that the courses are listed from their summaries, which only load each course once (to leave
+        out those which can't be loaded)
         """
-        # create and log in a non-staff user
-        self.user = UserFactory()
-        request = self.factory.get('/course')
-        request.user = self.user
-        self.client.login(username=self.user.username, password='test')
-
-        # create list of random course numbers which will be accessible to the user
-        user_course_ids = random.sample(range(TOTAL_COURSES_COUNT), USER_COURSES_COUNT)
-
-        # create courses and assign those to the user which have their number in user_course_ids
-        for number in range(TOTAL_COURSES_COUNT):
-            org = 'Org{0}'.format(number)
-            course = 'Course{0}'.format(number)
-            run = 'Run{0}'.format(number)
-            course_location = Location(['i4x', org, course, 'course', run])
-            if number in user_course_ids:
-                self._create_course_with_access_groups(course_location, 'group_name_with_dots', self.user)
+        user = UserFactory()
+        user_course_locations = set()
+        for number in range(10):
+            course_location = Location(['i4x', 'Org{0}'.format(number), 'Course{0}'.format(number), 'course', 'Run'])
+            if number % 3 == 0:
+                self._create_course_with_access_groups(course_location, 'group_name_with_dots', user)
+                user_course_locations.add(course_location)
             else:
                 self._create_course_with_access_groups(course_location, 'group_name_with_dots')
 
-        # time the get courses by iterating through all courses
-        with Timer() as iteration_over_courses_time_1:
-            courses_list = _accessible_courses_list(request)
-        self.assertEqual(len(courses_list), USER_COURSES_COUNT)
-
-        # time again the get courses by iterating through all courses
-        with Timer() as iteration_over_courses_time_2:
-            courses_list = _accessible_courses_list(request)
-        self.assertEqual(len(courses_list), USER_COURSES_COUNT)
-
-        # time the get courses by reversing django groups
-        with Timer() as iteration_over_groups_time_1:
-            courses_list = _accessible_courses_list_from_groups(request)
-        self.assertEqual(len(courses_list), USER_COURSES_COUNT)
-
-        # time again the get courses by reversing django groups
-        with Timer() as iteration_over_groups_time_2:
-            courses_list = _accessible_courses_list_from_groups(request)
-        self.assertEqual(len(courses_list), USER_COURSES_COUNT)
-
-        # test that the time taken by getting courses through reversing django groups is lower then the time
-        # taken by traversing through all courses (if accessible courses are relatively small)
-        self.assertGreaterEqual(iteration_over_courses_time_1.elapsed, iteration_over_groups_time_1.elapsed)
-        self.assertGreaterEqual(iteration_over_courses_time_2.elapsed, iteration_over_groups_time_2.elapsed)
+        # the first listing checks that the new courses can be loaded
+        self._listed_locations(self.user)
+        with patch('xmodule.modulestore.mongo.base.MongoModuleStore._load_items') as load_items:
+            self.assertEqual(self._listed_locations(user), user_course_locations)
+            self.assertEqual(len(self._listed_locations(self.user)), 10)
+        self.assertFalse(load_items.called)
 
     def test_get_course_list_with_same_course_id(self):
         """
@@ -208,28 +164,17 @@ class TestCourseListing(ModuleStoreTestCase):
         course_location_caps = Location(['i4x', 'Org', 'COURSE', 'course', 'Run'])
         self._create_course_with_access_groups(course_location_caps, 'group_name_with_dots', self.user)
 
-        # get courses through iterating all courses
         courses_list = _accessible_courses_list(request)
         self.assertEqual(len(courses_list), 1)
 
-        # get courses by reversing group name formats
-        courses_list_by_groups = _accessible_courses_list_from_groups(request)
-        self.assertEqual(len(courses_list_by_groups), 1)
-        # check both course lists have same courses
-        self.assertEqual(courses_list, courses_list_by_groups)
-
         # now create another course with same course_id but different name case
         course_location_camel = Location(['i4x', 'Org', 'Course', 'course', 'Run'])
         self._create_course_with_access_groups(course_location_camel, 'group_name_with_dots', self.user)
 
-        # test that get courses through iterating all courses returns both courses
+        # test that both courses are listed
         courses_list = _accessible_courses_list(request)
         self.assertEqual(len(courses_list), 2)
 
-        # test that get courses by reversing group name formats returns only one course
-        courses_list_by_groups = _accessible_courses_list_from_groups(request)
-        self.assertEqual(len(courses_list_by_groups), 1)
-
         course_locator = loc_mapper().translate_location(course_location_caps.course_id, course_location_caps)
         outline_url = course_locator.url_reverse('course/')
         # now delete first course (course_location_caps) and check that it is no longer accessible
@@ -239,13 +184,9 @@ class TestCourseListing(ModuleStoreTestCase):
         group, __ = Group.objects.get_or_create(name=instructor_group_name)
         self.user.groups.add(group)
 
-        # test that get courses through iterating all courses now returns one course
+        # test that only the other course is listed now
         courses_list = _accessible_courses_list(request)
-        self.assertEqual(len(courses_list), 1)
-
-        # test that get courses by reversing group name formats also returns one course
-        courses_list_by_groups = _accessible_courses_list_from_groups(request)
-        self.assertEqual(len(courses_list_by_groups), 1)
+        self.assertEqual([course.location for course in courses_list], [course_location_camel])
 
         # now check that deleted course in not accessible
         response = self.client.get(outline_url, HTTP_ACCEPT='application/json')
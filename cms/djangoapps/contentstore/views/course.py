@@ -7,7 +7,6 @@ import string  # pylint: disable=W0402
 import re
 import bson
 
-from django.db.models import Q
 from django.utils.translation import ugettext as _
 from django.contrib.auth.decorators import login_required
 from django_future.csrf import ensure_csrf_cookie
@@ -19,7 +18,6 @@ from django.http import HttpResponseBadRequest, HttpResponseNotFound
 from util.json_request import JsonResponse
 from edxmako.shortcuts import render_to_response
 
-from xmodule.error_module import ErrorDescriptor
 from xmodule.modulestore.django import modulestore, loc_mapper
 from xmodule.contentstore.content import StaticContent
 from xmodule.tabs import PDFTextbookTabs
@@ -53,7 +51,7 @@ from xmodule.html_module import AboutDescriptor
 from xmodule.modulestore.locator import BlockUsageLocator, CourseLocator
 from course_creators.views import get_course_creator_status, add_user_with_status_unrequested
 from contentstore import utils
-from student.roles import CourseInstructorRole, CourseStaffRole, CourseCreatorRole, GlobalStaff
+from student.roles import CourseInstructorRole, CourseStaffRole, CourseCreatorRole, GlobalStaff, user_group_names
 from student import auth
 
 from microsite_configuration import microsite
@@ -165,64 +163,67 @@ def _xmodule_json(xmodule, course_id):
 
 def _accessible_courses_list(request):
     """
-    List all courses available to the logged in user by iterating through all the courses
-    """
-    courses = modulestore('direct').get_courses()
+    List the summaries of all courses available to the logged in user.
 
-    # filter out courses that we don't have access too
-    def course_filter(course):
-        """
-        Get courses to which this user has access
-        """
-        if GlobalStaff().has_user(request.user):
-            return course.location.course != 'templates'
+    The summaries of all the courses are read at once (see get_course_summaries) and joined
+    against the names of the user's groups, rather than checking the access to each course.
+    """
+    courses = [
+        course for course in modulestore('direct').get_course_summaries()
+        # pylint: disable=fixme
+        # TODO remove this condition when templates purged from db
+        if course.location.course != 'templates'
+    ]
+    if GlobalStaff().has_user(request.user):
+        return courses
+    if not request.user.is_active:
+        return []
+
+    role_course_ids = _user_role_course_ids(request.user)
+    accessible_locations = set()
+    matched_course_ids = set()
+    for course in courses:
+        # the course_ids a role group of the course can be named after (see CourseRole)
+        course_ids = set(
+            course_id.lower() for course_id in (
+                course.location.course_id,
+                # the package_id of the course, unless it has been mapped to another one
+                u'{0.org}.{0.course}.{0.name}'.format(course.location),
+                course.location.course,
+            )
+        )
+        if course_ids & role_course_ids:
+            accessible_locations.add(course.location)
+            matched_course_ids |= course_ids
+
+    # the others may be package_ids which courses have been mapped to (there are few of them,
+    # if any: typically those of the groups of deleted courses)
+    for course_id in role_course_ids - matched_course_ids:
+        if not course_id or '/' in course_id:
+            continue
+        try:
+            course_location = loc_mapper().translate_locator_to_location(
+                CourseLocator(package_id=course_id), get_course=True, lower_only=True
+            )
+        except ValueError:
+            continue
+        if course_location is not None:
+            accessible_locations.add(course_location)
 
-        return (has_course_access(request.user, course.location)
-                # pylint: disable=fixme
-                # TODO remove this condition when templates purged from db
-                and course.location.course != 'templates'
-                )
-    courses = filter(course_filter, courses)
-    return courses
+    return [course for course in courses if course.location in accessible_locations]
 
 
-# pylint: disable=invalid-name
-def _accessible_courses_list_from_groups(request):
+def _user_role_course_ids(user):
     """
-    List all courses available to the logged in user by reversing access group names
+    Return the set of the (lowercased) course_ids in the names of the user's
+    instructor and staff groups, which are loaded in a single query.
     """
-    courses_list = []
-    course_ids = set()
-
-    user_staff_group_names = request.user.groups.filter(
-        Q(name__startswith='instructor_') | Q(name__startswith='staff_')
-    ).values_list('name', flat=True)
-
-    # we can only get course_ids from role names with the new format (instructor_org/number/run or
-    # instructor_org.number.run but not instructor_number).
-    for user_staff_group_name in user_staff_group_names:
-        # to avoid duplication try to convert all course_id's to format with dots e.g. "edx.course.run"
-        if user_staff_group_name.startswith("instructor_"):
-            # strip starting text "instructor_"
-            course_id = user_staff_group_name[11:]
-        else:
-            # strip starting text "staff_"
-            course_id = user_staff_group_name[6:]
-
-        course_ids.add(course_id.replace('/', '.').lower())
-
-    for course_id in course_ids:
-        # get course_location with lowercase id
-        course_location = loc_mapper().translate_locator_to_location(
-            CourseLocator(package_id=course_id), get_course=True, lower_only=True
-        )
-        if course_location is None:
-            raise ItemNotFoundError(course_id)
-
-        course = modulestore('direct').get_course(course_location.course_id)
-        courses_list.append(course)
-
-    return courses_list
+    role_prefixes = tuple(u'{}_'.format(role.ROLE) for role in (CourseInstructorRole, CourseStaffRole))
+    return set(
+        group_name.split('_', 1)[1]
+        for group_name in user_group_names(user)
+        if group_name.startswith(role_prefixes)
+    )
 
 
 @login_required
@@ -230,27 +231,12 @@ def _accessible_courses_list_from_groups(request):
 def course_listing(request):
     """
     List all courses available to the logged in user
-    Try to get all courses by first reversing django groups and fallback to old method if it fails
-    Note: overhead of pymongo reads will increase if getting courses from django groups fails
     """
-    if GlobalStaff().has_user(request.user):
-        # user has global access so no need to get courses from django groups
-        courses = _accessible_courses_list(request)
-    else:
-        try:
-            courses = _accessible_courses_list_from_groups(request)
-        except ItemNotFoundError:
-            # user have some old groups or there was some error getting courses from django groups
-            # so fallback to iterating through all courses
-            courses = _accessible_courses_list(request)
-
-            # update location entry in "loc_mapper" for user courses (add keys 'lower_id' and 'lower_course_id')
-            for course in courses:
-                loc_mapper().create_map_entry(course.location)
+    courses = _accessible_courses_list(request)
 
     def format_course_for_view(course):
         """
-        return tuple of the data which the view requires for each course
+        return tuple of the data which the view requires for each course (a CourseSummary)
         """
         # published = false b/c studio manipulates draft versions not b/c the course isn't pub'd
         course_loc = loc_mapper().translate_location(
@@ -267,7 +253,7 @@ def course_listing(request):
         )
 
     return render_to_response('index.html', {
-        'courses': [format_course_for_view(c) for c in courses if not isinstance(c, ErrorDescriptor)],
+        'courses': [format_course_for_view(c) for c in courses],
         'user': request.user,
         'request_course_creator_url': reverse('contentstore.views.request_course_creator'),
         'course_creator_status': _get_course_creator_status(request.user),
@@ -7,7 +7,6 @@ import os
 import tarfile
 import shutil
 import re
-from tempfile import mkdtemp
 from path import path
 
 from django.conf import settings
@@ -25,7 +24,7 @@ from edxmako.shortcuts import render_to_response
 
 from xmodule.modulestore.xml_importer import import_from_xml
 from xmodule.contentstore.django import contentstore
-from xmodule.modulestore.xml_exporter import export_to_xml
+from xmodule.modulestore.xml_exporter import export_to_tar
 from xmodule.modulestore.django import modulestore, loc_mapper
 from xmodule.exceptions import SerializationError
 
@@ -223,7 +222,8 @@ def import_handler(request, tag=None, package_id=None, branch=None, version_guid
                         load_error_modules=False,
                         static_content_store=contentstore(),
                         target_location_namespace=old_location,
-                        draft_store=modulestore()
+                        draft_store=modulestore(),
+                        delete_removed_modules=True
                     )
 
                     new_location = course_items[0].location
@@ -319,14 +319,12 @@ def export_handler(request, tag=None, package_id=None, branch=None, version_guid
     if 'application/x-tgz' in requested_format:
         name = old_location.name
         export_file = NamedTemporaryFile(prefix=name + '.', suffix=".tar.gz")
-        root_dir = path(mkdtemp())
 
         try:
-            export_to_xml(modulestore('direct'), contentstore(), old_location, root_dir, name, modulestore())
-
             logging.debug('tar file being generated at {0}'.format(export_file.name))
-            with tarfile.open(name=export_file.name, mode='w:gz') as tar_file:
-                tar_file.add(root_dir / name, arcname=name)
+            export_to_tar(modulestore('direct'), contentstore(), old_location, export_file, name, modulestore())
+            export_file.flush()
+            export_file.seek(0)
         except SerializationError, e:
             logging.exception('There was an error exporting course {0}. {1}'.format(course_module.location, unicode(e)))
             unit = None
@@ -366,8 +364,6 @@ def export_handler(request, tag=None, package_id=None, branch=None, version_guid
                 'course_home_url': location.url_reverse("course"),
                 'export_url': export_url
             })
-        finally:
-            shutil.rmtree(root_dir / name)
 
         wrapper = FileWrapper(export_file)
         response = HttpResponse(wrapper, content_type='application/x-tgz')
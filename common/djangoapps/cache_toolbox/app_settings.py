@@ -6,3 +6,18 @@ CACHE_TOOLBOX_DEFAULT_TIMEOUT = getattr(
     'CACHE_TOOLBOX_DEFAULT_TIMEOUT',
     60 * 60 * 24 * 3,
 )
+
+# Directory of the local disk cache of assets too large for the cache
+# backend (see cache_toolbox.core.set_cached_large_content). None disables it.
+CACHE_TOOLBOX_CONTENT_DISK_CACHE_DIR = getattr(
+    settings,
+    'CACHE_TOOLBOX_CONTENT_DISK_CACHE_DIR',
+    None,
+)
+
+# Maximum total size, in bytes, of the files in the local disk cache of assets
+CACHE_TOOLBOX_CONTENT_DISK_CACHE_SIZE = getattr(
+    settings,
+    'CACHE_TOOLBOX_CONTENT_DISK_CACHE_SIZE',
+    10 * 1024 * 1024 * 1024,
+)
@@ -5,14 +5,28 @@ Core methods
 .. autofunction:: cache_toolbox.core.get_instance
 .. autofunction:: cache_toolbox.core.delete_instance
 .. autofunction:: cache_toolbox.core.instance_key
+.. autofunction:: cache_toolbox.core.set_cached_content
+.. autofunction:: cache_toolbox.core.set_cached_large_content
+.. autofunction:: cache_toolbox.core.get_cached_content
+.. autofunction:: cache_toolbox.core.del_cached_content
 
 """
 
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+
 from django.core.cache import cache
 from django.db import DEFAULT_DB_ALIAS
 
+from xmodule.contentstore.content import StaticContentFile
+
 from . import app_settings
 
+log = logging.getLogger(__name__)
+
 
 def get_instance(model, instance_or_pk, timeout=None, using=None):
     """
@@ -110,12 +124,141 @@ def instance_key(model, instance_or_pk):
 
 
 def set_cached_content(content):
+    """
+    Caches the (in memory) static `content` in the cache backend.
+    """
     cache.set(unicode(content.location).encode("utf-8"), content)
 
 
+def set_cached_large_content(content):
+    """
+    Caches static `content` too large for the cache backend: its data is
+    written to the local disk cache, keyed by location and md5, and its
+    metadata is put in the cache backend, so that other requests for it get
+    the data from the disk without going to the contentstore at all.
+
+    Returns the content, reading its data from the disk, or None if it
+    couldn't be cached.
+
+    The disk cache is bounded to ``settings.CACHE_TOOLBOX_CONTENT_DISK_CACHE_SIZE``
+    bytes, evicting the least recently used files.
+    """
+    directory = app_settings.CACHE_TOOLBOX_CONTENT_DISK_CACHE_DIR
+    max_size = app_settings.CACHE_TOOLBOX_CONTENT_DISK_CACHE_SIZE
+    if directory is None or content.content_digest is None or content.length > max_size:
+        return None
+
+    path = _content_disk_path(content.location, content.content_digest)
+    if not os.path.exists(path):
+        try:
+            _write_content_file(content, path)
+        except (IOError, OSError):
+            log.exception("Could not write %s to the disk cache", content.location)
+            return None
+        _evict_content_files(directory, max_size, keep=path)
+
+    disk_content = StaticContentFile.from_content(content, path)
+    set_cached_content(disk_content)
+    return disk_content
+
+
 def get_cached_content(location):
-    return cache.get(unicode(location).encode("utf-8"))
+    """
+    Returns the cached static content at `location`, or None.
+
+    Large content cached on the disk of another machine (or evicted from
+    this one) counts as not cached.
+    """
+    content = cache.get(unicode(location).encode("utf-8"))
+    if isinstance(content, StaticContentFile):
+        path = _content_disk_path(location, content.content_digest)
+        try:
+            # mark the file as recently used, for the eviction
+            os.utime(path, None)
+        except OSError:
+            return None
+        content.path = path
+    return content
 
 
 def del_cached_content(location):
+    """
+    Removes the static content at `location` from the cache backend and the
+    local disk cache.
+    """
     cache.delete(unicode(location).encode("utf-8"))
+    if app_settings.CACHE_TOOLBOX_CONTENT_DISK_CACHE_DIR is not None:
+        shutil.rmtree(os.path.dirname(_content_disk_path(location, '')), ignore_errors=True)
+
+
+def _content_disk_path(location, content_digest):
+    """
+    Returns the path of the disk cache file of the content at `location`
+    with md5 `content_digest`.
+    """
+    location_key = hashlib.sha1(unicode(location).encode("utf-8")).hexdigest()
+    return os.path.join(app_settings.CACHE_TOOLBOX_CONTENT_DISK_CACHE_DIR, location_key, content_digest)
+
+
+def _write_content_file(content, path):
+    """
+    Writes the data of the (streamed) `content` to `path`.
+
+    The data is written to a temporary file which is then renamed, so that
+    other processes never see a partial file.
+    """
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:
+            # created by another process in the meantime
+            if not os.path.isdir(directory):
+                raise
+
+    handle, temp_path = tempfile.mkstemp(dir=directory, prefix='.tmp')
+    try:
+        with os.fdopen(handle, 'wb') as data_file:
+            content.copy_to_file(data_file)
+        os.rename(temp_path, path)
+    except Exception:
+        os.remove(temp_path)
+        raise
+
+
+def _evict_content_files(directory, max_size, keep):
+    """
+    Removes the least recently used files of the disk cache in `directory`
+    until they take at most `max_size` bytes, except for the file `keep`.
+    """
+    files = []
+    total_size = 0
+    for dirpath, _, filenames in os.walk(directory):
+        for filename in filenames:
+            if filename.startswith('.tmp'):
+                # being written
+                continue
+            path = os.path.join(dirpath, filename)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+            total_size += stat.st_size
+
+    files.sort()
+    for _, size, path in files:
+        if total_size <= max_size:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total_size -= size
+        try:
+            # remove the directory of the location if it's now empty
+            os.rmdir(os.path.dirname(path))
+        except OSError:
+            pass
@@ -1,13 +1,28 @@
+import calendar
+import re
+
 from django.http import (HttpResponse, HttpResponseNotModified,
     HttpResponseForbidden)
+from django.utils.http import http_date, parse_http_date_safe
 from student.models import CourseEnrollment
 
 from xmodule.contentstore.django import contentstore
 from xmodule.contentstore.content import StaticContent, XASSET_LOCATION_TAG
 from xmodule.modulestore import InvalidLocationError
-from cache_toolbox.core import get_cached_content, set_cached_content
+from cache_toolbox.core import get_cached_content, set_cached_content, set_cached_large_content
 from xmodule.exceptions import NotFoundError
 
+# Assets smaller than this are read into memory and cached
+MAX_CACHED_CONTENT_SIZE = 1048576
+
+# How long browsers and proxies may use an unlocked asset without
+# revalidating it. Asset urls don't change when assets are replaced, so this
+# is kept short: revalidating is cheap thanks to ETag / Last-Modified.
+CACHE_MAX_AGE = 60 * 60
+
+# A single byte range: "first-last", "first-" or "-suffix_length"
+BYTE_RANGE_RE = re.compile(r'^\s*(\d*)\s*-\s*(\d*)\s*$')
+
 
 class StaticContentServer(object):
     def process_request(self, request):
@@ -32,19 +47,22 @@ class StaticContentServer(object):
                     response.status_code = 404
                     return response
 
-                # since we fetched it from DB, let's cache it going forward, but only if it's < 1MB
-                # this is because I haven't been able to find a means to stream data out of memcached
+                # since we fetched it from DB, let's cache it going forward: in the cache backend if it's < 1MB
+                # (there's no means to stream data out of memcached), on the local disk otherwise
                 if content.length is not None:
-                    if content.length < 1048576:
+                    if content.length < MAX_CACHED_CONTENT_SIZE:
                         # since we've queried as a stream, let's read in the stream into memory to set in cache
                         content = content.copy_to_in_mem()
                         set_cached_content(content)
+                    else:
+                        content = set_cached_large_content(content) or content
             else:
                 # NOP here, but we may wish to add a "cache-hit" counter in the future
                 pass
 
             # Check that user has access to content
-            if getattr(content, "locked", False):
+            locked = getattr(content, "locked", False)
+            if locked:
                 if not hasattr(request, "user") or not request.user.is_authenticated():
                     return HttpResponseForbidden('Unauthorized')
                 course_partial_id = "/".join([loc.org, loc.course])
@@ -52,18 +70,149 @@ class StaticContentServer(object):
                         request.user, course_partial_id):
                     return HttpResponseForbidden('Unauthorized')
 
-            # convert over the DB persistent last modified timestamp to a HTTP compatible
-            # timestamp, so we can simply compare the strings
-            last_modified_at_str = content.last_modified_at.strftime("%a, %d-%b-%Y %H:%M:%S GMT")
+            validators = self.validators(content)
 
-            # see if the client has cached this content, if so then compare the
-            # timestamps, if they are the same then just return a 304 (Not Modified)
-            if 'HTTP_IF_MODIFIED_SINCE' in request.META:
-                if_modified_since = request.META['HTTP_IF_MODIFIED_SINCE']
-                if if_modified_since == last_modified_at_str:
-                    return HttpResponseNotModified()
+            # see if the client has cached this content, if so then just
+            # return a 304 (Not Modified)
+            if self.is_not_modified(request, content, validators):
+                response = HttpResponseNotModified()
+                self.set_caching_headers(response, validators, locked)
+                return response
 
-            response = HttpResponse(content.stream_data(), content_type=content.content_type)
-            response['Last-Modified'] = last_modified_at_str
+            byte_range = None
+            if content.length is not None and self.range_applies(request, validators):
+                byte_range = self.parse_range(request.META['HTTP_RANGE'], content.length)
+
+            if byte_range == 'unsatisfiable':
+                response = HttpResponse(status=416)
+                response['Content-Range'] = 'bytes */{}'.format(content.length)
+            elif byte_range is not None:
+                first_byte, last_byte = byte_range
+                response = HttpResponse(
+                    content.stream_data_in_range(first_byte, last_byte),
+                    content_type=content.content_type,
+                    status=206,
+                )
+                response['Content-Range'] = 'bytes {}-{}/{}'.format(first_byte, last_byte, content.length)
+                response['Content-Length'] = str(last_byte - first_byte + 1)
+            else:
+                response = HttpResponse(content.stream_data(), content_type=content.content_type)
+                if content.length is not None:
+                    response['Content-Length'] = str(content.length)
+
+            if content.length is not None:
+                response['Accept-Ranges'] = 'bytes'
+            self.set_caching_headers(response, validators, locked)
 
             return response
+
+    @staticmethod
+    def validators(content):
+        """
+        Return the ETag and Last-Modified header values of `content`, either
+        of which can be None.
+        """
+        # in memory copies cached before content_digest existed don't have it
+        digest = getattr(content, 'content_digest', None)
+        etag = u'"{}"'.format(digest) if digest else None
+
+        last_modified = None
+        if content.last_modified_at is not None:
+            last_modified = http_date(calendar.timegm(content.last_modified_at.utctimetuple()))
+
+        return etag, last_modified
+
+    @staticmethod
+    def set_caching_headers(response, validators, locked):
+        """
+        Set the validators (ETag and Last-Modified) and the Cache-Control
+        header of `response`.
+        """
+        etag, last_modified = validators
+        if etag is not None:
+            response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = last_modified
+
+        if locked:
+            # only the user it was served to may keep a copy
+            response['Cache-Control'] = 'private, max-age=0, must-revalidate'
+        else:
+            response['Cache-Control'] = 'public, max-age={}'.format(CACHE_MAX_AGE)
+
+    @staticmethod
+    def is_not_modified(request, content, validators):
+        """
+        Whether the client's copy of `content` is current, according to the
+        conditional headers of `request`.
+
+        If-None-Match takes precedence over If-Modified-Since.
+        """
+        etag, _ = validators
+
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match is not None:
+            if if_none_match.strip() == '*':
+                return True
+            return etag is not None and etag in [tag.strip() for tag in if_none_match.split(',')]
+
+        if_modified_since = request.META.get('HTTP_IF_MODIFIED_SINCE')
+        if if_modified_since is not None and content.last_modified_at is not None:
+            since = parse_http_date_safe(if_modified_since)
+            if since is not None:
+                return calendar.timegm(content.last_modified_at.utctimetuple()) <= since
+
+        return False
+
+    @staticmethod
+    def range_applies(request, validators):
+        """
+        Whether the Range header of `request` (if any) should be honored,
+        that is whether the client's partial copy (identified by If-Range) is
+        current.
+        """
+        if 'HTTP_RANGE' not in request.META or request.method not in ('GET', 'HEAD'):
+            return False
+
+        if_range = request.META.get('HTTP_IF_RANGE')
+        if if_range is None:
+            return True
+        return if_range.strip() in [validator for validator in validators if validator is not None]
+
+    @staticmethod
+    def parse_range(header, length):
+        """
+        Parse the value of a Range header for content of `length` bytes.
+
+        Returns the (first_byte, last_byte) of the requested range,
+        'unsatisfiable' if it is out of the content, or None if the header
+        should be ignored (malformed, or asking for several ranges, which are
+        then served as the whole content).
+        """
+        unit, _, ranges = header.partition('=')
+        if unit.strip().lower() != 'bytes' or ',' in ranges:
+            return None
+
+        match = BYTE_RANGE_RE.match(ranges)
+        if match is None:
+            return None
+        first, last = match.groups()
+
+        if first:
+            first_byte = int(first)
+            last_byte = min(int(last), length - 1) if last else length - 1
+            if last and int(last) < first_byte:
+                return None
+        elif last:
+            # the last `last` bytes
+            suffix_length = int(last)
+            if suffix_length == 0:
+                return 'unsatisfiable'
+            first_byte = max(length - suffix_length, 0)
+            last_byte = length - 1
+        else:
+            return None
+
+        if first_byte >= length:
+            return 'unsatisfiable'
+        return first_byte, last_byte
@@ -3,6 +3,7 @@ Tests for StaticContentServer
 """
 import copy
 import logging
+import unittest
 from uuid import uuid4
 from path import path
 from pymongo import MongoClient
@@ -12,6 +13,7 @@ from django.conf import settings
 from django.test.client import Client
 from django.test.utils import override_settings
 
+from contentserver.middleware import StaticContentServer
 from student.models import CourseEnrollment
 
 from xmodule.contentstore.django import contentstore, _CONTENTSTORE
@@ -134,3 +136,76 @@ class ContentStoreToyCourseTest(ModuleStoreTestCase):
         resp = self.client.get(self.url_locked)
         self.assertEqual(resp.status_code, 200) # pylint: disable=E1103
 
+
+    def test_range_request(self):
+        """
+        Test that a range of an asset can be requested.
+        """
+        resp = self.client.get(self.url_unlocked, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(resp.status_code, 206)  # pylint: disable=E1103
+        self.assertEqual(resp['Content-Range'], 'bytes 10-19/577')
+        self.assertEqual(resp['Content-Length'], '10')
+        full = self.client.get(self.url_unlocked)
+        self.assertEqual(resp.content, full.content[10:20])  # pylint: disable=E1103
+
+        resp = self.client.get(self.url_unlocked, HTTP_RANGE='bytes=1000-')
+        self.assertEqual(resp.status_code, 416)  # pylint: disable=E1103
+        self.assertEqual(resp['Content-Range'], 'bytes */577')
+
+    def test_conditional_get(self):
+        """
+        Test that clients with a current copy of an asset get a 304.
+        """
+        resp = self.client.get(self.url_unlocked)
+        self.assertEqual(resp['Content-Length'], '577')
+        self.assertEqual(resp['Accept-Ranges'], 'bytes')
+        self.assertTrue(resp['Cache-Control'].startswith('public'))
+        etag = resp['ETag']
+        last_modified = resp['Last-Modified']
+
+        resp = self.client.get(self.url_unlocked, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 304)  # pylint: disable=E1103
+        self.assertEqual(resp['ETag'], etag)
+
+        resp = self.client.get(self.url_unlocked, HTTP_IF_NONE_MATCH='"outdated"')
+        self.assertEqual(resp.status_code, 200)  # pylint: disable=E1103
+
+        resp = self.client.get(self.url_unlocked, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(resp.status_code, 304)  # pylint: disable=E1103
+
+        # a stale partial copy gets the whole asset
+        resp = self.client.get(self.url_unlocked, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"outdated"')
+        self.assertEqual(resp.status_code, 200)  # pylint: disable=E1103
+
+    def test_locked_asset_not_publicly_cached(self):
+        """
+        Test that locked assets may only be cached by the user's browser.
+        """
+        self.client.login(username=self.staff_usr, password=self.staff_pwd)
+        resp = self.client.get(self.url_locked)
+        self.assertTrue(resp['Cache-Control'].startswith('private'))
+
+
+class ParseRangeTest(unittest.TestCase):
+    """
+    Tests of StaticContentServer.parse_range.
+    """
+    def test_ranges(self):
+        parse_range = StaticContentServer.parse_range
+        self.assertEqual(parse_range('bytes=0-99', 1000), (0, 99))
+        self.assertEqual(parse_range('bytes=900-', 1000), (900, 999))
+        self.assertEqual(parse_range('bytes=900-2000', 1000), (900, 999))
+        self.assertEqual(parse_range('bytes=-100', 1000), (900, 999))
+        self.assertEqual(parse_range('bytes=-2000', 1000), (0, 999))
+
+    def test_unsatisfiable_ranges(self):
+        parse_range = StaticContentServer.parse_range
+        self.assertEqual(parse_range('bytes=1000-', 1000), 'unsatisfiable')
+        self.assertEqual(parse_range('bytes=-0', 1000), 'unsatisfiable')
+
+    def test_ignored_ranges(self):
+        parse_range = StaticContentServer.parse_range
+        self.assertIsNone(parse_range('bytes=0-99,200-299', 1000))
+        self.assertIsNone(parse_range('bytes=99-0', 1000))
+        self.assertIsNone(parse_range('items=0-99', 1000))
+        self.assertIsNone(parse_range('bytes=-', 1000))
@@ -1,5 +1,8 @@
+import hashlib
 import logging
 import re
+import threading
+from collections import OrderedDict
 
 from staticfiles.storage import staticfiles_storage
 from staticfiles import finders
@@ -11,6 +14,64 @@ from xmodule.contentstore.content import StaticContent
 
 log = logging.getLogger(__name__)
 
+# Number of distinct fragments whose rewritten text is kept by
+# replace_static_urls, and the length of the longest fragments kept
+REPLACED_TEXT_CACHE_SIZE = 1000
+REPLACED_TEXT_MAX_LENGTH = 64 * 1024
+
+# Number of static paths whose staticfiles lookups are kept
+STATICFILES_LOOKUP_CACHE_SIZE = 10000
+
+
+class _LRUCache(object):
+    """
+    A bounded, thread-safe, least recently used cache.
+    """
+    def __init__(self, size):
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """
+        Return the value cached for `key`, or `default`.
+        """
+        with self._lock:
+            if key not in self._entries:
+                return default
+            value = self._entries.pop(key)
+            self._entries[key] = value
+            return value
+
+    def set(self, key, value):
+        """
+        Cache `value` for `key`.
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = value
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Drop all entries.
+        """
+        with self._lock:
+            self._entries.clear()
+
+
+_MISSING = object()
+
+# Compiled url patterns, by prefix
+_URL_REPLACE_PATTERNS = {}
+
+# The storage and module store are part of the keys of these caches, so
+# that they don't outlive them (e.g. in tests, which mock them)
+_STATICFILES_LOOKUPS = _LRUCache(STATICFILES_LOOKUP_CACHE_SIZE)
+_MODULESTORE_TYPES = _LRUCache(STATICFILES_LOOKUP_CACHE_SIZE)
+_REPLACED_TEXT = _LRUCache(REPLACED_TEXT_CACHE_SIZE)
+
 
 def _url_replace_regex(prefix):
     """
@@ -28,6 +89,43 @@ def _url_replace_regex(prefix):
         """.format(prefix=prefix)
 
 
+def _url_replace_pattern(prefix):
+    """
+    Return the compiled _url_replace_regex(prefix).
+    """
+    pattern = _URL_REPLACE_PATTERNS.get(prefix)
+    if pattern is None:
+        pattern = _URL_REPLACE_PATTERNS[prefix] = re.compile(_url_replace_regex(prefix))
+    return pattern
+
+
+def _staticfiles_lookup(method, path):
+    """
+    Return staticfiles_storage.`method`(path) ('exists' or 'url'), looked up
+    once per process. Errors are raised, and not cached.
+    """
+    key = (staticfiles_storage, method, path)
+    result = _STATICFILES_LOOKUPS.get(key, _MISSING)
+    if result is _MISSING:
+        result = getattr(staticfiles_storage, method)(path)
+        _STATICFILES_LOOKUPS.set(key, result)
+    return result
+
+
+def _modulestore_type(course_id):
+    """
+    Return modulestore().get_modulestore_type(course_id), looked up once per
+    process.
+    """
+    store = modulestore()
+    key = (store, course_id)
+    store_type = _MODULESTORE_TYPES.get(key)
+    if store_type is None:
+        store_type = store.get_modulestore_type(course_id)
+        _MODULESTORE_TYPES.set(key, store_type)
+    return store_type
+
+
 def try_staticfiles_lookup(path):
     """
     Try to lookup a path in staticfiles_storage.  If it fails, return
@@ -69,7 +167,7 @@ def replace_jump_to_id_urls(text, course_id, jump_to_id_base_url):
         rest = match.group('rest')
         return "".join([quote, jump_to_id_base_url + rest, quote])
 
-    return re.sub(_url_replace_regex('/jump_to_id/'), replace_jump_to_id_url, text)
+    return _url_replace_pattern('/jump_to_id/').sub(replace_jump_to_id_url, text)
 
 
 def replace_course_urls(text, course_id):
@@ -87,7 +185,7 @@ def replace_course_urls(text, course_id):
         rest = match.group('rest')
         return "".join([quote, '/courses/' + course_id + '/', rest, quote])
 
-    return re.sub(_url_replace_regex('/course/'), replace_course_url, text)
+    return _url_replace_pattern('/course/').sub(replace_course_url, text)
 
 
 def replace_static_urls(text, data_directory, course_id=None, static_asset_path=''):
@@ -101,6 +199,28 @@ def replace_static_urls(text, data_directory, course_id=None, static_asset_path=
     data_directory: The directory in which course data is stored
     course_id: The course identifier used to distinguish static content for this course in studio
     static_asset_path: Path for static assets, which overrides data_directory and course_namespace, if nonempty
+
+    The rewritten text of the last REPLACED_TEXT_CACHE_SIZE distinct fragments is kept (except in DEBUG,
+    where static files come and go), as the same fragments are rendered over and over.
+    """
+    if settings.DEBUG or len(text) > REPLACED_TEXT_MAX_LENGTH:
+        return _replace_static_urls(text, data_directory, course_id, static_asset_path)
+
+    text_hash = hashlib.md5(text.encode('utf-8') if isinstance(text, unicode) else text).hexdigest()
+    key = (
+        text_hash, type(text), data_directory, course_id, static_asset_path,
+        settings.STATIC_URL, staticfiles_storage, modulestore() if course_id else None,
+    )
+    replaced = _REPLACED_TEXT.get(key)
+    if replaced is None:
+        replaced = _replace_static_urls(text, data_directory, course_id, static_asset_path)
+        _REPLACED_TEXT.set(key, replaced)
+    return replaced
+
+
+def _replace_static_urls(text, data_directory, course_id, static_asset_path):
+    """
+    Implementation of replace_static_urls, without the cache.
     """
 
     def replace_static_url(match):
@@ -117,19 +237,19 @@ def replace_static_urls(text, data_directory, course_id=None, static_asset_path=
         if settings.DEBUG and finders.find(rest, True):
             return original
         # if we're running with a MongoBacked store course_namespace is not None, then use studio style urls
-        elif (not static_asset_path) and course_id and modulestore().get_modulestore_type(course_id) != XML_MODULESTORE_TYPE:
+        elif (not static_asset_path) and course_id and _modulestore_type(course_id) != XML_MODULESTORE_TYPE:
             # first look in the static file pipeline and see if we are trying to reference
             # a piece of static content which is in the edx-platform repo (e.g. JS associated with an xmodule)
 
             exists_in_staticfiles_storage = False
             try:
-                exists_in_staticfiles_storage = staticfiles_storage.exists(rest)
+                exists_in_staticfiles_storage = _staticfiles_lookup('exists', rest)
             except Exception as err:
                 log.warning("staticfiles_storage couldn't find path {0}: {1}".format(
                     rest, str(err)))
 
             if exists_in_staticfiles_storage:
-                url = staticfiles_storage.url(rest)
+                url = _staticfiles_lookup('url', rest)
             else:
                 # if not, then assume it's courseware specific content and then look in the
                 # Mongo-backed database
@@ -139,10 +259,10 @@ def replace_static_urls(text, data_directory, course_id=None, static_asset_path=
             course_path = "/".join((static_asset_path or data_directory, rest))
 
             try:
-                if staticfiles_storage.exists(rest):
-                    url = staticfiles_storage.url(rest)
+                if _staticfiles_lookup('exists', rest):
+                    url = _staticfiles_lookup('url', rest)
                 else:
-                    url = staticfiles_storage.url(course_path)
+                    url = _staticfiles_lookup('url', course_path)
             # And if that fails, assume that it's course content, and add manually data directory
             except Exception as err:
                 log.warning("staticfiles_storage couldn't find path {0}: {1}".format(
@@ -151,11 +271,7 @@ def replace_static_urls(text, data_directory, course_id=None, static_asset_path=
 
         return "".join([quote, url, quote])
 
-    return re.sub(
-        _url_replace_regex(u'(?:{static_url}|/static/)(?!{data_dir})'.format(
-            static_url=settings.STATIC_URL,
-            data_dir=static_asset_path or data_directory
-        )),
-        replace_static_url,
-        text
-    )
+    return _url_replace_pattern(u'(?:{static_url}|/static/)(?!{data_dir})'.format(
+        static_url=settings.STATIC_URL,
+        data_dir=static_asset_path or data_directory
+    )).sub(replace_static_url, text)
@@ -122,3 +122,25 @@ def test_regex():
     for s in no:
         print 'Should not match: {0!r}'.format(s)
         assert_false(re.match(regex, s))
+
+
+@patch('static_replace.staticfiles_storage')
+@patch('static_replace.modulestore')
+def test_replacements_cached(mock_modulestore, mock_storage):
+    """
+    Make sure rewriting the same text, or the same urls, doesn't look them up again
+    """
+    mock_storage.exists.return_value = True
+    mock_storage.url.return_value = '/static/file.1234.png'
+    mock_modulestore.return_value = Mock(MongoModuleStore)
+
+    for _ in range(2):
+        assert_equals('"/static/file.1234.png"', replace_static_urls(STATIC_SOURCE, DATA_DIRECTORY, COURSE_ID))
+    assert_equals(
+        '<img src="/static/file.1234.png"/>',
+        replace_static_urls('<img src="/static/file.png"/>', DATA_DIRECTORY, COURSE_ID)
+    )
+
+    mock_storage.exists.assert_called_once_with('file.png')
+    mock_storage.url.assert_called_once_with('file.png')
+    mock_modulestore.return_value.get_modulestore_type.assert_called_once_with(COURSE_ID)
@@ -78,6 +78,20 @@ class GlobalStaff(AccessRole):
         raise Exception("This operation is un-indexed, and shouldn't be used")
 
 
+def user_group_names(user):
+    """
+    Return the set of the (lowercased) names of the groups of the supplied
+    django user.
+
+    The names are loaded in one query, and cached on the user until its roles
+    are changed through a GroupBasedRole.
+    """
+    # pylint: disable=protected-access
+    if not hasattr(user, '_groups'):
+        user._groups = set(name.lower() for name in user.groups.values_list('name', flat=True))
+    return user._groups
+
+
 class GroupBasedRole(AccessRole):
     """
     A role based on membership to any of a set of groups.
@@ -101,11 +115,7 @@ class GroupBasedRole(AccessRole):
         if not (user.is_authenticated and user.is_active):
             return False
 
-        # pylint: disable=protected-access
-        if not hasattr(user, '_groups'):
-            user._groups = set(name.lower() for name in user.groups.values_list('name', flat=True))
-
-        return len(user._groups.intersection(self._group_names)) > 0
+        return len(user_group_names(user).intersection(self._group_names)) > 0
 
     def add_users(self, *users):
         """
@@ -26,3 +26,14 @@ class BaseBackend(object):
     def send(self, event):
         """Send event to tracker."""
         pass
+
+    def send_many(self, events):
+        """
+        Send a batch of events to tracker.
+
+        Backends that can store several events in one round trip should
+        override this; by default every event is sent on its own.
+
+        """
+        for event in events:
+            self.send(event)
@@ -0,0 +1,241 @@
+"""
+Event tracker backend wrapper that sends events in batches from a
+background thread.
+
+A backend is buffered by adding a `BUFFER` entry to its configuration::
+
+  TRACKING_BACKENDS = {
+      'mongo': {
+          'ENGINE': 'track.backends.mongodb.MongoBackend',
+          'OPTIONS': {...},
+          'BUFFER': {
+              'batch_size': 100,
+              'flush_interval': 1.0,
+              'max_queue_size': 10000,
+              'overflow': 'drop',
+          }
+      }
+  }
+
+"""
+
+from __future__ import absolute_import
+
+import atexit
+import logging
+import os
+import threading
+import time
+from Queue import Queue, Empty, Full
+
+from dogapi import dog_stats_api
+
+from track.backends import BaseBackend
+
+
+log = logging.getLogger(__name__)
+
+
+OVERFLOW_DROP = 'drop'
+OVERFLOW_BLOCK = 'block'
+
+
+class _FlushRequest(object):
+    """Queue marker asking the worker to send everything queued before it."""
+    def __init__(self):
+        self.done = threading.Event()
+
+
+class BufferedBackend(BaseBackend):
+    """
+    Queue events in memory and send them to the wrapped backend in
+    batches, using its `send_many`.
+
+    Events are sent once `batch_size` of them are queued, or
+    `flush_interval` seconds after the first of them was queued,
+    whichever comes first. When the queue holds `max_queue_size` events,
+    new events are dropped (`overflow='drop'`) or the sender waits up
+    to `block_timeout` seconds for room before dropping them
+    (`overflow='block'`). Queued events are flushed when the process
+    exits.
+
+    """
+
+    def __init__(self, backend, name='buffered', batch_size=100, flush_interval=1.0,
+                 max_queue_size=10000, overflow=OVERFLOW_DROP, block_timeout=0.1,
+                 shutdown_timeout=5.0, **kwargs):
+        """
+        :Parameters:
+
+          - `backend`: the backend instance events are sent to
+          - `name`: name used to tag the exported metrics
+          - `batch_size`: maximum number of events sent at once
+          - `flush_interval`: maximum seconds an event waits in the queue
+          - `max_queue_size`: maximum number of queued events
+          - `overflow`: 'drop' or 'block', what to do when the queue is full
+          - `block_timeout`: seconds to wait for room with `overflow='block'`
+          - `shutdown_timeout`: seconds to wait for the flush at exit
+
+        """
+        super(BufferedBackend, self).__init__(**kwargs)
+
+        if overflow not in (OVERFLOW_DROP, OVERFLOW_BLOCK):
+            raise ValueError('Invalid overflow policy {0}'.format(overflow))
+
+        self.backend = backend
+        self.name = name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue_size = max_queue_size
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.shutdown_timeout = shutdown_timeout
+
+        self.tags = ['backend:{0}'.format(name)]
+        self.queue = Queue(max_queue_size)
+
+        self._worker = None
+        self._worker_pid = None
+        self._worker_lock = threading.Lock()
+
+        atexit.register(self.flush, self.shutdown_timeout)
+
+    def send(self, event):
+        """Queue the event, dropping it if the queue is full."""
+        self._ensure_worker()
+
+        try:
+            if self.overflow == OVERFLOW_BLOCK:
+                self.queue.put(event, timeout=self.block_timeout)
+            else:
+                self.queue.put_nowait(event)
+        except Full:
+            dog_stats_api.increment('track.buffer.dropped', tags=self.tags)
+            log.warning('Tracking buffer %s is full, dropping event', self.name)
+
+    def flush(self, timeout=None):
+        """
+        Send all queued events to the wrapped backend.
+
+        Returns False if they could not all be sent within `timeout`
+        seconds.
+
+        """
+        if not self._worker_alive():
+            self._send_batches(self._drain())
+            return True
+
+        request = _FlushRequest()
+        try:
+            self.queue.put(request, timeout=timeout)
+        except Full:
+            return False
+        return request.done.wait(timeout)
+
+    def _worker_alive(self):
+        """Whether a worker thread is running in this process."""
+        return (
+            self._worker is not None and
+            self._worker_pid == os.getpid() and
+            self._worker.is_alive()
+        )
+
+    def _ensure_worker(self):
+        """
+        Start the worker thread, in this process, if it isn't running.
+
+        Threads do not survive a fork, so a process forked after the
+        backend was created starts a worker of its own.
+
+        """
+        if self._worker_alive():
+            return
+
+        with self._worker_lock:
+            if self._worker_alive():
+                return
+            if self._worker_pid != os.getpid():
+                # Events queued by the parent process belong to it
+                self.queue = Queue(self.max_queue_size)
+            self._worker = threading.Thread(
+                target=self._run,
+                name='track-buffer-{0}'.format(self.name)
+            )
+            self._worker.daemon = True
+            self._worker_pid = os.getpid()
+            self._worker.start()
+
+    def _run(self):
+        """Worker thread loop."""
+        while True:
+            batch, requests = self._next_batch()
+            self._send_batches([batch])
+            for request in requests:
+                request.done.set()
+
+    def _next_batch(self):
+        """
+        Wait for the next batch of events.
+
+        Returns the events and the flush requests that were queued among
+        them.
+
+        """
+        batch = []
+        requests = []
+        deadline = None
+
+        while len(batch) < self.batch_size:
+            if deadline is None:
+                timeout = None
+            else:
+                timeout = deadline - time.time()
+                if timeout <= 0:
+                    break
+
+            try:
+                item = self.queue.get(timeout=timeout)
+            except Empty:
+                break
+
+            if isinstance(item, _FlushRequest):
+                requests.append(item)
+                break
+
+            batch.append(item)
+            if deadline is None:
+                deadline = time.time() + self.flush_interval
+
+        return batch, requests
+
+    def _drain(self):
+        """Take all queued events off the queue, in batches."""
+        batches = [[]]
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except Empty:
+                break
+            if isinstance(item, _FlushRequest):
+                item.done.set()
+                continue
+            if len(batches[-1]) >= self.batch_size:
+                batches.append([])
+            batches[-1].append(item)
+        return batches
+
+    def _send_batches(self, batches):
+        """Send batches of events to the wrapped backend."""
+        dog_stats_api.gauge('track.buffer.queue_depth', self.queue.qsize(), tags=self.tags)
+
+        for batch in batches:
+            if not batch:
+                continue
+            try:
+                with dog_stats_api.timer('track.buffer.send_many', tags=self.tags):
+                    self.backend.send_many(batch)
+            except Exception:  # pylint: disable=broad-except
+                dog_stats_api.increment('track.buffer.failed', len(batch), tags=self.tags)
+                log.exception('Error sending %d buffered events to %s', len(batch), self.name)
+            else:
+                dog_stats_api.increment('track.buffer.sent', len(batch), tags=self.tags)
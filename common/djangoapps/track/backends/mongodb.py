@@ -95,3 +95,13 @@ class MongoBackend(BaseBackend):
             # during the next event.
             msg = 'Error inserting to MongoDB event tracker backend'
             log.exception(msg)
+
+    def send_many(self, events):
+        """Insert a batch of events in to the Mongo collection at once"""
+        if not events:
+            return
+        try:
+            self.collection.insert(events, manipulate=False, continue_on_error=True)
+        except PyMongoError:
+            msg = 'Error inserting batch of {0} events to MongoDB event tracker backend'
+            log.exception(msg.format(len(events)))
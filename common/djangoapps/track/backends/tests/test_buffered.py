@@ -0,0 +1,85 @@
+from __future__ import absolute_import
+
+import threading
+
+from mock import Mock, patch
+
+from django.test import TestCase
+
+from track.backends import BaseBackend
+from track.backends.buffered import BufferedBackend
+
+
+class RecordingBackend(BaseBackend):
+    """Backend remembering the batches it was sent."""
+    def __init__(self, **kwargs):
+        super(RecordingBackend, self).__init__(**kwargs)
+        self.batches = []
+
+    def send(self, event):
+        self.batches.append([event])
+
+    def send_many(self, events):
+        self.batches.append(list(events))
+
+
+class TestBufferedBackend(TestCase):
+    def setUp(self):
+        self.stats_patcher = patch('track.backends.buffered.dog_stats_api')
+        self.addCleanup(self.stats_patcher.stop)
+        self.dog_stats_api = self.stats_patcher.start()
+
+        self.atexit_patcher = patch('track.backends.buffered.atexit')
+        self.addCleanup(self.atexit_patcher.stop)
+        self.atexit_patcher.start()
+
+        self.backend = RecordingBackend()
+
+    def test_events_sent_in_batches(self):
+        buffered = BufferedBackend(self.backend, batch_size=3, flush_interval=60)
+
+        events = [{'test': i} for i in xrange(7)]
+        for event in events:
+            buffered.send(event)
+
+        self.assertTrue(buffered.flush(timeout=5))
+
+        sent = [event for batch in self.backend.batches for event in batch]
+        self.assertEqual(sent, events)
+        self.assertTrue(all(len(batch) <= 3 for batch in self.backend.batches))
+        self.assertEqual(self.backend.batches[0], events[:3])
+
+    def test_events_sent_after_flush_interval(self):
+        sent = threading.Event()
+        self.backend.send_many = Mock(side_effect=lambda events: sent.set())
+        buffered = BufferedBackend(self.backend, batch_size=100, flush_interval=0.01)
+
+        buffered.send({'test': 1})
+
+        self.assertTrue(sent.wait(5))
+        self.backend.send_many.assert_called_once_with([{'test': 1}])
+
+    def test_full_queue_drops_events(self):
+        with patch.object(BufferedBackend, '_ensure_worker'):
+            buffered = BufferedBackend(self.backend, max_queue_size=2)
+            for i in xrange(3):
+                buffered.send({'test': i})
+
+        self.dog_stats_api.increment.assert_called_once_with('track.buffer.dropped', tags=['backend:buffered'])
+
+        # Without a worker thread the queued events are sent by the caller
+        self.assertTrue(buffered.flush())
+        self.assertEqual(self.backend.batches, [[{'test': 0}, {'test': 1}]])
+
+    def test_backend_errors_are_contained(self):
+        self.backend.send_many = Mock(side_effect=Exception)
+        buffered = BufferedBackend(self.backend)
+
+        buffered.send({'test': 1})
+
+        self.assertTrue(buffered.flush(timeout=5))
+        self.dog_stats_api.increment.assert_called_with('track.buffer.failed', 1, tags=['backend:buffered'])
+
+    def test_invalid_overflow_policy(self):
+        with self.assertRaises(ValueError):
+            BufferedBackend(self.backend, overflow='explode')
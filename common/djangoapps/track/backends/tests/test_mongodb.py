@@ -38,3 +38,17 @@ class TestMongoBackend(TestCase):
 
         self.assertEqual(events[0], first_argument(calls[0]))
         self.assertEqual(events[1], first_argument(calls[1]))
+
+    def test_mongo_backend_send_many(self):
+        events = [{'test': 1}, {'test': 2}]
+
+        self.backend.send_many(events)
+
+        # The events are inserted with a single call
+
+        calls = self.backend.collection.insert.mock_calls
+
+        self.assertEqual(len(calls), 1)
+
+        _, args, _ = calls[0]
+        self.assertEqual(events, args[0])
@@ -4,6 +4,7 @@ from django.test.utils import override_settings
 
 import track.tracker as tracker
 from track.backends import BaseBackend
+from track.backends.buffered import BufferedBackend
 
 
 SIMPLE_SETTINGS = {
@@ -24,6 +25,15 @@ MULTI_SETTINGS = {
     }
 }
 
+BUFFERED_SETTINGS = {
+    'default': {
+        'ENGINE': 'track.tests.test_tracker.DummyBackend',
+        'BUFFER': {
+            'batch_size': 5,
+        }
+    }
+}
+
 
 class TestTrackerInstantiation(TestCase):
     """Test that a helper function can instantiate backends from their name."""
@@ -97,6 +107,22 @@ class TestTrackerDjangoInstantiation(TestCase):
 
         self.assertEqual(len(backends), 1)
 
+    @override_settings(TRACKING_BACKENDS=BUFFERED_SETTINGS)
+    def test_django_buffered_settings(self):
+        """Test if a backend can be wrapped in a buffer."""
+
+        backend = self._reload_backends()['default']
+
+        self.assertIsInstance(backend, BufferedBackend)
+        self.assertIsInstance(backend.backend, DummyBackend)
+        self.assertEqual(backend.batch_size, 5)
+
+        for _ in xrange(12):
+            tracker.send({})
+
+        self.assertTrue(backend.flush(timeout=5))
+        self.assertEqual(backend.backend.count, 12)
+
     def _reload_backends(self):
         # pylint: disable=protected-access
 
@@ -16,6 +16,22 @@ below::
       }
   }
 
+A backend can be made to send its events in batches from a background
+thread, instead of during the request, by adding a `BUFFER` entry with
+the options of `track.backends.buffered.BufferedBackend` (an empty dict
+uses the defaults)::
+
+  TRACKING_BACKENDS = {
+      'tracker_name': {
+          'ENGINE': ...,
+          'OPTIONS': ...,
+          'BUFFER': {
+              'batch_size': 100,
+              'flush_interval': 1.0,
+          }
+      }
+  }
+
 """
 
 import inspect
@@ -26,6 +42,7 @@ from dogapi import dog_stats_api
 from django.conf import settings
 
 from track.backends import BaseBackend
+from track.backends.buffered import BufferedBackend
 
 
 __all__ = ['send']
@@ -49,7 +66,10 @@ def _initialize_backends_from_django_settings():
         if values:
             engine = values['ENGINE']
             options = values.get('OPTIONS', {})
-            backends[name] = _instantiate_backend_from_name(engine, options)
+            backend = _instantiate_backend_from_name(engine, options)
+            if values.get('BUFFER') is not None:
+                backend = BufferedBackend(backend, name=name, **values['BUFFER'])
+            backends[name] = backend
 
 
 def _instantiate_backend_from_name(name, options):
@@ -7,6 +7,8 @@ Uses pyparsing to parse. Main function as of now is evaluator().
 import math
 import operator
 import numbers
+import threading
+from collections import OrderedDict
 import numpy
 import scipy.constants
 import functions
@@ -258,6 +260,129 @@ def evaluator(variables, functions, math_expr, case_sensitive=False):
     return math_interpreter.reduce_tree(evaluate_actions)
 
 
+PARSE_CACHE_SIZE = 1024
+
+_GRAMMAR = None
+_PARSE_CACHE = OrderedDict()
+_PARSE_CACHE_LOCK = threading.Lock()
+
+
+def _build_grammar():
+    """
+    Build the pyparsing grammar for algebraic expressions.
+
+    Parsing a string with it gives a `pyparsing.ParseResult` with proper
+    groupings to reflect parenthesis and order of operations. All operators
+    are left in the tree and strings of numbers are not parsed into their
+    float versions.
+    """
+    # 0.33 or 7 or .34 or 16.
+    number_part = Word(nums)
+    inner_number = (number_part + Optional("." + Optional(number_part))) | ("." + number_part)
+    # pyparsing allows spaces between tokens--`Combine` prevents that.
+    inner_number = Combine(inner_number)
+
+    # SI suffixes and percent.
+    number_suffix = MatchFirst(Literal(k) for k in SUFFIXES.keys())
+
+    # 0.33k or 17
+    plus_minus = Literal('+') | Literal('-')
+    number = Group(
+        Optional(plus_minus) +
+        inner_number +
+        Optional(CaselessLiteral("E") + Optional(plus_minus) + number_part) +
+        Optional(number_suffix)
+    )
+    number = number("number")
+
+    # Predefine recursive variables.
+    expr = Forward()
+
+    # Handle variables passed in. They must start with letters/underscores
+    # and may contain numbers afterward.
+    inner_varname = Word(alphas + "_", alphanums + "_")
+    varname = Group(inner_varname)("variable")
+
+    # Same thing for functions.
+    function = Group(inner_varname + Suppress("(") + expr + Suppress(")"))("function")
+
+    atom = number | function | varname | "(" + expr + ")"
+    atom = Group(atom)("atom")
+
+    # Do the following in the correct order to preserve order of operation.
+    pow_term = atom + ZeroOrMore("^" + atom)
+    pow_term = Group(pow_term)("power")
+
+    par_term = pow_term + ZeroOrMore('||' + pow_term)  # 5k || 4k
+    par_term = Group(par_term)("parallel")
+
+    prod_term = par_term + ZeroOrMore((Literal('*') | Literal('/')) + par_term)  # 7 * 5 / 4
+    prod_term = Group(prod_term)("product")
+
+    sum_term = Optional(plus_minus) + prod_term + ZeroOrMore(plus_minus + prod_term)  # -5 + 4 - 3
+    sum_term = Group(sum_term)("sum")
+
+    # Finish the recursion.
+    expr << sum_term  # pylint: disable=W0104
+    return expr + stringEnd
+
+
+def _get_grammar():
+    """
+    Return the grammar, building it the first time it is needed.
+    """
+    global _GRAMMAR  # pylint: disable=global-statement
+    if _GRAMMAR is None:
+        _GRAMMAR = _build_grammar()
+    return _GRAMMAR
+
+
+def _names_used(tree):
+    """
+    Return the sets of variable and function names used in a parse tree.
+    """
+    variables_used = set()
+    functions_used = set()
+    nodes = [tree]
+    while nodes:
+        node = nodes.pop()
+        if not isinstance(node, ParseResults):
+            continue
+        node_name = node.getName()
+        if node_name == 'variable':
+            variables_used.add(node[0])
+        elif node_name == 'function':
+            functions_used.add(node[0])
+        nodes.extend(node)
+    return frozenset(variables_used), frozenset(functions_used)
+
+
+def parse_algebra(math_expr):
+    """
+    Parse `math_expr` and return (tree, variables used, functions used).
+
+    The results for the last `PARSE_CACHE_SIZE` distinct expressions are
+    kept, so evaluating the same formula over and over (e.g. for every
+    sample of a FormulaResponse) only parses it once. The returned tree is
+    shared, and must not be modified.
+    """
+    with _PARSE_CACHE_LOCK:
+        parsed = _PARSE_CACHE.pop(math_expr, None)
+        if parsed is not None:
+            _PARSE_CACHE[math_expr] = parsed
+            return parsed
+
+    # Parse errors propagate, and are not cached.
+    tree = _get_grammar().parseString(math_expr)[0]
+    parsed = (tree,) + _names_used(tree)
+
+    with _PARSE_CACHE_LOCK:
+        _PARSE_CACHE[math_expr] = parsed
+        while len(_PARSE_CACHE) > PARSE_CACHE_SIZE:
+            _PARSE_CACHE.popitem(last=False)
+    return parsed
+
+
 class ParseAugmenter(object):
     """
     Holds the data for a particular parse.
@@ -278,23 +403,6 @@ class ParseAugmenter(object):
         self.variables_used = set()
         self.functions_used = set()
 
-        def vpa(tokens):
-            """
-            When a variable is recognized, store it in `variables_used`.
-            """
-            varname = tokens[0][0]
-            self.variables_used.add(varname)
-
-        def fpa(tokens):
-            """
-            When a function is recognized, store it in `functions_used`.
-            """
-            varname = tokens[0][0]
-            self.functions_used.add(varname)
-
-        self.variable_parse_action = vpa
-        self.function_parse_action = fpa
-
     def parse_algebra(self):
         """
         Parse an algebraic expression into a tree.
@@ -302,62 +410,17 @@ class ParseAugmenter(object):
         Store a `pyparsing.ParseResult` in `self.tree` with proper groupings to
         reflect parenthesis and order of operations. Leave all operators in the
         tree and do not parse any strings of numbers into their float versions.
+        The tree may be shared with other parses of the same expression; see
+        the module-level `parse_algebra`.
 
         Adding the groups and result names makes the `repr()` of the result
         really gross. For debugging, use something like
           print OBJ.tree.asXML()
         """
-        # 0.33 or 7 or .34 or 16.
-        number_part = Word(nums)
-        inner_number = (number_part + Optional("." + Optional(number_part))) | ("." + number_part)
-        # pyparsing allows spaces between tokens--`Combine` prevents that.
-        inner_number = Combine(inner_number)
-
-        # SI suffixes and percent.
-        number_suffix = MatchFirst(Literal(k) for k in SUFFIXES.keys())
-
-        # 0.33k or 17
-        plus_minus = Literal('+') | Literal('-')
-        number = Group(
-            Optional(plus_minus) +
-            inner_number +
-            Optional(CaselessLiteral("E") + Optional(plus_minus) + number_part) +
-            Optional(number_suffix)
-        )
-        number = number("number")
-
-        # Predefine recursive variables.
-        expr = Forward()
-
-        # Handle variables passed in. They must start with letters/underscores
-        # and may contain numbers afterward.
-        inner_varname = Word(alphas + "_", alphanums + "_")
-        varname = Group(inner_varname)("variable")
-        varname.setParseAction(self.variable_parse_action)
-
-        # Same thing for functions.
-        function = Group(inner_varname + Suppress("(") + expr + Suppress(")"))("function")
-        function.setParseAction(self.function_parse_action)
-
-        atom = number | function | varname | "(" + expr + ")"
-        atom = Group(atom)("atom")
-
-        # Do the following in the correct order to preserve order of operation.
-        pow_term = atom + ZeroOrMore("^" + atom)
-        pow_term = Group(pow_term)("power")
-
-        par_term = pow_term + ZeroOrMore('||' + pow_term)  # 5k || 4k
-        par_term = Group(par_term)("parallel")
-
-        prod_term = par_term + ZeroOrMore((Literal('*') | Literal('/')) + par_term)  # 7 * 5 / 4
-        prod_term = Group(prod_term)("product")
-
-        sum_term = Optional(plus_minus) + prod_term + ZeroOrMore(plus_minus + prod_term)  # -5 + 4 - 3
-        sum_term = Group(sum_term)("sum")
-
-        # Finish the recursion.
-        expr << sum_term  # pylint: disable=W0104
-        self.tree = (expr + stringEnd).parseString(self.math_expr)[0]
+        tree, variables_used, functions_used = parse_algebra(self.math_expr)
+        self.tree = tree
+        self.variables_used = set(variables_used)
+        self.functions_used = set(functions_used)
 
     def reduce_tree(self, handle_actions, terminal_converter=None):
         """
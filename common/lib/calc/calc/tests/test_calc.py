@@ -5,6 +5,7 @@ Unit tests for calc.py
 import unittest
 import numpy
 import calc
+from mock import patch
 from pyparsing import ParseException
 
 # numpy's default behavior when it evaluates a function outside its domain
@@ -558,3 +559,30 @@ class EvaluatorTest(unittest.TestCase):
             calc.evaluator({'r1': 5}, {}, "r1+r2")
         with self.assertRaisesRegexp(calc.UndefinedVariable, 'r1 r3'):
             calc.evaluator(variables, {}, "r1*r3", case_sensitive=True)
+
+    def test_parse_cached(self):
+        """
+        Check that evaluating the same expression repeatedly parses it once
+        """
+        grammar = calc.calc._get_grammar()  # pylint: disable=protected-access
+        with patch.object(grammar, 'parseString', wraps=grammar.parseString) as parse:
+            for x_value in range(5):
+                self.assertEqual(
+                    calc.evaluator({'x': x_value, 'y': 1}, {}, 'x^2 + 17*y'),
+                    x_value ** 2 + 17
+                )
+        self.assertEqual(parse.call_count, 1)
+
+        # The cached parse still catches undefined variables
+        with self.assertRaisesRegexp(calc.UndefinedVariable, 'y'):
+            calc.evaluator({'x': 1}, {}, 'x^2 + 17*y')
+
+    def test_parse_cache_size(self):
+        """
+        Check that only the last `PARSE_CACHE_SIZE` expressions are kept
+        """
+        with patch('calc.calc.PARSE_CACHE_SIZE', 2):
+            for expression in ('1+1', '2+2', '3+3'):
+                calc.evaluator({}, {}, expression)
+            cached = calc.calc._PARSE_CACHE.keys()  # pylint: disable=protected-access
+        self.assertEqual(cached, ['2+2', '3+3'])
@@ -1,12 +1,17 @@
 """Capa's specialized use of codejail.safe_exec."""
 
-from codejail.safe_exec import safe_exec as codejail_safe_exec
 from codejail.safe_exec import not_safe_exec as codejail_not_safe_exec
 from codejail.safe_exec import json_safe, SafeExecException
 from . import lazymod
+from . import sandbox_pool
 from dogapi import dog_stats_api
 
+from collections import OrderedDict
 import hashlib
+import json
+import opcode
+import threading
+import types
 
 # Establish the Python environment for Capa.
 # Capa assumes float-friendly division always.
@@ -47,6 +52,77 @@ for name, modname in ASSUMED_IMPORTS:
 LAZY_IMPORTS = "".join(LAZY_IMPORTS)
 
 
+# Names through which code can reach its globals without naming them: either
+# directly, or by getting attributes or modules named by computed strings
+DYNAMIC_GLOBALS_NAMES = frozenset([
+    'globals', 'locals', 'vars', 'eval', 'execfile', '__dict__',
+    'f_globals', 'f_locals', 'func_globals', '__globals__',
+    'getattr', '__import__', 'sys', 'inspect', '__main__', '__builtins__',
+])
+
+EXEC_STMT = chr(opcode.opmap['EXEC_STMT'])
+
+# Results larger than this (as JSON) aren't kept in the in-process cache
+RESULT_CACHE_MAX_LENGTH = 64 * 1024
+
+# How many compiled code names are remembered
+CODE_NAMES_CACHE_SIZE = 1000
+
+
+class LRUCache(object):
+    """A thread-safe, in-process, least recently used cache of `size` items."""
+
+    def __init__(self, size):
+        self.size = size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the value of `key`, or None."""
+        with self._lock:
+            value = self._items.pop(key, None)
+            if value is not None:
+                self._items[key] = value
+            return value
+
+    def set(self, key, value):
+        """Set the value of `key`, evicting the least recently used item if full."""
+        if self.size <= 0:
+            return
+        with self._lock:
+            self._items.pop(key, None)
+            self._items[key] = value
+            if len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+
+# The in-process cache of results, in front of the `cache` given to safe_exec
+_RESULT_CACHE = LRUCache(0)
+
+# md5 of code -> the names the code uses, or False if it doesn't compile
+_CODE_NAMES = LRUCache(CODE_NAMES_CACHE_SIZE)
+
+
+def configure_result_cache(size):
+    """
+    Keep up to `size` results in process, in front of the `cache` given to
+    safe_exec, so that repeated executions don't even need a round trip to
+    it. A `size` of 0 disables it.
+    """
+    global _RESULT_CACHE  # pylint: disable=global-statement
+    _RESULT_CACHE = LRUCache(size)
+
+
+def configure_sandbox_pool(size, max_jobs=100):
+    """
+    Run the sandboxed code on up to `size` warm sandboxed interpreters per
+    process, which have the ASSUMED_IMPORTS imported already, each replaced
+    after `max_jobs` executions (see sandbox_pool). A `size` of 0 starts a
+    new sandboxed interpreter for each execution.
+    """
+    sandbox_pool.configure(size, max_jobs, [modname for _, modname in ASSUMED_IMPORTS])
+
+
 def update_hash(hasher, obj):
     """
     Update a `hashlib` hasher with a nested object.
@@ -70,6 +146,100 @@ def update_hash(hasher, obj):
         hasher.update(repr(obj))
 
 
+def _code_names(code_obj):
+    """
+    Return the names used by the compiled code `code_obj`, including those
+    of the functions and classes it defines, and its string constants (which
+    can name attributes, as in `getattr(f, 'func_globals')`).
+    """
+    names = set(code_obj.co_names) | set(code_obj.co_varnames)
+    if EXEC_STMT in code_obj.co_code:
+        # May as well be an exec statement
+        names.add('exec')
+    for const in code_obj.co_consts:
+        if isinstance(const, types.CodeType):
+            names |= _code_names(const)
+        elif isinstance(const, basestring):
+            names.add(const)
+    return names
+
+
+def _uses_globals(code, code_digest, globals_dict):
+    """
+    Whether `code` may use any of the globals in `globals_dict`, which then
+    need to be part of its cache key.
+    """
+    names = _CODE_NAMES.get(code_digest)
+    if names is None:
+        try:
+            names = frozenset(_code_names(compile(code, '<safe_exec>', 'exec')))
+        except (SyntaxError, TypeError, ValueError):
+            names = False
+        _CODE_NAMES.set(code_digest, names)
+
+    if names is False or 'exec' in names or names & DYNAMIC_GLOBALS_NAMES:
+        return True
+    return any(name in names for name in globals_dict)
+
+
+def _canonical_json(globals_dict):
+    """
+    Return the JSON of the JSON safe part of `globals_dict`, serialized the
+    same way whatever the order of its dicts.
+    """
+    try:
+        return json.dumps(globals_dict, sort_keys=True, separators=(',', ':'))
+    except (TypeError, ValueError):
+        # Some of the globals aren't JSON safe
+        return json.dumps(json_safe(globals_dict), sort_keys=True, separators=(',', ':'))
+
+
+def _cache_key(code, globals_dict, random_seed):
+    """
+    Return the cache key of the execution of `code` with `globals_dict`, and
+    whether the globals are part of it.
+
+    The globals are left out of the key when the code doesn't use them, so
+    that executions of the same code with different globals share results.
+    """
+    md5er = hashlib.md5()
+    md5er.update(repr(code))
+    uses_globals = _uses_globals(code, md5er.hexdigest(), globals_dict)
+    if uses_globals:
+        md5er.update(_canonical_json(globals_dict))
+    else:
+        md5er.update("no globals")
+    return "safe_exec.%r.%s" % (random_seed, md5er.hexdigest()), uses_globals
+
+
+def _cached_result(cache, key):
+    """
+    Return the cached result of the execution under `key`, from the
+    in-process cache or `cache`, or None.
+    """
+    cached = _RESULT_CACHE.get(key)
+    if cached is not None:
+        # Decode the results afresh each time, so that callers can't change
+        # the cached ones
+        emsg, results_json = cached
+        return emsg, json.loads(results_json)
+
+    cached = cache.get(key)
+    if cached is not None:
+        _cache_result_in_process(key, cached)
+    return cached
+
+
+def _cache_result_in_process(key, result):
+    """Keep `result` in the in-process cache, unless it's too large."""
+    if _RESULT_CACHE.size <= 0:
+        return
+    emsg, cleaned_results = result
+    results_json = json.dumps(cleaned_results)
+    if len(results_json) <= RESULT_CACHE_MAX_LENGTH:
+        _RESULT_CACHE.set(key, (emsg, results_json))
+
+
 @dog_stats_api.timed('capa.safe_exec.time')
 def safe_exec(code, globals_dict, random_seed=None, python_path=None, cache=None, slug=None, unsafely=False):
     """
@@ -84,8 +254,8 @@ def safe_exec(code, globals_dict, random_seed=None, python_path=None, cache=None
     `python_path` is a list of directories to add to the Python path before execution.
 
     `cache` is an object with .get(key) and .set(key, value) methods.  It will be used
-    to cache the execution, taking into account the code, the values of the globals,
-    and the random seed.
+    to cache the execution, taking into account the code, the values of the globals
+    the code uses, and the random seed.
 
     `slug` is an arbitrary string, a description that's meaningful to the
     caller, that will be used in log messages.
@@ -95,12 +265,11 @@ def safe_exec(code, globals_dict, random_seed=None, python_path=None, cache=None
     """
     # Check the cache for a previous result.
     if cache:
-        safe_globals = json_safe(globals_dict)
-        md5er = hashlib.md5()
-        md5er.update(repr(code))
-        update_hash(md5er, safe_globals)
-        key = "safe_exec.%r.%s" % (random_seed, md5er.hexdigest())
-        cached = cache.get(key)
+        key, uses_globals = _cache_key(code, globals_dict, random_seed)
+        # Code which doesn't use the globals can't change them either, so
+        # they're left out of its cached result
+        given_globals = set(globals_dict) if not uses_globals else set()
+        cached = _cached_result(cache, key)
         if cached is not None:
             # We have a cached result.  The result is a pair: the exception
             # message, if any, else None; and the resulting globals dictionary.
@@ -117,7 +286,7 @@ def safe_exec(code, globals_dict, random_seed=None, python_path=None, cache=None
     if unsafely:
         exec_fn = codejail_not_safe_exec
     else:
-        exec_fn = codejail_safe_exec
+        exec_fn = sandbox_pool.safe_exec
 
     # Run the code!  Results are side effects in globals_dict.
     try:
@@ -133,8 +302,11 @@ def safe_exec(code, globals_dict, random_seed=None, python_path=None, cache=None
     # Put the result back in the cache.  This is complicated by the fact that
     # the globals dict might not be entirely serializable.
     if cache:
-        cleaned_results = json_safe(globals_dict)
+        cleaned_results = json_safe(dict(
+            (name, value) for name, value in globals_dict.iteritems() if name not in given_globals
+        ))
         cache.set(key, (emsg, cleaned_results))
+        _cache_result_in_process(key, (emsg, cleaned_results))
 
     # If an exception happened, raise it now.
     if emsg:
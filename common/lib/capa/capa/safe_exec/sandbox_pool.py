@@ -0,0 +1,327 @@
+"""
+A pool of warm sandboxed Python interpreters for safe_exec.
+
+codejail starts a new sandboxed interpreter for each execution, which then
+has to import numpy, scipy, etc. all over again. The pool instead keeps
+sandboxed interpreters running (see sandbox_worker) that have imported them
+once, and sends them the executions over a pipe. Each execution still runs in
+a process of its own, forked by the interpreter, with codejail's limits.
+
+The pool is used once configured (see `configure`), and only for the sandboxed
+executions: it starts its interpreters the way codejail starts them, so it
+needs codejail to be configured for python. Executions which can't be run by
+the pool (it isn't configured, all its interpreters are busy, or one of them
+failed) are run by codejail as before. After MAX_FAILURES interpreters in a row
+failed to start or crashed, the pool isn't used for BACKOFF seconds.
+
+As with codejail, the directory of each execution is created by the host
+(see `_job_directory`), so the AppArmor profile of the sandboxed Python only
+needs to let it read the /tmp/codejail-* directories (see README.rst).
+
+"""
+
+import json
+import logging
+import os
+import os.path
+import select
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from codejail import jail_code
+from codejail.safe_exec import safe_exec as codejail_safe_exec
+from codejail.safe_exec import json_safe, SafeExecException
+from dogapi import dog_stats_api
+
+from . import sandbox_worker
+
+
+log = logging.getLogger(__name__)
+
+
+_worker_py_file = sandbox_worker.__file__
+if _worker_py_file.endswith("c"):
+    _worker_py_file = _worker_py_file[:-1]
+
+WORKER_PY = open(_worker_py_file).read()
+
+
+class WorkerError(Exception):
+    """A sandboxed interpreter failed (rather than the code it ran)."""
+    pass
+
+
+class SandboxWorker(object):
+    """A warm sandboxed interpreter, running sandbox_worker."""
+
+    # How long an interpreter may take to import the preloaded modules
+    STARTUP_TIMEOUT = 30
+
+    # How long after the REALTIME limit of an execution its result may come
+    RESULT_GRACE_PERIOD = 5
+
+    def __init__(self, cmdline_start, modules):
+        self.jobs = 0
+        self.process = subprocess.Popen(
+            cmdline_start + ['-c', WORKER_PY] + list(modules),
+            bufsize=-1,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=open(os.devnull, 'w'),
+            close_fds=True,
+        )
+        try:
+            self._read_result(self.STARTUP_TIMEOUT)
+        except WorkerError:
+            self.kill()
+            raise
+
+    def run(self, job):
+        """Send `job` to the interpreter, and return its result."""
+        self.jobs += 1
+        realtime = job['limits'].get('REALTIME')
+        try:
+            self.process.stdin.write(json.dumps(job) + '\n')
+            self.process.stdin.flush()
+        except (IOError, OSError) as error:
+            raise WorkerError(error)
+        return self._read_result(realtime + self.RESULT_GRACE_PERIOD if realtime else None)
+
+    def _read_result(self, timeout):
+        """Read one result from the interpreter, waiting up to `timeout` seconds for it."""
+        readable, _, _ = select.select([self.process.stdout], [], [], timeout)
+        if not readable:
+            raise WorkerError('Timed out')
+        line = self.process.stdout.readline()
+        if not line:
+            raise WorkerError('Exited with status {}'.format(self.process.poll()))
+        try:
+            return json.loads(line)
+        except ValueError:
+            raise WorkerError('Invalid result')
+
+    def kill(self):
+        """
+        Stop the interpreter.
+
+        It exits once its stdin is closed: it may be running as another user,
+        who can't be sent signals.
+        """
+        for pipe in (self.process.stdin, self.process.stdout):
+            try:
+                pipe.close()
+            except (IOError, OSError):
+                pass
+        try:
+            self.process.kill()
+        except OSError:
+            pass
+        self.process.poll()
+
+
+class SandboxPool(object):
+    """
+    Up to `size` warm sandboxed interpreters per process, each replaced
+    after running `max_jobs` executions.
+    """
+
+    # How many interpreters in a row may fail to start or crash before the
+    # pool stops being used for BACKOFF seconds
+    MAX_FAILURES = 3
+    BACKOFF = 300
+
+    def __init__(self, size, max_jobs=100, modules=()):
+        self.size = size
+        self.max_jobs = max_jobs
+        self.modules = modules
+
+        self._lock = threading.Lock()
+        self._idle = []
+        self._count = 0
+        self._pid = os.getpid()
+        self._failures = 0
+        self._backoff_until = None
+
+    def run(self, job):
+        """
+        Run `job` on one of the interpreters, and return its result.
+
+        Raises WorkerError if no interpreter could run it.
+        """
+        if not jail_code.is_configured('python'):
+            raise WorkerError('codejail is not configured for python')
+
+        with self._lock:
+            if self._backoff_until is not None:
+                if time.time() < self._backoff_until:
+                    raise WorkerError('Backing off after {} failures'.format(self.MAX_FAILURES))
+                self._backoff_until = None
+
+        try:
+            worker = self._acquire()
+        except Exception as error:  # pylint: disable=broad-except
+            self._failed()
+            if isinstance(error, WorkerError):
+                raise
+            raise WorkerError(error)
+        if worker is None:
+            raise WorkerError('All interpreters are busy')
+        try:
+            result = worker.run(job)
+        except WorkerError:
+            self._discard(worker)
+            self._failed()
+            raise
+        with self._lock:
+            self._failures = 0
+        self._release(worker)
+        return result
+
+    def _failed(self):
+        """Count an interpreter failure, backing off after MAX_FAILURES in a row."""
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.MAX_FAILURES:
+                log.warning(
+                    'Not using the sandbox pool for %s seconds, after %s failures in a row',
+                    self.BACKOFF, self._failures
+                )
+                dog_stats_api.increment('capa.safe_exec.pool.backoff')
+                self._failures = 0
+                self._backoff_until = time.time() + self.BACKOFF
+
+    def _acquire(self):
+        """
+        Take an idle interpreter, starting one if there's none, unless the
+        pool is full (then returns None).
+        """
+        with self._lock:
+            if self._pid != os.getpid():
+                # The interpreters of the process this one was forked from
+                # belong to it
+                self._idle = []
+                self._count = 0
+                self._pid = os.getpid()
+            if self._idle:
+                return self._idle.pop()
+
+        return self._start_worker()
+
+    def _release(self, worker):
+        """Return `worker` to the pool, or replace it if it has run enough jobs."""
+        if worker.jobs >= self.max_jobs:
+            self._discard(worker)
+            # Start the replacement in the background, rather than in the
+            # next execution
+            thread = threading.Thread(target=self._replace, name='sandbox-pool-warmup')
+            thread.daemon = True
+            thread.start()
+        else:
+            with self._lock:
+                self._idle.append(worker)
+
+    def _replace(self):
+        """Start an idle interpreter."""
+        try:
+            worker = self._start_worker()
+        except Exception:  # pylint: disable=broad-except
+            log.exception('Could not start a sandboxed interpreter')
+            self._failed()
+            return
+        if worker is not None:
+            self._release(worker)
+
+    def _discard(self, worker):
+        """Stop `worker` and forget about it."""
+        worker.kill()
+        with self._lock:
+            self._count -= 1
+
+    def _start_worker(self):
+        """
+        Start a sandboxed interpreter the way codejail would, unless the pool
+        is full (then returns None).
+        """
+        with self._lock:
+            if self._count >= self.size:
+                return None
+            self._count += 1
+        try:
+            with dog_stats_api.timer('capa.safe_exec.pool.startup'):
+                return SandboxWorker(jail_code.COMMANDS['python']['cmdline_start'], self.modules)
+        except Exception:
+            with self._lock:
+                self._count -= 1
+            raise
+
+
+_POOL = None
+
+
+def configure(size, max_jobs=100, modules=()):
+    """
+    Run sandboxed executions on up to `size` warm interpreters per process,
+    each importing `modules` when it starts and replaced after running
+    `max_jobs` executions. A `size` of 0 stops using the pool.
+    """
+    global _POOL  # pylint: disable=global-statement
+    _POOL = SandboxPool(size, max_jobs, modules) if size else None
+
+
+@contextmanager
+def _job_directory(python_path):
+    """
+    Create the directory of an execution, as the host user, the way
+    codejail's jail_code does: readable by the sandbox, with a world writable
+    "tmp" subdirectory, and a copy of each `python_path` entry. Yields its
+    path, and removes it afterwards.
+    """
+    tmpdir = tempfile.mkdtemp(prefix='codejail-')
+    try:
+        os.chmod(tmpdir, 0775)
+        tmptmp = os.path.join(tmpdir, 'tmp')
+        os.mkdir(tmptmp)
+        os.chmod(tmptmp, 0777)
+
+        for path in python_path:
+            dest = os.path.join(tmpdir, os.path.basename(path.rstrip('/')))
+            if os.path.isdir(path):
+                shutil.copytree(path, dest)
+            else:
+                shutil.copyfile(path, dest)
+
+        yield tmpdir
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def safe_exec(code, globals_dict, python_path=None, slug=None):
+    """
+    Execute python code safely, like codejail.safe_exec.safe_exec, on the
+    pool if it's configured.
+    """
+    if _POOL is None:
+        return codejail_safe_exec(code, globals_dict, python_path=python_path, slug=slug)
+
+    python_path = python_path or ()
+    try:
+        with _job_directory(python_path) as tmpdir:
+            result = _POOL.run({
+                'code': code,
+                'globals': json_safe(globals_dict),
+                'tmpdir': tmpdir,
+                'python_path': [os.path.basename(path.rstrip('/')) for path in python_path],
+                'limits': dict(jail_code.LIMITS),
+            })
+    except WorkerError as error:
+        log.info('Running %s with codejail, the sandbox pool could not: %s', slug, error)
+        dog_stats_api.increment('capa.safe_exec.pool.fallback')
+        return codejail_safe_exec(code, globals_dict, python_path=python_path or None, slug=slug)
+
+    if result.get('status') != 'ok':
+        raise SafeExecException("Couldn't execute jailed code: %s" % result.get('message'))
+    globals_dict.update(result['globals'])
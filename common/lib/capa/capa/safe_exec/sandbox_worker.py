@@ -0,0 +1,188 @@
+"""
+The program run by the warm sandboxed interpreters of sandbox_pool.
+
+It is run by the sandboxed Python (as `python -c <this source> <modules>`), so
+it must only use the standard library. It imports `modules` once, then reads
+jobs from stdin, one JSON document per line, and writes one JSON result per
+line to stdout.
+
+Each job is run in a process forked for it, with the job's resource limits,
+so that jobs can't see or affect each other, nor the warm interpreter.
+
+A job is::
+
+    {"code": CODE, "globals": GLOBALS, "tmpdir": DIR, "python_path": [NAME, ...],
+     "limits": {"CPU": secs, "REALTIME": secs, "VMEM": bytes}}
+
+where DIR is the directory of the job, created by the host the way codejail
+creates it (the sandbox can only read it, except for its "tmp" subdirectory),
+and each NAME is a python_path entry the host copied into it. The result is
+either {"status": "ok", "globals": GLOBALS} or
+{"status": "error", "message": MESSAGE}.
+
+"""
+
+import json
+import os
+import resource
+import select
+import signal
+import sys
+import tempfile
+import time
+import traceback
+
+
+OK_TYPES = (type(None), int, long, float, str, unicode, list, tuple, dict)
+
+
+def preload(modules):
+    """Import `modules`, so that forked jobs find them already imported."""
+    for modname in modules:
+        try:
+            __import__(modname)
+        except Exception:  # pylint: disable=broad-except
+            pass
+
+
+def make_undumpable():
+    """
+    Keep jobs (running as the same user) from attaching to this process,
+    which will see the jobs to come.
+    """
+    try:
+        import ctypes
+        pr_set_dumpable = 4
+        ctypes.CDLL(None).prctl(pr_set_dumpable, 0, 0, 0, 0)
+    except Exception:  # pylint: disable=broad-except
+        pass
+
+
+def jsonable(value):
+    """Whether `value` can be sent back as JSON."""
+    if not isinstance(value, OK_TYPES):
+        return False
+    try:
+        json.dumps(value)
+    except Exception:  # pylint: disable=broad-except
+        return False
+    return True
+
+
+def vm_size():
+    """The virtual memory size of this process, in bytes."""
+    with open('/proc/self/statm') as statm:
+        return int(statm.read().split()[0]) * resource.getpagesize()
+
+
+def set_limits(limits):
+    """
+    Apply the job's `limits` to this (forked) process. The memory limit is on
+    top of the memory used by the warm interpreter.
+    """
+    if limits.get('CPU'):
+        resource.setrlimit(resource.RLIMIT_CPU, (limits['CPU'], limits['CPU']))
+    if limits.get('VMEM'):
+        vmem = vm_size() + limits['VMEM']
+        resource.setrlimit(resource.RLIMIT_AS, (vmem, vmem))
+    # No subprocesses
+    resource.setrlimit(resource.RLIMIT_NPROC, (0, 0))
+
+
+def execute(job):
+    """Run `job` in this (forked) process, returning its cleaned globals."""
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in (0, 1, 2):
+        os.dup2(devnull, fd)
+    tmpdir = job['tmpdir']
+    os.chdir(tmpdir)
+    # the only place the sandbox can write to, as with codejail
+    os.environ['TMPDIR'] = tempfile.tempdir = os.path.join(tmpdir, 'tmp')
+
+    for name in job.get('python_path', []):
+        sys.path.append(os.path.join(tmpdir, name))
+
+    set_limits(job.get('limits', {}))
+
+    g_dict = job['globals']
+    exec job['code'] in g_dict  # pylint: disable=exec-used
+
+    return dict(
+        (key, value)
+        for key, value in g_dict.iteritems()
+        if key != '__builtins__' and jsonable(value)
+    )
+
+
+def run_child(job, result_fd):
+    """The forked process of `job`: run it and write its result to `result_fd`."""
+    try:
+        result = {'status': 'ok', 'globals': execute(job)}
+    except BaseException:  # pylint: disable=broad-except
+        result = {'status': 'error', 'message': traceback.format_exc()}
+    try:
+        data = json.dumps(result)
+    except Exception:  # pylint: disable=broad-except
+        data = json.dumps({'status': 'error', 'message': 'Results are not serializable'})
+    with os.fdopen(result_fd, 'w') as result_file:
+        result_file.write(data)
+    os._exit(0)  # pylint: disable=protected-access
+
+
+def run_job(job):
+    """Run `job` in a forked process, and return its result."""
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        run_child(job, write_fd)
+    os.close(write_fd)
+
+    realtime = job.get('limits', {}).get('REALTIME')
+    deadline = time.time() + realtime if realtime else None
+    chunks = []
+    timed_out = False
+    try:
+        while True:
+            timeout = None if deadline is None else max(deadline - time.time(), 0)
+            readable, _, _ = select.select([read_fd], [], [], timeout)
+            if not readable:
+                timed_out = True
+                os.kill(pid, signal.SIGKILL)
+                break
+            chunk = os.read(read_fd, 65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    finally:
+        os.close(read_fd)
+        _, status = os.waitpid(pid, 0)
+
+    if timed_out:
+        return {'status': 'error', 'message': 'Killed after %s seconds' % realtime}
+    if os.WIFSIGNALED(status):
+        return {'status': 'error', 'message': 'Killed by signal %d' % os.WTERMSIG(status)}
+    try:
+        return json.loads(''.join(chunks))
+    except ValueError:
+        return {'status': 'error', 'message': 'No results'}
+
+
+def main():
+    """Serve jobs until stdin is closed."""
+    stdin, stdout = sys.stdin, sys.stdout
+    preload(sys.argv[1:])
+    make_undumpable()
+
+    stdout.write(json.dumps({'status': 'ready'}) + '\n')
+    stdout.flush()
+    while True:
+        line = stdin.readline()
+        if not line:
+            break
+        stdout.write(json.dumps(run_job(json.loads(line))) + '\n')
+        stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
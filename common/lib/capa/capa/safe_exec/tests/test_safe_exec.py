@@ -9,7 +9,7 @@ import unittest
 
 from nose.plugins.skip import SkipTest
 
-from capa.safe_exec import safe_exec, update_hash
+from capa.safe_exec import safe_exec, update_hash, configure_result_cache
 from codejail.safe_exec import SafeExecException
 from codejail.jail_code import is_configured
 
@@ -166,6 +166,61 @@ class TestSafeExecCaching(unittest.TestCase):
         safe_exec(code, g, cache=DictCache(cache))
         self.assertEqual(g['a'], 17)
 
+    def test_unused_globals_not_in_key(self):
+        cache = {}
+        g = {'x': 1}
+        safe_exec("a = 17", g, cache=DictCache(cache))
+        # The globals the code doesn't use aren't cached either
+        self.assertEqual(cache.values(), [(None, {'a': 17})])
+
+        g = {'x': 2}
+        safe_exec("a = 17", g, cache=DictCache(cache))
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(g, {'a': 17, 'x': 2})
+
+    def test_used_globals_in_key(self):
+        cache = {}
+        for x in [1, 2]:
+            g = {'x': x}
+            safe_exec("a = x + 1", g, cache=DictCache(cache))
+            self.assertEqual(g['a'], x + 1)
+        self.assertEqual(len(cache), 2)
+
+        # So are the globals of code which could reach them without naming them
+        safe_exec("a = globals()['x']", {'x': 1}, cache=DictCache(cache))
+        g = {'x': 2}
+        safe_exec("a = globals()['x']", g, cache=DictCache(cache))
+        self.assertEqual(g['a'], 2)
+
+        # or through attributes named by strings
+        code = "def f(): pass\na = getattr(f, 'func_globals')['x']"
+        safe_exec(code, {'x': 1}, cache=DictCache(cache))
+        g = {'x': 2}
+        safe_exec(code, g, cache=DictCache(cache))
+        self.assertEqual(g['a'], 2)
+
+        # even when the strings are computed
+        code = "import sys\na = getattr(sys._getframe(), ''.join(['f_', 'globals']))['x']"
+        safe_exec(code, {'x': 1}, cache=DictCache(cache))
+        g = {'x': 2}
+        safe_exec(code, g, cache=DictCache(cache))
+        self.assertEqual(g['a'], 2)
+
+    def test_in_process_cache(self):
+        configure_result_cache(10)
+        self.addCleanup(configure_result_cache, 0)
+        cache = {}
+
+        g = {}
+        safe_exec("a = [1, 2]", g, cache=DictCache(cache))
+        g['a'].append(3)
+
+        # Fiddle with the cache: the in-process copy is used.
+        cache[cache.keys()[0]] = (None, {'a': 17})
+        g = {}
+        safe_exec("a = [1, 2]", g, cache=DictCache(cache))
+        self.assertEqual(g['a'], [1, 2])
+
     def test_unicode_submission(self):
         # Check that using non-ASCII unicode does not raise an encoding error.
         # Try several non-ASCII unicode characters
@@ -0,0 +1,113 @@
+"""Test sandbox_pool.py"""
+
+import os.path
+import sys
+import unittest
+
+from mock import patch
+
+from capa.safe_exec import sandbox_pool
+from codejail.safe_exec import SafeExecException
+
+
+class SynchronousThread(object):
+    """A stand-in for threading.Thread, running its target when started."""
+    def __init__(self, target, **kwargs):  # pylint: disable=unused-argument
+        self.target = target
+
+    def start(self):
+        self.target()
+
+
+class TestSandboxPool(unittest.TestCase):
+    """
+    Test the pool, with the interpreters running (unsandboxed) as the
+    current interpreter.
+    """
+    def setUp(self):
+        patcher = patch.dict(
+            'codejail.jail_code.COMMANDS',
+            {'python': {'cmdline_start': [sys.executable, '-E', '-B']}}
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        sandbox_pool.configure(1, max_jobs=2, modules=['math'])
+        self.addCleanup(sandbox_pool.configure, 0)
+        self.pool = sandbox_pool._POOL  # pylint: disable=protected-access
+
+    def tearDown(self):
+        for worker in self.pool._idle:  # pylint: disable=protected-access
+            worker.kill()
+
+    def test_set_values(self):
+        g = {'b': 2}
+        sandbox_pool.safe_exec("import math\na = int(math.pi) + b", g)
+        self.assertEqual(g['a'], 5)
+
+    def test_raising_exceptions(self):
+        g = {}
+        with self.assertRaises(SafeExecException) as cm:
+            sandbox_pool.safe_exec("1/0", g)
+        self.assertIn("ZeroDivisionError", cm.exception.message)
+
+    def test_limits(self):
+        with self.assertRaises(SafeExecException) as cm:
+            sandbox_pool.safe_exec("while True: pass", {})
+        self.assertIn("Killed", cm.exception.message)
+
+        # The interpreter survives
+        g = {}
+        sandbox_pool.safe_exec("a = 1", g)
+        self.assertEqual(g['a'], 1)
+
+    def test_python_lib(self):
+        pylib = os.path.dirname(__file__) + "/test_files/pylib"
+        g = {}
+        sandbox_pool.safe_exec("import constant; a = constant.THE_CONST", g, python_path=[pylib])
+        self.assertEqual(g['a'], 23)
+
+    def test_jobs_isolated(self):
+        g = {}
+        sandbox_pool.safe_exec("import math; math.pi = 3", g)
+        sandbox_pool.safe_exec("import math; a = math.pi", g)
+        self.assertNotEqual(g['a'], 3)
+
+    def test_interpreters_reused_then_replaced(self):
+        pids = []
+        for _ in range(3):
+            g = {}
+            # start the replacement interpreters synchronously
+            with patch('capa.safe_exec.sandbox_pool.threading.Thread', SynchronousThread):
+                sandbox_pool.safe_exec("import os; pid = os.getppid()", g)
+            pids.append(g['pid'])
+
+        self.assertEqual(pids[0], pids[1])
+        self.assertNotEqual(pids[1], pids[2])
+
+    def test_falls_back_to_codejail(self):
+        g = {}
+        with patch('capa.safe_exec.sandbox_pool.SandboxWorker.run', side_effect=sandbox_pool.WorkerError):
+            with patch('capa.safe_exec.sandbox_pool.codejail_safe_exec') as codejail_safe_exec:
+                sandbox_pool.safe_exec("a = 1", g, slug='slug')
+
+        codejail_safe_exec.assert_called_once_with("a = 1", g, python_path=None, slug='slug')
+
+    def test_job_directory_made_by_host(self):
+        # as with codejail, the sandbox only needs to read the directory of the job
+        pylib = os.path.dirname(__file__) + "/test_files/pylib"
+        g = {}
+        sandbox_pool.safe_exec("import os; cwd = os.getcwd(); files = sorted(os.listdir('.'))", g, python_path=[pylib])
+        self.assertTrue(os.path.basename(g['cwd']).startswith('codejail-'))
+        self.assertEqual(g['files'], ['pylib', 'tmp'])
+        self.assertFalse(os.path.exists(g['cwd']))
+
+    def test_backs_off_after_failures(self):
+        with patch('capa.safe_exec.sandbox_pool.SandboxWorker', side_effect=sandbox_pool.WorkerError('Timed out')) as worker:
+            with patch('capa.safe_exec.sandbox_pool.codejail_safe_exec') as codejail_safe_exec:
+                for _ in range(sandbox_pool.SandboxPool.MAX_FAILURES + 2):
+                    sandbox_pool.safe_exec("a = 1", {})
+
+        # no more interpreters are started once the pool backs off
+        self.assertEqual(worker.call_count, sandbox_pool.SandboxPool.MAX_FAILURES)
+        self.assertEqual(codejail_safe_exec.call_count, sandbox_pool.SandboxPool.MAX_FAILURES + 2)
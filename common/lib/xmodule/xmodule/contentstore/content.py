@@ -5,6 +5,7 @@ XASSET_THUMBNAIL_TAIL_NAME = '.jpg'
 
 import os
 import logging
+import mmap
 import StringIO
 from urlparse import urlparse, urlunparse
 
@@ -15,7 +16,7 @@ from PIL import Image
 
 class StaticContent(object):
     def __init__(self, loc, name, content_type, data, last_modified_at=None, thumbnail_location=None, import_path=None,
-                 length=None, locked=False):
+                 length=None, locked=False, content_digest=None):
         self.location = loc
         self.name = name  # a display string which can be edited, and thus not part of the location which needs to be fixed
         self.content_type = content_type
@@ -27,6 +28,8 @@ class StaticContent(object):
         # cycles
         self.import_path = import_path
         self.locked = locked
+        # md5 hex digest of the data, when the store knows it
+        self.content_digest = content_digest
 
     @property
     def is_thumbnail(self):
@@ -44,6 +47,23 @@ class StaticContent(object):
         return Location([XASSET_LOCATION_TAG, org, course, 'asset' if not is_thumbnail else 'thumbnail',
                          Location.clean_keeping_underscores(name), revision])
 
+    @staticmethod
+    def compute_thumbnail_location(location):
+        """
+        Return the name and location of the thumbnail of the content at `location`.
+        """
+        # use a naming convention to associate originals with the thumbnail
+        thumbnail_name = StaticContent.generate_thumbnail_name(location.name)
+        return thumbnail_name, StaticContent.compute_location(location.org, location.course,
+                                                              thumbnail_name, is_thumbnail=True)
+
+    @staticmethod
+    def is_image(content_type):
+        """
+        Whether content of `content_type` is an image, which then gets a thumbnail.
+        """
+        return content_type is not None and content_type.split('/')[0] == 'image'
+
     def get_id(self):
         return StaticContent.get_id_from_location(self.location)
 
@@ -130,20 +150,43 @@ class StaticContent(object):
     def stream_data(self):
         yield self._data
 
+    def stream_data_in_range(self, first_byte, last_byte):
+        """
+        Yield the bytes of the data from `first_byte` to `last_byte`, inclusive.
+        """
+        yield self._data[first_byte:last_byte + 1]
+
 
 class StaticContentStream(StaticContent):
+    # GridFS stores files in chunks of 256KB by default
+    STREAM_DATA_CHUNK_SIZE = 256 * 1024
+
     def __init__(self, loc, name, content_type, stream, last_modified_at=None, thumbnail_location=None, import_path=None,
-                 length=None, locked=False):
+                 length=None, locked=False, content_digest=None):
         super(StaticContentStream, self).__init__(loc, name, content_type, None, last_modified_at=last_modified_at,
                                                   thumbnail_location=thumbnail_location, import_path=import_path,
-                                                  length=length, locked=locked)
+                                                  length=length, locked=locked, content_digest=content_digest)
         self._stream = stream
 
     def stream_data(self):
         while True:
-            chunk = self._stream.read(1024)
+            chunk = self._stream.read(self.STREAM_DATA_CHUNK_SIZE)
+            if len(chunk) == 0:
+                break
+            yield chunk
+
+    def stream_data_in_range(self, first_byte, last_byte):
+        """
+        Yield the bytes of the stream from `first_byte` to `last_byte`,
+        inclusive, without reading the ones before them.
+        """
+        self._stream.seek(first_byte)
+        remaining = last_byte - first_byte + 1
+        while remaining > 0:
+            chunk = self._stream.read(min(remaining, self.STREAM_DATA_CHUNK_SIZE))
             if len(chunk) == 0:
                 break
+            remaining -= len(chunk)
             yield chunk
 
     def close(self):
@@ -153,9 +196,74 @@ class StaticContentStream(StaticContent):
         self._stream.seek(0)
         content = StaticContent(self.location, self.name, self.content_type, self._stream.read(),
                                 last_modified_at=self.last_modified_at, thumbnail_location=self.thumbnail_location,
-                                import_path=self.import_path, length=self.length, locked=self.locked)
+                                import_path=self.import_path, length=self.length, locked=self.locked,
+                                content_digest=self.content_digest)
         return content
 
+    def copy_to_file(self, data_file):
+        """
+        Write the data of the stream to the open file `data_file`.
+        """
+        self._stream.seek(0)
+        try:
+            for chunk in self.stream_data():
+                data_file.write(chunk)
+        finally:
+            self._stream.seek(0)
+
+
+class StaticContentFile(StaticContent):
+    """
+    Static content whose data is in a local file, at `path`.
+
+    The path is local to the machine, so it isn't pickled along with the
+    rest of the content (see cache_toolbox.core.get_cached_content).
+    """
+    STREAM_DATA_CHUNK_SIZE = 256 * 1024
+
+    def __init__(self, loc, name, content_type, path, last_modified_at=None, thumbnail_location=None,
+                 import_path=None, length=None, locked=False, content_digest=None):
+        super(StaticContentFile, self).__init__(loc, name, content_type, None, last_modified_at=last_modified_at,
+                                                thumbnail_location=thumbnail_location, import_path=import_path,
+                                                length=length, locked=locked, content_digest=content_digest)
+        self.path = path
+
+    @classmethod
+    def from_content(cls, content, path):
+        """
+        Return a StaticContentFile for the data of `content` written to `path`.
+        """
+        return cls(content.location, content.name, content.content_type, path,
+                   last_modified_at=content.last_modified_at, thumbnail_location=content.thumbnail_location,
+                   import_path=content.import_path, length=content.length, locked=content.locked,
+                   content_digest=content.content_digest)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['path'] = None
+        return state
+
+    @property
+    def data(self):
+        with open(self.path, 'rb') as data_file:
+            return data_file.read()
+
+    def stream_data(self):
+        return self.stream_data_in_range(0, self.length - 1)
+
+    def stream_data_in_range(self, first_byte, last_byte):
+        """
+        Yield the bytes of the file from `first_byte` to `last_byte`,
+        inclusive, through a memory map of the file.
+        """
+        with open(self.path, 'rb') as data_file:
+            data = mmap.mmap(data_file.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                for start in xrange(first_byte, last_byte + 1, self.STREAM_DATA_CHUNK_SIZE):
+                    yield data[start:min(start + self.STREAM_DATA_CHUNK_SIZE, last_byte + 1)]
+            finally:
+                data.close()
+
 
 class ContentStore(object):
     '''
@@ -194,37 +302,20 @@ class ContentStore(object):
 
     def generate_thumbnail(self, content, tempfile_path=None):
         thumbnail_content = None
-        # use a naming convention to associate originals with the thumbnail
-        thumbnail_name = StaticContent.generate_thumbnail_name(content.location.name)
-
-        thumbnail_file_location = StaticContent.compute_location(content.location.org, content.location.course,
-                                                                 thumbnail_name, is_thumbnail=True)
+        thumbnail_name, thumbnail_file_location = StaticContent.compute_thumbnail_location(content.location)
 
         # if we're uploading an image, then let's generate a thumbnail so that we can
         # serve it up when needed without having to rescale on the fly
-        if content.content_type is not None and content.content_type.split('/')[0] == 'image':
+        if StaticContent.is_image(content.content_type):
             try:
-                # use PIL to do the thumbnail generation (http://www.pythonware.com/products/pil/)
-                # My understanding is that PIL will maintain aspect ratios while restricting
-                # the max-height/width to be whatever you pass in as 'size'
-                # @todo: move the thumbnail size to a configuration setting?!?
                 if tempfile_path is None:
-                    im = Image.open(StringIO.StringIO(content.data))
+                    thumbnail_data = make_thumbnail_data(StringIO.StringIO(content.data))
                 else:
-                    im = Image.open(tempfile_path)
-
-                # I've seen some exceptions from the PIL library when trying to save palletted
-                # PNG files to JPEG. Per the google-universe, they suggest converting to RGB first.
-                im = im.convert('RGB')
-                size = 128, 128
-                im.thumbnail(size, Image.ANTIALIAS)
-                thumbnail_file = StringIO.StringIO()
-                im.save(thumbnail_file, 'JPEG')
-                thumbnail_file.seek(0)
+                    thumbnail_data = make_thumbnail_data(tempfile_path)
 
                 # store this thumbnail as any other piece of content
                 thumbnail_content = StaticContent(thumbnail_file_location, thumbnail_name,
-                                                  'image/jpeg', thumbnail_file)
+                                                  'image/jpeg', StringIO.StringIO(thumbnail_data))
 
                 contentstore().save(thumbnail_content)
 
@@ -233,3 +324,27 @@ class ContentStore(object):
                 logging.exception(u"Failed to generate thumbnail for {0}. Exception: {1}".format(content.location, str(e)))
 
         return thumbnail_content, thumbnail_file_location
+
+
+def make_thumbnail_data(image_file):
+    """
+    Return the data of a JPEG thumbnail of the image in `image_file` (a path
+    or file object).
+
+    A module level function, so that thumbnails can be made in other
+    processes (see xml_importer.import_static_content).
+    """
+    # use PIL to do the thumbnail generation (http://www.pythonware.com/products/pil/)
+    # My understanding is that PIL will maintain aspect ratios while restricting
+    # the max-height/width to be whatever you pass in as 'size'
+    # @todo: move the thumbnail size to a configuration setting?!?
+    im = Image.open(image_file)
+
+    # I've seen some exceptions from the PIL library when trying to save palletted
+    # PNG files to JPEG. Per the google-universe, they suggest converting to RGB first.
+    im = im.convert('RGB')
+    size = 128, 128
+    im.thumbnail(size, Image.ANTIALIAS)
+    thumbnail_file = StringIO.StringIO()
+    im.save(thumbnail_file, 'JPEG')
+    return thumbnail_file.getvalue()
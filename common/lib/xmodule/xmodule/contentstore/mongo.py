@@ -8,11 +8,12 @@ from xmodule.contentstore.content import XASSET_LOCATION_TAG
 
 import logging
 
-from .content import StaticContent, ContentStore, StaticContentStream
+from .content import StaticContent, ContentStore, StaticContentStream, StaticContentFile
 from xmodule.exceptions import NotFoundError
-from fs.osfs import OSFS
-import os
+from functools import partial
+from multiprocessing.pool import ThreadPool
 import json
+import posixpath
 
 
 class MongoContentStore(ContentStore):
@@ -51,7 +52,11 @@ class MongoContentStore(ContentStore):
                               import_path=content.import_path,
                               # getattr b/c caching may mean some pickled instances don't have attr
                               locked=getattr(content, 'locked', False)) as fp:
-            if hasattr(content.data, '__iter__'):
+            if isinstance(content, StaticContentFile):
+                # don't read large files in memory
+                for chunk in content.stream_data():
+                    fp.write(chunk)
+            elif hasattr(content.data, '__iter__'):
                 for chunk in content.data:
                     fp.write(chunk)
             else:
@@ -72,7 +77,8 @@ class MongoContentStore(ContentStore):
                     location, fp.displayname, fp.content_type, fp, last_modified_at=fp.uploadDate,
                     thumbnail_location=getattr(fp, 'thumbnail_location', None),
                     import_path=getattr(fp, 'import_path', None),
-                    length=fp.length, locked=getattr(fp, 'locked', False)
+                    length=fp.length, locked=getattr(fp, 'locked', False),
+                    content_digest=getattr(fp, 'md5', None)
                 )
             else:
                 with self.fs.get(content_id) as fp:
@@ -80,7 +86,8 @@ class MongoContentStore(ContentStore):
                         location, fp.displayname, fp.content_type, fp.read(), last_modified_at=fp.uploadDate,
                         thumbnail_location=getattr(fp, 'thumbnail_location', None),
                         import_path=getattr(fp, 'import_path', None),
-                        length=fp.length, locked=getattr(fp, 'locked', False)
+                        length=fp.length, locked=getattr(fp, 'locked', False),
+                        content_digest=getattr(fp, 'md5', None)
                     )
         except NoFile:
             if throw_on_not_found:
@@ -103,42 +110,48 @@ class MongoContentStore(ContentStore):
         except Exception:
             pass
 
-    def export(self, location, output_directory):
-        content = self.find(location)
-
-        if content.import_path is not None:
-            output_directory = output_directory + '/' + os.path.dirname(content.import_path)
-
-        if not os.path.exists(output_directory):
-            os.makedirs(output_directory)
-
-        disk_fs = OSFS(output_directory)
-
-        with disk_fs.open(content.name, 'wb') as asset_file:
-            asset_file.write(content.data)
-
-    def export_all_for_course(self, course_location, output_directory, assets_policy_file):
+    def export(self, location, export_fs):
         """
-        Export all of this course's assets to the output_directory. Export all of the assets'
-        attributes to the policy file.
+        Copy the asset at `location` to `export_fs`, in chunks, at its import
+        path under the static directory.
+        """
+        content = self.find(location, as_stream=True)
+        try:
+            asset_dir = posixpath.join('static', posixpath.dirname(content.import_path or '')).rstrip('/')
+            export_fs.makedir(asset_dir, recursive=True, allow_recreate=True)
+            with export_fs.open(posixpath.join(asset_dir, content.name), 'wb') as asset_file:
+                for chunk in content.stream_data():
+                    asset_file.write(chunk)
+        finally:
+            content.close()
+
+    def export_all_for_course(self, course_location, export_fs, threads=1):
+        """
+        Export all of this course's assets to export_fs. Export all of the assets'
+        attributes to policies/assets.json in it.
 
         :param course_location: the Location of type 'course'
-        :param output_directory: the directory under which to put all the asset files
-        :param assets_policy_file: the filename for the policy file which should be in the same
-        directory as the other policy files.
+        :param export_fs: the filesystem (of the course's export) to put the asset files and policy file in
+        :param threads: how many assets to read from GridFS at once
         """
         policy = {}
         assets, __ = self.get_all_content_for_course(course_location)
 
-        for asset in assets:
-            asset_location = Location(asset['_id'])
-            self.export(asset_location, output_directory)
+        asset_locations = [Location(asset['_id']) for asset in assets]
+        pool = ThreadPool(threads)
+        try:
+            pool.map(partial(self.export, export_fs=export_fs), asset_locations)
+        finally:
+            pool.close()
+            pool.join()
+
+        for asset, asset_location in zip(assets, asset_locations):
             for attr, value in asset.iteritems():
                 if attr not in ['_id', 'md5', 'uploadDate', 'length', 'chunkSize']:
                     policy.setdefault(asset_location.name, {})[attr] = value
 
-        with open(assets_policy_file, 'w') as f:
-            json.dump(policy, f)
+        with export_fs.makeopendir('policies').open('assets.json', 'w') as assets_policy:
+            json.dump(policy, assets_policy)
 
     def get_all_content_thumbnails_for_course(self, location):
         return self._get_all_content_for_course(location, get_thumbnails=True)[0]
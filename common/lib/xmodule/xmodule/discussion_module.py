@@ -52,6 +52,9 @@ class DiscussionModule(DiscussionFields, XModule):
         }
         return self.system.render_template('discussion/_discussion_module.html', context)
 
+    def has_user_independent_student_view(self):
+        return True
+
 
 class DiscussionDescriptor(DiscussionFields, MetadataOnlyEditingDescriptor, RawDescriptor):
 
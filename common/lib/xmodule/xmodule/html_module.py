@@ -58,6 +58,9 @@ class HtmlModule(HtmlFields, XModule):
             return self.data.replace("%%USER_ID%%", self.system.anonymous_student_id)
         return self.data
 
+    def has_user_independent_student_view(self):
+        return "%%USER_ID%%" not in self.data
+
 
 class HtmlDescriptor(HtmlFields, XmlDescriptor, EditingDescriptor):
     """
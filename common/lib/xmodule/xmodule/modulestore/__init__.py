@@ -304,6 +304,12 @@ class Location(_LocationBase):
         return self._replace(**kwargs)
 
 
+# What listing a course needs to know about it, without loading it
+CourseSummary = namedtuple(
+    'CourseSummary', 'location display_name display_org_with_default display_number_with_default'
+)
+
+
 class ModuleStoreRead(object):
     """
     An abstract interface for a database backend that stores XModuleDescriptor
@@ -528,6 +534,34 @@ class ModuleStoreReadBase(ModuleStoreRead):
         """
         return {}
 
+    def get_course_version(self, course_id):
+        """
+        Return an opaque token which changes whenever a module of the course
+        changes, so that data derived from the course can be cached by it.
+
+        Returns None if this store doesn't track course versions, which is
+        the default.
+        """
+        return None
+
+    def get_course_summaries(self):
+        """
+        Return a list of the CourseSummary of every course in this modulestore.
+
+        The default loads every course: stores which can read the summaries
+        without doing so should override it.
+        """
+        # not at the top, as xmodule.error_module (through x_module) imports this module
+        from xmodule.error_module import ErrorDescriptor
+        return [
+            CourseSummary(
+                course.location, course.display_name,
+                course.display_org_with_default, course.display_number_with_default
+            )
+            for course in self.get_courses()
+            if not isinstance(course, ErrorDescriptor)
+        ]
+
     def get_course(self, course_id):
         """Default impl--linear search through course list"""
         for c in self.get_courses():
@@ -28,6 +28,9 @@ _MODULESTORES = {}
 
 FUNCTION_KEYS = ['render_template']
 
+# Options that name a Django cache (from settings.CACHES)
+CACHE_KEYS = ['shared_document_cache']
+
 
 def load_function(path):
     """
@@ -53,6 +56,10 @@ def create_modulestore_instance(engine, doc_store_config, options, i18n_service=
         if key in _options and isinstance(_options[key], basestring):
             _options[key] = load_function(_options[key])
 
+    for key in CACHE_KEYS:
+        if key in _options and isinstance(_options[key], basestring):
+            _options[key] = get_cache(_options[key])
+
     if HAS_REQUEST_CACHE:
         request_cache = RequestCache.get_request_cache()
     else:
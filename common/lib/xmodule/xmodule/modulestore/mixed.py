@@ -174,6 +174,13 @@ class MixedModuleStore(ModuleStoreWriteBase):
         store = self._get_modulestore_for_courseid(course_id)
         return store.get_parent_locations(location, course_id)
 
+    def get_course_version(self, course_id):
+        """
+        returns the version of the course with the given course_id (see
+        ModuleStoreReadBase.get_course_version)
+        """
+        return self._get_modulestore_for_courseid(course_id).get_course_version(course_id)
+
     def get_modulestore_type(self, course_id):
         """
         Returns a type which identifies which modulestore is servicing the given course_id.
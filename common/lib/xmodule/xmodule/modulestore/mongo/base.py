@@ -9,6 +9,7 @@ structure:
     'metadata': <dict containing all Scope.settings fields>
     'definition': <dict containing all Scope.content fields>
     'definition.children': <list of all child location.url()s>
+    'fingerprint': <md5 of the fields above, as last written by update_item>
 }
 """
 
@@ -16,11 +17,19 @@ import pymongo
 import sys
 import logging
 import copy
+import hashlib
+import json
+import threading
 
+from bson import BSON
 from bson.son import SON
+from collections import OrderedDict
+from contextlib import contextmanager
+from dogapi import dog_stats_api
 from fs.osfs import OSFS
 from itertools import repeat
 from path import path
+from uuid import uuid4
 
 from importlib import import_module
 from xmodule.errortracker import null_error_tracker, exc_info_to_str
@@ -30,7 +39,9 @@ from xblock.runtime import KvsFieldData
 from xblock.exceptions import InvalidScopeError
 from xblock.fields import Scope, ScopeIds
 
-from xmodule.modulestore import ModuleStoreWriteBase, Location, MONGO_MODULESTORE_TYPE
+from xmodule.modulestore import (
+    ModuleStoreWriteBase, Location, MONGO_MODULESTORE_TYPE, CourseSummary, prefer_xmodules
+)
 from xmodule.modulestore.exceptions import ItemNotFoundError
 from xmodule.modulestore.inheritance import own_metadata, InheritanceMixin, inherit_metadata, InheritanceKeyValueStore
 from xmodule.modulestore.xml import LocationReader
@@ -39,6 +50,18 @@ from xblock.core import XBlock
 
 log = logging.getLogger(__name__)
 
+# How many documents of a bulk write are looked up and inserted at once
+BULK_WRITE_BATCH_SIZE = 500
+
+
+def fingerprint(fields):
+    """
+    Return the fingerprint of `fields`, the fields set on a module document
+    by a write, which is stored along with them: writing fields with the same
+    fingerprint again doesn't change the document.
+    """
+    return hashlib.md5(json.dumps(fields, sort_keys=True, default=unicode)).hexdigest()
+
 
 def get_course_id_no_run(location):
     '''
@@ -244,6 +267,118 @@ def metadata_cache_key(location):
     return u"{0.org}/{0.course}".format(location)
 
 
+def parent_map_cache_key(location):
+    """Turn a `Location` into the cache key of the parent map of its course."""
+    return u"{0.org}/{0.course}/parent_map".format(location)
+
+
+# the cache key functions of the course trees computed from the same query
+COURSE_TREE_CACHE_KEYS = {
+    'metadata_inheritance': metadata_cache_key,
+    'parent_map': parent_map_cache_key,
+}
+
+
+def structure_version_cache_key(course_key):
+    """
+    Return the key under which the structure version of the course with
+    `metadata_cache_key` `course_key` is shared between processes.
+    """
+    return u"{0}/structure_version".format(course_key)
+
+
+class CachedCourse(object):
+    """
+    The cached documents of a course (see CourseStructureCache).
+    """
+    def __init__(self, version):
+        self.version = version
+        # Location -> document, or None if there is no document at Location
+        self.documents = {}
+        # whether `documents` holds every document of the course
+        self.complete = False
+
+
+class CourseStructureCache(object):
+    """
+    A bounded, thread-safe LRU cache of the module documents of the most
+    recently used courses, keyed by `metadata_cache_key`.
+
+    The entry of a course (a CachedCourse) maps the Location of every
+    document that has been looked up to the document as stored in the
+    collection, or to None if there is no document at that Location. Every
+    entry is tagged with the structure version of its course at the time it
+    was created, and is only returned for that version (see
+    `MongoModuleStore._structure_version`).
+    """
+    def __init__(self, max_courses):
+        self.max_courses = max_courses
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, course_key, version):
+        """
+        Return the CachedCourse of the course `course_key`, creating an empty
+        one if it isn't cached for `version`. Returns a tuple (entry, created).
+        """
+        with self._lock:
+            entry = self._entries.pop(course_key, None)
+            created = entry is None or entry.version != version
+            if created:
+                entry = CachedCourse(version)
+            self._entries[course_key] = entry
+            while len(self._entries) > self.max_courses:
+                self._entries.popitem(last=False)
+        return entry, created
+
+    def invalidate(self, course_key):
+        """
+        Drop the entry of the course `course_key`, if any.
+        """
+        with self._lock:
+            self._entries.pop(course_key, None)
+
+    def clear(self):
+        """
+        Drop all entries.
+        """
+        with self._lock:
+            self._entries.clear()
+
+
+# The CourseStructureCaches of this process, by the database and collection
+# they cache. All MongoModuleStores using the same collection share a cache,
+# so that writes through any of them invalidate it.
+_COURSE_STRUCTURE_CACHES = {}
+_COURSE_STRUCTURE_CACHES_LOCK = threading.Lock()
+
+
+def get_course_structure_cache(name, max_courses):
+    """
+    Return the process-wide CourseStructureCache called `name`, creating it
+    with room for `max_courses` courses if it doesn't exist yet.
+    """
+    with _COURSE_STRUCTURE_CACHES_LOCK:
+        if name not in _COURSE_STRUCTURE_CACHES:
+            _COURSE_STRUCTURE_CACHES[name] = CourseStructureCache(max_courses)
+        return _COURSE_STRUCTURE_CACHES[name]
+
+
+class BulkWrite(object):
+    """
+    The module writes to a course buffered by `MongoModuleStore.begin_bulk_write`.
+    """
+    def __init__(self, course_location):
+        self.course_location = course_location
+        # how many begin_bulk_write haven't been committed yet
+        self.depth = 0
+        # Location -> the fields to $set on its document, in write order
+        self.updates = OrderedDict()
+        # whether anything has been written to (or deleted from) the course
+        # (writes that wouldn't change a document are skipped)
+        self.dirty = False
+
+
 class MongoModuleStore(ModuleStoreWriteBase):
     """
     A Mongodb backed ModuleStore
@@ -257,9 +392,12 @@ class MongoModuleStore(ModuleStoreWriteBase):
                  default_class=None,
                  error_tracker=null_error_tracker,
                  i18n_service=None,
+                 course_cache_size=0,
                  **kwargs):
         """
         :param doc_store_config: must have a host, db, and collection entries. Other common entries: port, tz_aware.
+        :param course_cache_size: the number of courses whose documents are kept in the process-wide
+            CourseStructureCache of the collection. 0 disables the cache.
         """
 
         super(MongoModuleStore, self).__init__(**kwargs)
@@ -295,6 +433,8 @@ class MongoModuleStore(ModuleStoreWriteBase):
         self.collection.ensure_index(
             zip(('_id.' + field for field in Location._fields), repeat(1)),
         )
+        # and one over _id.category, to find the courses without scanning every module
+        self.collection.ensure_index('_id.category', background=True)
         # pylint: enable=no-member, protected_access
 
         if default_class is not None:
@@ -310,17 +450,46 @@ class MongoModuleStore(ModuleStoreWriteBase):
 
         self.ignore_write_events_on_courses = []
 
+        # the open BulkWrites, by org/course
+        self._bulk_writes = {}
+        self._bulk_writes_lock = threading.RLock()
+
+        # course location -> (md5 of its document, whether the document could be loaded)
+        self._course_documents_loading = {}
+
+        if course_cache_size:
+            self.course_structure_cache = get_course_structure_cache(
+                (repr(doc_store_config.get('host')), self.collection.full_name),
+                course_cache_size
+            )
+        else:
+            self.course_structure_cache = None
+
     def compute_metadata_inheritance_tree(self, location):
         '''
         TODO (cdodge) This method can be deleted when the 'split module store' work has been completed
         '''
+        return self._compute_inheritance_tree(self._query_course_tree_records(location))
+
+    def compute_parent_map(self, location):
+        """
+        Compute the parent map of the course of `location`: a dict mapping the
+        url of every module in the course that has a parent to the list of the
+        urls of its parents.
+        """
+        return self._compute_parent_map(self._query_course_tree_records(location))
+
+    def _query_course_tree_records(self, location):
+        """
+        Return the records used to compute the metadata inheritance tree and
+        the parent map of the course of `location`.
+        """
         # get all collections in the course, this query should not return any leaf nodes
         # note this is a bit ugly as when we add new categories of containers, we have to add it here
 
-        block_types_with_children = set(name for name, class_ in XBlock.load_classes() if getattr(class_, 'has_children', False))
         query = {'_id.org': location.org,
                  '_id.course': location.course,
-                 '_id.category': {'$in': list(block_types_with_children)}
+                 '_id.category': {'$in': list(self._block_types_with_children())}
                  }
         # we just want the Location, children, and inheritable metadata
         record_filter = {'_id': 1, 'definition.children': 1}
@@ -331,8 +500,23 @@ class MongoModuleStore(ModuleStoreWriteBase):
             record_filter['metadata.{0}'.format(field_name)] = 1
 
         # call out to the DB
-        resultset = self.collection.find(query, record_filter)
+        self._flush_bulk_writes()
+        return list(self.collection.find(query, record_filter))
 
+    @staticmethod
+    def _block_types_with_children():
+        """
+        Return the set of the block types that can have children.
+        """
+        return set(name for name, class_ in XBlock.load_classes() if getattr(class_, 'has_children', False))
+
+    @staticmethod
+    def _compute_inheritance_tree(resultset):
+        """
+        Compute the metadata inheritance tree from `resultset`, the records
+        of all the modules of a course that can have children, each holding
+        only the location, children and inheritable metadata of the module.
+        """
         results_by_url = {}
         root = None
 
@@ -379,17 +563,48 @@ class MongoModuleStore(ModuleStoreWriteBase):
 
         return metadata_to_inherit
 
+    @staticmethod
+    def _compute_parent_map(resultset):
+        """
+        Compute the parent map (see `compute_parent_map`) from `resultset`,
+        the records of all the modules of a course that can have children.
+        Must be called before `_compute_inheritance_tree`, which modifies
+        the records.
+        """
+        parent_map = {}
+        for result in resultset:
+            parent_url = Location(result['_id']).url()
+            for child in result.get('definition', {}).get('children', []):
+                parent_map.setdefault(child, []).append(parent_url)
+        return parent_map
+
     def get_cached_metadata_inheritance_tree(self, location, force_refresh=False):
         '''
         TODO (cdodge) This method can be deleted when the 'split module store' work has been completed
         '''
-        key = metadata_cache_key(location)
+        return self._get_cached_course_tree('metadata_inheritance', location, force_refresh)
+
+    def get_cached_parent_map(self, location, force_refresh=False):
+        """
+        Return the parent map (see `compute_parent_map`) of the course of
+        `location`, cached the same way as the metadata inheritance tree.
+        """
+        return self._get_cached_course_tree('parent_map', location, force_refresh)
+
+    def _get_cached_course_tree(self, tree_name, location, force_refresh=False):
+        """
+        Return the tree `tree_name` ('metadata_inheritance' or 'parent_map')
+        of the course of `location`, from the request cache or the caching
+        subsystem if possible. Otherwise, both trees are computed (from a
+        single query) and cached.
+        """
+        key = COURSE_TREE_CACHE_KEYS[tree_name](location)
         tree = {}
 
         if not force_refresh:
             # see if we are first in the request cache (if present)
-            if self.request_cache is not None and key in self.request_cache.data.get('metadata_inheritance', {}):
-                return self.request_cache.data['metadata_inheritance'][key]
+            if self.request_cache is not None and key in self.request_cache.data.get(tree_name, {}):
+                return self.request_cache.data[tree_name][key]
 
             # then look in any caching subsystem (e.g. memcached)
             if self.metadata_inheritance_cache_subsystem is not None:
@@ -399,32 +614,228 @@ class MongoModuleStore(ModuleStoreWriteBase):
 
         if not tree:
             # if not in subsystem, or we are on force refresh, then we have to compute
-            tree = self.compute_metadata_inheritance_tree(location)
+            # both trees, since they come from the same records
+            records = self._query_course_tree_records(location)
+            trees = {'parent_map': self._compute_parent_map(records)}
+            trees['metadata_inheritance'] = self._compute_inheritance_tree(records)
 
-            # now write out computed tree to caching subsystem (e.g. memcached), if available
+            # now write out computed trees to caching subsystem (e.g. memcached), if available
             if self.metadata_inheritance_cache_subsystem is not None:
-                self.metadata_inheritance_cache_subsystem.set(key, tree)
+                for name, computed_tree in trees.iteritems():
+                    self.metadata_inheritance_cache_subsystem.set(COURSE_TREE_CACHE_KEYS[name](location), computed_tree)
+            for name, computed_tree in trees.iteritems():
+                if name != tree_name:
+                    self._set_request_cached_course_tree(name, location, computed_tree)
+            tree = trees[tree_name]
 
         # now populate a request_cache, if available. NOTE, we are outside of the
         # scope of the above if: statement so that after a memcache hit, it'll get
         # put into the request_cache
-        if self.request_cache is not None:
-            # we can't assume the 'metadatat_inheritance' part of the request cache dict has been
-            # defined
-            if 'metadata_inheritance' not in self.request_cache.data:
-                self.request_cache.data['metadata_inheritance'] = {}
-            self.request_cache.data['metadata_inheritance'][key] = tree
+        self._set_request_cached_course_tree(tree_name, location, tree)
 
         return tree
 
+    def _set_request_cached_course_tree(self, tree_name, location, tree):
+        """
+        Store the tree `tree_name` of the course of `location` in the request cache, if available
+        """
+        if self.request_cache is not None:
+            # we can't assume the tree_name part of the request cache dict has been defined
+            self.request_cache.data.setdefault(tree_name, {})[COURSE_TREE_CACHE_KEYS[tree_name](location)] = tree
+
     def refresh_cached_metadata_inheritance_tree(self, location):
         """
-        Refresh the cached metadata inheritance tree for the org/course combination
-        for location
+        Refresh the cached metadata inheritance tree (and parent map) for the
+        org/course combination for location
         """
         pseudo_course_id = '/'.join([location.org, location.course])
+        if self.course_structure_cache is not None:
+            self.course_structure_cache.invalidate(metadata_cache_key(location))
         if pseudo_course_id not in self.ignore_write_events_on_courses:
             self.get_cached_metadata_inheritance_tree(location, force_refresh=True)
+            self._bump_structure_version(location)
+
+    def _structure_version(self, location):
+        """
+        Return the current structure version of the course of `location`.
+
+        Versions are shared between processes through the
+        metadata_inheritance_cache_subsystem (if there is none, course
+        structures are only invalidated within this process), and are looked
+        up at most once per request.
+        """
+        if self.metadata_inheritance_cache_subsystem is None:
+            return None
+
+        key = metadata_cache_key(location)
+        versions = self._request_structure_versions()
+        if versions is not None and key in versions:
+            return versions[key]
+
+        version_key = structure_version_cache_key(key)
+        version = self.metadata_inheritance_cache_subsystem.get(version_key)
+        if version is None:
+            # A version that has been evicted must not bring back entries
+            # tagged with it, so start over with a new one. If another process
+            # beats us to it, use theirs.
+            self.metadata_inheritance_cache_subsystem.add(version_key, uuid4().hex)
+            version = self.metadata_inheritance_cache_subsystem.get(version_key)
+
+        if versions is not None:
+            versions[key] = version
+        return version
+
+    def get_course_version(self, course_id):
+        """
+        Return the structure version of the course with the given course_id,
+        which changes whenever a module of the course is written.
+
+        Returns None if there is no metadata_inheritance_cache_subsystem to
+        share versions through.
+        """
+        return self._structure_version(Location('i4x', **Location.parse_course_id(course_id)))
+
+    def _bump_structure_version(self, location):
+        """
+        Start a new structure version for the course of `location`, so that
+        every process drops its cached documents of the course.
+        """
+        if self.metadata_inheritance_cache_subsystem is None:
+            return
+
+        key = metadata_cache_key(location)
+        version = uuid4().hex
+        self.metadata_inheritance_cache_subsystem.set(structure_version_cache_key(key), version)
+        versions = self._request_structure_versions()
+        if versions is not None:
+            versions[key] = version
+
+    def _request_structure_versions(self):
+        """
+        Return the dict of the structure versions looked up in the current
+        request, or None outside of requests: the request cache is only
+        cleared by the request middleware (which sets its `request`), so in
+        celery tasks and management commands the versions would never be
+        looked up again, and writes from other processes would go unnoticed.
+        """
+        if self.request_cache is None or getattr(self.request_cache, 'request', None) is None:
+            return None
+        return self.request_cache.data.setdefault('course_structure_versions', {})
+
+    def _find_items(self, locations):
+        """
+        Return the list of documents at `locations` (fully specified Locations).
+        Locations without a document are left out.
+
+        If the course structure cache is enabled, documents (and the absence
+        of documents) are served from the cache, and only the locations that
+        aren't cached yet are queried.
+        """
+        self._flush_bulk_writes()
+        if self.course_structure_cache is None:
+            return list(self.collection.find(
+                {'_id': {'$in': [namedtuple_to_son(location) for location in locations]}}
+            ))
+
+        # group the locations by course, and look each course up in the cache
+        found = []
+        missing = []
+        courses = {}
+        for location in locations:
+            course_key = metadata_cache_key(location)
+            if course_key not in courses:
+                courses[course_key] = self._cached_course(location)
+            cached_course = courses[course_key]
+            if location in cached_course.documents:
+                if cached_course.documents[location] is not None:
+                    found.append(copy.deepcopy(cached_course.documents[location]))
+            elif not cached_course.complete:
+                missing.append(location)
+
+        if missing:
+            dog_stats_api.increment('mongo_modulestore.course_cache.documents_queried', len(missing))
+            queried = {}
+            for item in self.collection.find({'_id': {'$in': [namedtuple_to_son(location) for location in missing]}}):
+                queried[Location(item['_id'])] = item
+            for location in missing:
+                item = queried.get(location)
+                courses[metadata_cache_key(location)].documents[location] = item
+                if item is not None:
+                    found.append(copy.deepcopy(item))
+
+        return found
+
+    def _cached_course(self, location):
+        """
+        Return the CachedCourse of the course of `location` from the course
+        structure cache, counting the hit or miss.
+        """
+        course_key = metadata_cache_key(location)
+        cached_course, created = self.course_structure_cache.get(course_key, self._structure_version(location))
+        dog_stats_api.increment(
+            'mongo_modulestore.course_cache.miss' if created else 'mongo_modulestore.course_cache.hit',
+            tags=[u'course:{}'.format(course_key)]
+        )
+        return cached_course
+
+    def _course_documents(self, location):
+        """
+        Return a list of all documents of the course of `location`, fetched
+        with a single query (or from the course structure cache, if enabled).
+        """
+        self._flush_bulk_writes()
+        if self.course_structure_cache is not None:
+            cached_course = self._cached_course(location)
+            if cached_course.complete:
+                return [copy.deepcopy(item) for item in cached_course.documents.itervalues() if item is not None]
+
+        query = {
+            '_id.org': location.org,
+            '_id.course': location.course,
+        }
+        documents = list(self.collection.find(query))
+
+        if self.course_structure_cache is not None:
+            cached_course.documents.update((Location(item['_id']), item) for item in documents)
+            cached_course.complete = True
+            documents = [copy.deepcopy(item) for item in documents]
+        return documents
+
+    def _prefetch_course(self, location):
+        """
+        Fetch the whole course of `location` at once. Returns a tuple of the
+        data cache (as built by `_cache_children`) for all modules of the
+        course, and the metadata inheritance tree of the course, which is
+        computed from the same documents.
+        """
+        documents = self._course_documents(location)
+
+        block_types_with_children = self._block_types_with_children()
+        inheritance_records = []
+        for item in documents:
+            if item['_id']['category'] in block_types_with_children:
+                metadata = item.get('metadata', {})
+                inheritance_records.append({
+                    '_id': item['_id'],
+                    'definition': {'children': list(item.get('definition', {}).get('children', []))},
+                    'metadata': {
+                        field_name: metadata[field_name]
+                        for field_name in InheritanceMixin.fields
+                        if field_name in metadata
+                    },
+                })
+        parent_map = self._compute_parent_map(inheritance_records)
+        tree = self._compute_inheritance_tree(inheritance_records)
+
+        # share the trees with later loads in this request, as get_cached_metadata_inheritance_tree does
+        self._set_request_cached_course_tree('metadata_inheritance', location, tree)
+        self._set_request_cached_course_tree('parent_map', location, parent_map)
+
+        data_cache = {}
+        for item in documents:
+            self._clean_item_data(item)
+            data_cache[Location(item['location'])] = item
+        return data_cache, tree
 
     def _clean_item_data(self, item):
         """
@@ -438,10 +849,7 @@ class MongoModuleStore(ModuleStoreWriteBase):
         Generate a pymongo in query for finding the items and return the payloads
         """
         # first get non-draft in a round-trip
-        query = {
-            '_id': {'$in': [namedtuple_to_son(Location(item)) for item in items]}
-        }
-        return list(self.collection.find(query))
+        return self._find_items([Location(item) for item in items])
 
     def _cache_children(self, items, depth=0):
         """
@@ -477,9 +885,10 @@ class MongoModuleStore(ModuleStoreWriteBase):
 
         return data
 
-    def _load_item(self, item, data_cache, apply_cached_metadata=True):
+    def _load_item(self, item, data_cache, apply_cached_metadata=True, metadata_inheritance_tree=None):
         """
-        Load an XModuleDescriptor from item, using the children stored in data_cache
+        Load an XModuleDescriptor from item, using the children stored in data_cache.
+        If `metadata_inheritance_tree` is given, it is used instead of the cached one.
         """
         location = Location(item['location'])
         data_dir = getattr(item, 'data_dir', location.course)
@@ -491,7 +900,10 @@ class MongoModuleStore(ModuleStoreWriteBase):
 
         cached_metadata = {}
         if apply_cached_metadata:
-            cached_metadata = self.get_cached_metadata_inheritance_tree(location)
+            if metadata_inheritance_tree is not None:
+                cached_metadata = metadata_inheritance_tree
+            else:
+                cached_metadata = self.get_cached_metadata_inheritance_tree(location)
 
         services = {}
         if self.i18n_service:
@@ -517,7 +929,15 @@ class MongoModuleStore(ModuleStoreWriteBase):
         """
         Load a list of xmodules from the data in items, with children cached up
         to specified depth
+
+        Loading a course with all its descendents (depth None) fetches the
+        whole course in a single query instead of one query per level.
         """
+        if depth is None and len(items) == 1 and items[0]['_id']['category'] == 'course':
+            data_cache, metadata_inheritance_tree = self._prefetch_course(Location(items[0]['_id']))
+            self._clean_item_data(items[0])
+            return [self._load_item(items[0], data_cache, metadata_inheritance_tree=metadata_inheritance_tree)]
+
         data_cache = self._cache_children(items, depth)
 
         # if we are loading a course object, if we're not prefetching children (depth != 0) then don't
@@ -540,28 +960,85 @@ class MongoModuleStore(ModuleStoreWriteBase):
             )
         ]
 
+    def get_course_summaries(self):
+        """
+        Return a list of the CourseSummary of every course, read from the
+        course documents with a single query (using the index over
+        `_id.category`).
+
+        Like get_courses, this leaves out the courses which can't be loaded
+        (and would be ErrorDescriptors), but a course is only loaded to find
+        out when its document has changed since the last time.
+        """
+        self._flush_bulk_writes()
+        display_name_default = XBlock.load_class('course', select=prefer_xmodules).display_name.default
+        items = self.collection.find({'_id.category': 'course'})
+        summaries = []
+        locations = set()
+        for item in items:
+            location = Location(item['_id'])
+            if location.org == 'edx' and location.course == 'templates':
+                continue
+            locations.add(location)
+            if not self._course_document_loads(location, item):
+                continue
+            metadata = item.get('metadata', {})
+            summaries.append(CourseSummary(
+                location,
+                metadata.get('display_name', display_name_default),
+                metadata.get('display_organization') or location.org,
+                metadata.get('display_coursenumber') or location.course,
+            ))
+
+        # forget the courses which have been deleted (possibly by other processes)
+        self._course_documents_loading = dict(
+            (location, loads) for location, loads in self._course_documents_loading.items()
+            if location in locations
+        )
+        return summaries
+
+    def _course_document_loads(self, location, item):
+        """
+        Return whether the course document `item` can be loaded, which is
+        remembered for as long as the document doesn't change.
+        """
+        digest = hashlib.md5(BSON.encode(item)).hexdigest()
+        loads = self._course_documents_loading.get(location)
+        if loads is None or loads[0] != digest:
+            course = self._load_items([copy.deepcopy(item)], 0)[0]
+            loads = self._course_documents_loading[location] = (digest, not isinstance(course, ErrorDescriptor))
+        return loads[1]
+
     def _find_one(self, location):
         '''Look for a given location in the collection.  If revision is not
         specified, returns the latest.  If the item is not present, raise
         ItemNotFoundError.
         '''
-        item = self.collection.find_one(
-            location_to_query(location, wildcard=False),
-            sort=[('revision', pymongo.ASCENDING)],
-        )
+        if self.course_structure_cache is not None:
+            items = self._find_items([Location(location)])
+            item = items[0] if items else None
+        else:
+            self._flush_bulk_writes()
+            item = self.collection.find_one(
+                location_to_query(location, wildcard=False),
+                sort=[('revision', pymongo.ASCENDING)],
+            )
         if item is None:
             raise ItemNotFoundError(location)
         return item
 
-    def get_course(self, course_id):
+    def get_course(self, course_id, depth=0):
         """
         Get the course with the given courseid (org/course/run)
+
+        depth (int): the number of levels of descendents to prefetch. None
+            prefetches the whole course, with a single query.
         """
         id_components = Location.parse_course_id(course_id)
         id_components['tag'] = 'i4x'
         id_components['category'] = 'course'
         try:
-            return self.get_item(Location(id_components))
+            return self.get_item(Location(id_components), depth=depth)
         except ItemNotFoundError:
             return None
 
@@ -609,6 +1086,7 @@ class MongoModuleStore(ModuleStoreWriteBase):
         return self.get_item(location, depth=depth)
 
     def get_items(self, location, course_id=None, depth=0, qualifiers=None):
+        self._flush_bulk_writes()
         items = self.collection.find(
             location_to_query(location),
             sort=[('revision', pymongo.ASCENDING)],
@@ -727,6 +1205,147 @@ class MongoModuleStore(ModuleStoreWriteBase):
             self.modulestore_update_signal.send(self, modulestore=self, course_id=course_id,
                                                 location=location)
 
+    def begin_bulk_write(self, course_location):
+        """
+        Start buffering the module writes to the course of `course_location`,
+        until `commit_bulk_write` is called (as many times as this was).
+
+        Buffered writes are written in batches when a module of this store
+        is read and at commit, skipping those which wouldn't change their
+        document (see `fingerprint`). The metadata inheritance tree of the
+        course is refreshed, and the update signal fired, once for all of
+        them, at commit.
+        """
+        course_id = get_course_id_no_run(course_location)
+        with self._bulk_writes_lock:
+            bulk_write = self._bulk_writes.get(course_id)
+            if bulk_write is None:
+                bulk_write = self._bulk_writes[course_id] = BulkWrite(course_location)
+            bulk_write.depth += 1
+
+    def commit_bulk_write(self, course_location):
+        """
+        Write the buffered writes to the course of `course_location` (see
+        `begin_bulk_write`), then refresh the metadata inheritance tree of the
+        course and fire the update signal, if anything was written.
+
+        Returns whether anything was written to the course during the bulk
+        write (always False for nested bulk writes).
+        """
+        course_id = get_course_id_no_run(course_location)
+        with self._bulk_writes_lock:
+            bulk_write = self._bulk_writes[course_id]
+            bulk_write.depth -= 1
+            if bulk_write.depth > 0:
+                return False
+            del self._bulk_writes[course_id]
+            try:
+                self._flush_bulk_write(bulk_write)
+            finally:
+                if bulk_write.dirty:
+                    self.refresh_cached_metadata_inheritance_tree(course_location)
+                    self.fire_updated_modulestore_signal(course_id, course_location)
+        return bulk_write.dirty
+
+    @contextmanager
+    def bulk_write_operations(self, course_location):
+        """
+        A context manager buffering the module writes to the course of
+        `course_location` made within it (see `begin_bulk_write`).
+        """
+        self.begin_bulk_write(course_location)
+        try:
+            yield
+        finally:
+            self.commit_bulk_write(course_location)
+
+    def _get_bulk_write(self, location):
+        """
+        Return the open BulkWrite to the course of `location`, or None.
+        """
+        with self._bulk_writes_lock:
+            return self._bulk_writes.get(get_course_id_no_run(location))
+
+    def _flush_bulk_writes(self):
+        """
+        Write the buffered writes of all the open bulk writes, so that they
+        can be read back.
+        """
+        if not self._bulk_writes:
+            return
+        with self._bulk_writes_lock:
+            for bulk_write in self._bulk_writes.values():
+                self._flush_bulk_write(bulk_write)
+
+    def _flush_bulk_write(self, bulk_write):
+        """
+        Write the buffered writes of `bulk_write`: the documents which don't
+        exist yet are inserted in batches, the others updated one by one,
+        unless their fingerprint shows the update wouldn't change them.
+        """
+        if not bulk_write.updates:
+            return
+        updates = bulk_write.updates.items()
+        bulk_write.updates = OrderedDict()
+
+        unchanged = 0
+        for start in xrange(0, len(updates), BULK_WRITE_BATCH_SIZE):
+            batch = [
+                (location, dict(update, fingerprint=fingerprint(update)))
+                for location, update in updates[start:start + BULK_WRITE_BATCH_SIZE]
+            ]
+            # Location -> fingerprint of the existing documents
+            existing = dict(
+                (Location(item['_id']), item.get('fingerprint'))
+                for item in self.collection.find(
+                    {'_id': {'$in': [namedtuple_to_son(location) for location, __ in batch]}},
+                    {'_id': True, 'fingerprint': True}
+                )
+            )
+
+            updated = [
+                (location, update) for location, update in batch
+                if location in existing and existing[location] != update['fingerprint']
+            ]
+            created = [(location, update) for location, update in batch if location not in existing]
+            unchanged += len(batch) - len(updated) - len(created)
+            if not (updated or created):
+                continue
+
+            bulk_write.dirty = True
+            if self.course_structure_cache is not None:
+                self.course_structure_cache.invalidate(metadata_cache_key(bulk_write.course_location))
+            if created:
+                try:
+                    self.collection.insert(
+                        [self._new_document(location, update) for location, update in created],
+                        safe=self.collection.safe
+                    )
+                except pymongo.errors.DuplicateKeyError:
+                    # some were created meanwhile: upsert all of them instead
+                    updated.extend(created)
+
+            for location, update in updated:
+                self._write_single_item(location, update)
+
+        if unchanged:
+            dog_stats_api.increment('mongo_modulestore.bulk_write.unchanged', unchanged)
+
+    @staticmethod
+    def _new_document(location, update):
+        """
+        Return the document of a new module at `location`, with the fields
+        set by `update` (the $set of `_update_single_item`).
+        """
+        document = {'_id': namedtuple_to_son(location)}
+        for key, value in update.iteritems():
+            parent = document
+            path = key.split('.')
+            for name in path[:-1]:
+                parent = parent.setdefault(name, {})
+            parent[path[-1]] = value
+        return document
+
     def _get_course_for_item(self, location, depth=0):
         '''
         VS[compat]
@@ -758,8 +1377,27 @@ class MongoModuleStore(ModuleStoreWriteBase):
         """
         Set update on the specified item, and raises ItemNotFoundError
         if the location doesn't exist
+
+        If a bulk write to the course of the item is open, the update is
+        buffered until the next read or the commit of the bulk write.
+
+        `update` must hold all the fields written by `update_item`, as the
+        fingerprint of the document is set from it.
         """
+        location = Location(location)
+        with self._bulk_writes_lock:
+            bulk_write = self._bulk_writes.get(get_course_id_no_run(location))
+            if bulk_write is not None:
+                bulk_write.updates.setdefault(location, {}).update(copy.deepcopy(update))
+                return
+
+        self._write_single_item(location, dict(update, fingerprint=fingerprint(update)))
 
+    def _write_single_item(self, location, update):
+        """
+        Set update on the document at `location` (creating it if need be),
+        and raises ItemNotFoundError if it couldn't be written
+        """
         # See http://www.mongodb.org/display/DOCS/Updating for
         # atomic update syntax
         result = self.collection.update(
@@ -805,9 +1443,11 @@ class MongoModuleStore(ModuleStoreWriteBase):
 
             # recompute (and update) the metadata inheritance tree which is cached
             # was conditional on children or metadata having changed before dhm made one update to rule them all
-            self.refresh_cached_metadata_inheritance_tree(xblock.location)
-            # fire signal that we've written to DB
-            self.fire_updated_modulestore_signal(get_course_id_no_run(xblock.location), xblock.location)
+            # (bulk writes do it once, when committed)
+            if self._get_bulk_write(xblock.location) is None:
+                self.refresh_cached_metadata_inheritance_tree(xblock.location)
+                # fire signal that we've written to DB
+                self.fire_updated_modulestore_signal(get_course_id_no_run(xblock.location), xblock.location)
         except ItemNotFoundError:
             if not allow_not_found:
                 raise
@@ -830,21 +1470,32 @@ class MongoModuleStore(ModuleStoreWriteBase):
             course.tabs = [tab for tab in existing_tabs if tab.get('url_slug') != location.name]
             self.update_item(course, '**replace_user**')
 
+        # buffered writes to the item must not bring it back
+        self._flush_bulk_writes()
         # Must include this to avoid the django debug toolbar (which defines the deprecated "safe=False")
         # from overriding our default value set in the init method.
         self.collection.remove({'_id': Location(location).dict()}, safe=self.collection.safe)
-        # recompute (and update) the metadata inheritance tree which is cached
-        self.refresh_cached_metadata_inheritance_tree(Location(location))
-        self.fire_updated_modulestore_signal(get_course_id_no_run(Location(location)), Location(location))
+        self._course_documents_loading.pop(Location(location), None)
+        bulk_write = self._get_bulk_write(Location(location))
+        if bulk_write is not None:
+            bulk_write.dirty = True
+            if self.course_structure_cache is not None:
+                self.course_structure_cache.invalidate(metadata_cache_key(Location(location)))
+        else:
+            # recompute (and update) the metadata inheritance tree which is cached
+            self.refresh_cached_metadata_inheritance_tree(Location(location))
+            self.fire_updated_modulestore_signal(get_course_id_no_run(Location(location)), Location(location))
 
     def get_parent_locations(self, location, course_id):
         '''Find all locations that are the parents of this location in this
         course.  Needed for path_to_location().
+
+        Parents are looked up in the cached parent map of the course, which is
+        recomputed along with the metadata inheritance tree on every write.
         '''
         location = Location.ensure_fully_specified(location)
-        items = self.collection.find({'definition.children': location.url()},
-                                     {'_id': True})
-        return [Location(i['_id']) for i in items]
+        parent_map = self.get_cached_parent_map(location)
+        return [Location(parent_url) for parent_url in parent_map.get(location.url(), [])]
 
     def get_modulestore_type(self, course_id):
         """
@@ -861,6 +1512,7 @@ class MongoModuleStore(ModuleStoreWriteBase):
         Return an array all of the locations for orphans in the course.
         """
         detached_categories = [name for name, __ in XBlock.load_tagged_classes("detached")]
+        self._flush_bulk_writes()
         all_items = self.collection.find({
             '_id.org': course_location.org,
             '_id.course': course_location.course,
@@ -875,12 +1527,29 @@ class MongoModuleStore(ModuleStoreWriteBase):
         item_locs -= all_reachable
         return list(item_locs)
 
+    def get_course_module_locations(self, course_location):
+        """
+        Return the set of the Locations of all the modules (not the drafts)
+        of the course of `course_location`.
+        """
+        self._flush_bulk_writes()
+        items = self.collection.find(
+            {
+                '_id.org': course_location.org,
+                '_id.course': course_location.course,
+                '_id.revision': None,
+            },
+            {'_id': True}
+        )
+        return set(Location(item['_id']) for item in items)
+
     def get_courses_for_wiki(self, wiki_slug):
         """
         Return the list of courses which use this wiki_slug
         :param wiki_slug: the course wiki root slug
         :return: list of course locations
         """
+        self._flush_bulk_writes()
         courses = self.collection.find({'definition.data.wiki_slug': wiki_slug})
         return [Location(course['_id']) for course in courses]
 
@@ -139,6 +139,7 @@ class DraftModuleStore(MongoModuleStore):
 
         :param source: the location of the source (its revision must be None)
         """
+        self._flush_bulk_writes()
         original = self.collection.find_one(location_to_query(source_location))
         draft_location = as_draft(source_location)
         if draft_location.category in DIRECT_ONLY_CATEGORIES:
@@ -229,6 +230,17 @@ class DraftModuleStore(MongoModuleStore):
         self.convert_to_draft(location)
         super(DraftModuleStore, self).delete_item(location)
 
+    def _prefetch_course(self, location):
+        """
+        Fetch the whole course of `location` at once, leaving the published
+        version of drafted modules out of the data cache (as
+        `_query_children_for_cache_children` does), so they are read as drafts.
+        """
+        data_cache, metadata_inheritance_tree = super(DraftModuleStore, self)._prefetch_course(location)
+        for draft_location in [loc for loc in data_cache if loc.revision == DRAFT]:
+            data_cache.pop(as_published(draft_location), None)
+        return data_cache, metadata_inheritance_tree
+
     def _query_children_for_cache_children(self, items):
         # first get non-draft in a round-trip
         to_process_non_drafts = super(DraftModuleStore, self)._query_children_for_cache_children(items)
@@ -238,10 +250,7 @@ class DraftModuleStore(MongoModuleStore):
             to_process_dict[Location(non_draft["_id"])] = non_draft
 
         # now query all draft content in another round-trip
-        query = {
-            '_id': {'$in': [namedtuple_to_son(as_draft(Location(item))) for item in items]}
-        }
-        to_process_drafts = list(self.collection.find(query))
+        to_process_drafts = self._find_items([as_draft(Location(item)) for item in items])
 
         # now we have to go through all drafts and replace the non-draft
         # with the draft. This is because the semantics of the DraftStore is to
@@ -8,18 +8,55 @@ class DefinitionLazyLoader(object):
     object doesn't force access during init but waits until client wants the
     definition. Only works if the modulestore is a split mongo store.
     """
-    def __init__(self, modulestore, definition_id):
+    def __init__(self, modulestore, definition_id, batch=None):
         """
         Simple placeholder for yet-to-be-fetched data
         :param modulestore: the pymongo db connection with the definitions
         :param definition_locator: the id of the record in the above to fetch
+        :param batch: the DefinitionBatch this loader belongs to, if any
         """
         self.modulestore = modulestore
         self.definition_locator = DefinitionLocator(definition_id)
+        self.batch = batch
 
     def fetch(self):
         """
         Fetch the definition. Note, the caller should replace this lazy
         loader pointer with the result so as not to fetch more than once
         """
+        if self.batch is not None:
+            definition = self.batch.fetch(self.definition_locator.definition_id)
+            if definition is not None:
+                return definition
         return self.modulestore.db_connection.get_definition(self.definition_locator.definition_id)
+
+
+class DefinitionBatch(object):
+    """
+    A group of DefinitionLazyLoaders (e.g. those of sibling blocks) whose
+    definitions are all fetched with a single query the first time any of
+    them is fetched.
+    """
+    def __init__(self, modulestore):
+        self.modulestore = modulestore
+        self.definition_ids = []
+        self.definitions = None
+
+    def lazy_loader(self, definition_id):
+        """
+        Return a DefinitionLazyLoader for `definition_id` which belongs to this batch
+        """
+        self.definition_ids.append(definition_id)
+        return DefinitionLazyLoader(self.modulestore, definition_id, self)
+
+    def fetch(self, definition_id):
+        """
+        Return the definition with id `definition_id`, fetching the
+        definitions of the whole batch if that hasn't happened yet. Each
+        definition is handed out once (several blocks can share a definition,
+        and must not share the fetched object); returns None if it already was
+        or doesn't exist.
+        """
+        if self.definitions is None:
+            self.definitions = self.modulestore.db_connection.get_definitions(self.definition_ids)
+        return self.definitions.pop(definition_id, None)
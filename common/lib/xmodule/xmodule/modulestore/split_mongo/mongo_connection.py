@@ -1,17 +1,192 @@
 """
 Segregation of pymongo functions from the data modeling mechanisms for split modulestore.
 """
+import threading
+from collections import OrderedDict
+from uuid import uuid4
+
 import pymongo
+from bson import BSON
+from dogapi import dog_stats_api
+
+
+class DocumentCache(object):
+    """
+    A bounded, thread-safe LRU cache of documents (structures and
+    definitions), keyed by their ids, which is shared by all threads of the
+    process. It can be backed by a second tier: any cache with get, set, add
+    and delete (e.g. a memcached Django cache) shared between processes.
+
+    Documents are stored BSON encoded, which takes less memory than the
+    decoded documents and means every lookup returns a fresh copy that the
+    caller is free to modify.
+
+    Definitions are immutable. Structures are too, except for the few low
+    level operations which update them in place (see split.py), so with a
+    shared tier each structure has a generation there, which is changed when
+    the structure is updated: the cached copies of a structure (in any
+    process) are tagged with the generation they were read under, and only
+    used while it is current. Without a shared tier, updates in place are
+    only seen by this process.
+    """
+    # The kinds of documents which can be updated in place
+    MUTABLE_KINDS = ('structure',)
+
+    def __init__(self, max_size, name, shared_cache=None, tz_aware=True):
+        """
+        :param max_size: the maximum number of documents kept in this process
+        :param name: prefix of the keys in `shared_cache`, to tell apart the documents of different collections
+        :param shared_cache: the optional second tier
+        :param tz_aware: whether decoded datetimes should be timezone aware
+        """
+        self.max_size = max_size
+        self.name = name
+        self.shared_cache = shared_cache
+        self.tz_aware = tz_aware
+        # (kind, key) -> (generation, encoded document)
+        self._documents = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _shared_key(self, kind, key, generation=None):
+        """
+        Return the key of a document in the shared cache.
+        """
+        if generation is None:
+            return u"{}/{}/{}".format(self.name, kind, key)
+        return u"{}/{}/{}/{}".format(self.name, kind, key, generation)
+
+    def _generation(self, kind, key):
+        """
+        Return the current generation of the document of `kind` with id
+        `key`, or None if documents of `kind` are never updated in place (or
+        there is no shared cache to keep generations in).
+        """
+        if kind not in self.MUTABLE_KINDS or self.shared_cache is None:
+            return None
+
+        generation_key = self._shared_key(u'{}-generation'.format(kind), key)
+        generation = self.shared_cache.get(generation_key)
+        if generation is None:
+            # A generation that has been evicted must not bring back copies
+            # tagged with it, so start over with a new one. If another process
+            # beats us to it, use theirs.
+            self.shared_cache.add(generation_key, uuid4().hex)
+            generation = self.shared_cache.get(generation_key)
+        return generation
+
+    def get(self, kind, key):
+        """
+        Return the document of `kind` ('structure' or 'definition') with id
+        `key`, or None if it isn't cached.
+        """
+        return self.lookup(kind, key)[0]
+
+    def lookup(self, kind, key):
+        """
+        Return (the document of `kind` with id `key` or None if it isn't
+        cached, the generation it was looked up under). The generation is to
+        be passed to `set` when caching a document loaded after a miss, so
+        that an update in place made meanwhile isn't missed.
+        """
+        generation = self._generation(kind, key)
+        with self._lock:
+            entry = self._documents.pop((kind, key), None)
+            if entry is not None and entry[0] == generation:
+                self._documents[(kind, key)] = entry
+                encoded = entry[1]
+            else:
+                encoded = None
+
+        if encoded is None and self.shared_cache is not None:
+            encoded = self.shared_cache.get(self._shared_key(kind, key, generation))
+            if encoded is not None:
+                self._store(kind, key, generation, encoded)
+
+        dog_stats_api.increment(
+            'split_modulestore.document_cache.{}'.format('miss' if encoded is None else 'hit'),
+            tags=[u'kind:{}'.format(kind)]
+        )
+        if encoded is None:
+            return None, generation
+        return BSON(encoded).decode(tz_aware=self.tz_aware), generation
+
+    def set(self, kind, key, document, generation=None):
+        """
+        Cache `document` of `kind` under the id `key`, for `generation` (as
+        returned by `lookup` before the document was loaded) or else the
+        current generation.
+        """
+        if generation is None:
+            generation = self._generation(kind, key)
+        encoded = BSON.encode(document)
+        self._store(kind, key, generation, encoded)
+        if self.shared_cache is not None:
+            self.shared_cache.set(self._shared_key(kind, key, generation), encoded)
+
+    def delete(self, kind, key):
+        """
+        Drop the document of `kind` with id `key` from both tiers, and from
+        the other processes sharing the second tier. Only needed for documents
+        that are updated in place.
+        """
+        with self._lock:
+            self._documents.pop((kind, key), None)
+        if self.shared_cache is not None:
+            if kind in self.MUTABLE_KINDS:
+                # every process checks the generation before using its copy
+                self.shared_cache.set(self._shared_key(u'{}-generation'.format(kind), key), uuid4().hex)
+            else:
+                self.shared_cache.delete(self._shared_key(kind, key))
+
+    def clear(self):
+        """
+        Drop all documents from this process (but not from the shared cache).
+        """
+        with self._lock:
+            self._documents.clear()
+
+    def _store(self, kind, key, generation, encoded):
+        """
+        Store the encoded document in this process, evicting the least recently used ones.
+        """
+        with self._lock:
+            self._documents.pop((kind, key), None)
+            self._documents[(kind, key)] = (generation, encoded)
+            while len(self._documents) > self.max_size:
+                self._documents.popitem(last=False)
+
+
+# The DocumentCaches of this process, by the collections they cache
+_DOCUMENT_CACHES = {}
+_DOCUMENT_CACHES_LOCK = threading.Lock()
+
+
+def get_document_cache(name, max_size, shared_cache=None, tz_aware=True):
+    """
+    Return the process-wide DocumentCache called `name`, creating it if it
+    doesn't exist yet (see DocumentCache for the arguments).
+    """
+    with _DOCUMENT_CACHES_LOCK:
+        if name not in _DOCUMENT_CACHES:
+            _DOCUMENT_CACHES[name] = DocumentCache(max_size, name, shared_cache, tz_aware)
+        return _DOCUMENT_CACHES[name]
+
 
 class MongoConnection(object):
     """
     Segregation of pymongo functions from the data modeling mechanisms for split modulestore.
     """
     def __init__(
-        self, db, collection, host, port=27017, tz_aware=True, user=None, password=None, **kwargs
+        self, db, collection, host, port=27017, tz_aware=True, user=None, password=None,
+        document_cache_size=0, shared_document_cache=None, **kwargs
     ):
         """
         Create & open the connection, authenticate, and provide pointers to the collections
+
+        :param document_cache_size: the number of structures and definitions kept in the process-wide
+            DocumentCache of these collections. 0 disables the cache.
+        :param shared_document_cache: optional cache shared between processes (e.g. memcached) backing
+            the DocumentCache
         """
         self.database = pymongo.database.Database(
             pymongo.MongoClient(
@@ -38,11 +213,36 @@ class MongoConnection(object):
         self.structures.write_concern = {'w': 1}
         self.definitions.write_concern = {'w': 1}
 
+        if document_cache_size:
+            self.document_cache = get_document_cache(
+                u"{}/{}.{}".format(host, db, collection),
+                document_cache_size,
+                shared_document_cache,
+                tz_aware
+            )
+        else:
+            self.document_cache = None
+
     def get_structure(self, key):
         """
         Get the structure from the persistence mechanism whose id is the given key
         """
-        return self.structures.find_one({'_id': key})
+        return self._get_cached('structure', key, self.structures)
+
+    def _get_cached(self, kind, key, collection):
+        """
+        Get the document of `kind` with the given key from the document cache,
+        or else from `collection` (and cache it).
+        """
+        if self.document_cache is None:
+            return collection.find_one({'_id': key})
+
+        document, generation = self.document_cache.lookup(kind, key)
+        if document is None:
+            document = collection.find_one({'_id': key})
+            if document is not None:
+                self.document_cache.set(kind, key, document, generation)
+        return document
 
     def find_matching_structures(self, query):
         """
@@ -56,12 +256,19 @@ class MongoConnection(object):
         Create the structure in the db
         """
         self.structures.insert(structure)
+        if self.document_cache is not None:
+            self.document_cache.set('structure', structure['_id'], structure)
 
     def update_structure(self, structure):
         """
         Update the db record for structure
         """
         self.structures.update({'_id': structure['_id']}, structure)
+        # structures are only updated in place by a few low level operations (see split.py),
+        # which is the one case where a cached document can become stale: this makes every
+        # process sharing the document cache's second tier drop its copy
+        if self.document_cache is not None:
+            self.document_cache.delete('structure', structure['_id'])
 
     def get_course_index(self, key):
         """
@@ -98,7 +305,29 @@ class MongoConnection(object):
         """
         Get the definition from the persistence mechanism whose id is the given key
         """
-        return self.definitions.find_one({'_id': key})
+        return self._get_cached('definition', key, self.definitions)
+
+    def get_definitions(self, keys):
+        """
+        Get the definitions whose ids are in `keys`, with a single query (or
+        none, if they are all cached). Returns a dict mapping id -> definition,
+        which leaves out the ids that don't exist.
+        """
+        definitions = {}
+        missing = []
+        for key in set(keys):
+            definition = self.document_cache.get('definition', key) if self.document_cache is not None else None
+            if definition is None:
+                missing.append(key)
+            else:
+                definitions[key] = definition
+
+        if missing:
+            for definition in self.definitions.find({'_id': {'$in': missing}}):
+                definitions[definition['_id']] = definition
+                if self.document_cache is not None:
+                    self.document_cache.set('definition', definition['_id'], definition)
+        return definitions
 
     def find_matching_definitions(self, query):
         """
@@ -112,5 +341,7 @@ class MongoConnection(object):
         Create the definition in the db
         """
         self.definitions.insert(definition)
+        if self.document_cache is not None:
+            self.document_cache.set('definition', definition['_id'], definition)
 
 
@@ -63,7 +63,7 @@ from xmodule.modulestore.exceptions import InsufficientSpecificationError, Versi
 from xmodule.modulestore import inheritance, ModuleStoreWriteBase, Location, SPLIT_MONGO_MODULESTORE_TYPE
 
 from ..exceptions import ItemNotFoundError
-from .definition_lazy_loader import DefinitionLazyLoader
+from .definition_lazy_loader import DefinitionLazyLoader, DefinitionBatch
 from .caching_descriptor_system import CachingDescriptorSystem
 from xblock.fields import Scope
 from bson.objectid import ObjectId
@@ -106,15 +106,24 @@ class SplitMongoModuleStore(ModuleStoreWriteBase):
                  error_tracker=null_error_tracker,
                  loc_mapper=None,
                  i18n_service=None,
+                 document_cache_size=0,
+                 shared_document_cache=None,
                  **kwargs):
         """
         :param doc_store_config: must have a host, db, and collection entries. Other common entries: port, tz_aware.
+        :param document_cache_size: the number of structures and definitions to keep in memory, shared by all
+            threads of the process. 0 (the default) disables the cache.
+        :param shared_document_cache: optional cache (e.g. memcached) backing the in-memory document cache
         """
 
         super(SplitMongoModuleStore, self).__init__(**kwargs)
         self.loc_mapper = loc_mapper
 
-        self.db_connection = MongoConnection(**doc_store_config)
+        self.db_connection = MongoConnection(
+            document_cache_size=document_cache_size,
+            shared_document_cache=shared_document_cache,
+            **doc_store_config
+        )
         self.db = self.db_connection.database
 
         # Code review question: How should I expire entries?
@@ -151,16 +160,27 @@ class SplitMongoModuleStore(ModuleStoreWriteBase):
             )
 
         if lazy:
-            for block in new_module_data.itervalues():
-                block['definition'] = DefinitionLazyLoader(self, block['definition'])
+            # The definitions of sibling blocks are fetched together, with one query, when the
+            # first of them is needed; the definitions of untouched subtrees aren't fetched.
+            parents = {}
+            for block_id, block in new_module_data.iteritems():
+                for child in block['fields'].get('children', []):
+                    if child in new_module_data:
+                        parents[child] = block_id
+            batches = {}
+            for block_id, block in new_module_data.iteritems():
+                if isinstance(block['definition'], DefinitionLazyLoader):
+                    # already made lazy by an earlier call
+                    continue
+                parent = parents.get(block_id)
+                if parent not in batches:
+                    batches[parent] = DefinitionBatch(self)
+                block['definition'] = batches[parent].lazy_loader(block['definition'])
         else:
             # Load all descendants by id
-            descendent_definitions = self.db_connection.find_matching_definitions({
-                '_id': {'$in': [block['definition']
-                                for block in new_module_data.itervalues()]}})
-            # turn into a map
-            definitions = {definition['_id']: definition
-                           for definition in descendent_definitions}
+            definitions = self.db_connection.get_definitions(
+                [block['definition'] for block in new_module_data.itervalues()]
+            )
 
             for block in new_module_data.itervalues():
                 if block['definition'] in definitions:
@@ -242,8 +262,8 @@ class SplitMongoModuleStore(ModuleStoreWriteBase):
 
         :param course_locator: any subclass of CourseLocator
         '''
-        # NOTE: if and when this uses cache, the update if changed logic will break if the cache
-        # holds the same objects as the descriptors!
+        # NOTE: the update if changed logic would break if a cache held the same objects as
+        # the descriptors; the db_connection's document cache returns a fresh copy on every get.
         if not course_locator.is_fully_specified():
             raise InsufficientSpecificationError('Not fully specified: %s' % course_locator)
 
@@ -6,6 +6,7 @@ from itertools import ifilter
 # pylint: enable=E0611
 import pymongo
 import logging
+from mock import Mock, patch
 from uuid import uuid4
 
 from xblock.fields import Scope
@@ -13,8 +14,9 @@ from xblock.runtime import KeyValueStore
 from xblock.exceptions import InvalidScopeError
 
 from xmodule.tests import DATA_DIR
-from xmodule.modulestore import Location, MONGO_MODULESTORE_TYPE
+from xmodule.modulestore import Location, MONGO_MODULESTORE_TYPE, ModuleStoreReadBase
 from xmodule.modulestore.mongo import MongoModuleStore, MongoKeyValueStore
+from xmodule.modulestore.mongo.base import CourseStructureCache
 from xmodule.modulestore.draft import DraftModuleStore
 from xmodule.modulestore.xml_importer import import_from_xml, perform_xlint
 from xmodule.contentstore.mongo import MongoContentStore
@@ -22,6 +24,7 @@ from xmodule.contentstore.mongo import MongoContentStore
 from xmodule.modulestore.tests.test_modulestore import check_path_to_location
 from IPython.testing.nose_assert_methods import assert_in
 from xmodule.exceptions import NotFoundError
+from xmodule.error_module import ErrorDescriptor
 from xmodule.modulestore.exceptions import InsufficientSpecificationError
 
 log = logging.getLogger(__name__)
@@ -140,6 +143,37 @@ class TestMongoModuleStore(object):
         assert self.course_with_id_exists('edX/test_unicode/2012_Fall')
         assert self.course_with_id_exists('edX/toy/2012_Fall')
 
+    def test_get_course_summaries(self):
+        '''Make sure the course summaries are those of the courses, which are only loaded once'''
+        expected = ModuleStoreReadBase.get_course_summaries(self.store)
+        self.store.get_course_summaries()
+        with patch.object(self.store, '_load_items') as load_items:
+            summaries = self.store.get_course_summaries()
+        assert_false(load_items.called)
+        assert_equals(len(summaries), 5)
+        assert_equals(
+            sorted(summaries, key=lambda summary: summary.location.url()),
+            sorted(expected, key=lambda summary: summary.location.url())
+        )
+
+    def test_get_course_summaries_skips_errors(self):
+        '''Make sure the courses which can't be loaded are left out, as by get_courses'''
+        store = MongoModuleStore(
+            {'host': HOST, 'db': DB, 'collection': COLLECTION}, FS_ROOT, RENDER_TEMPLATE,
+            default_class=DEFAULT_CLASS
+        )
+        with patch.object(store, '_load_items', return_value=[Mock(spec=ErrorDescriptor)]):
+            assert_equals(store.get_course_summaries(), [])
+
+    def test_get_course_summaries_forgets_deleted_courses(self):
+        '''Make sure what is remembered of the courses which no longer exist is dropped'''
+        deleted = Location('i4x', 'edX', 'deleted', 'course', '2012_Fall')
+        self.store._course_documents_loading[deleted] = ('digest', True)
+        summaries = self.store.get_course_summaries()
+        assert_false(deleted in self.store._course_documents_loading)
+        for summary in summaries:
+            assert_in(summary.location, self.store._course_documents_loading)
+
     def test_loads(self):
         assert_not_equals(
             self.store.get_item("i4x://edX/toy/course/2012_Fall"),
@@ -310,6 +344,218 @@ class TestMongoModuleStore(object):
         assert_equals(len(course_locations), 1)
         assert_in(Location('i4x', 'edX', 'simple', 'course', '2012_Fall'), course_locations)
 
+    def test_parent_map(self):
+        store = MongoModuleStore(
+            {'host': HOST, 'db': DB, 'collection': COLLECTION}, FS_ROOT, RENDER_TEMPLATE,
+            default_class=DEFAULT_CLASS, request_cache=Mock(data={})
+        )
+        location = Location('i4x', 'edX', 'toy', 'course', '2012_Fall')
+        store.get_cached_parent_map(location)
+
+        store.collection = Mock(wraps=store.collection)
+        for item in self.connection[DB][COLLECTION].find({'_id.org': 'edX', '_id.course': 'toy'}):
+            item_location = Location(item['_id'])
+            expected = [
+                Location(parent['_id'])
+                for parent in self.connection[DB][COLLECTION].find({'definition.children': item_location.url()})
+            ]
+            assert_equals(sorted(store.get_parent_locations(item_location, None)), sorted(expected))
+        assert_false(store.collection.find.called)
+
+    def _cached_store(self):
+        """
+        Return a MongoModuleStore on the test db that uses the course structure
+        cache, with a mock request cache so inheritance trees aren't recomputed.
+        """
+        doc_store_config = {
+            'host': HOST,
+            'db': DB,
+            'collection': COLLECTION,
+        }
+        store = MongoModuleStore(
+            doc_store_config, FS_ROOT, RENDER_TEMPLATE,
+            default_class=DEFAULT_CLASS, course_cache_size=2, request_cache=Mock(data={})
+        )
+        store.course_structure_cache.clear()
+        return store
+
+    def test_course_structure_cache(self):
+        store = self._cached_store()
+        location = Location('i4x', 'edX', 'toy', 'course', '2012_Fall')
+        expected = self.store.get_item(location, depth=2)
+        store.get_item(location, depth=2)
+
+        # The course is now served from memory
+        store.collection = Mock(wraps=store.collection)
+        course = store.get_item(location, depth=2)
+        assert_false(store.collection.find.called)
+        assert_false(store.collection.find_one.called)
+        assert_equals(course.children, expected.children)
+        assert_equals(
+            [child.display_name for child in course.get_children()],
+            [child.display_name for child in expected.get_children()],
+        )
+
+        # Missing items are remembered too
+        assert_false(store.has_item(None, location.replace(name='no_such_course')))
+        assert_equals(store.collection.find.call_count, 1)
+        assert_false(store.has_item(None, location.replace(name='no_such_course')))
+        assert_equals(store.collection.find.call_count, 1)
+
+        # Modifying cached data doesn't leak into later loads
+        course.display_name = 'Changed'
+        assert_equals(store.get_item(location).display_name, expected.display_name)
+
+        # A write to the course invalidates it, for all stores of the collection
+        other_store = self._cached_store()
+        other_store.refresh_cached_metadata_inheritance_tree(location)
+        store.get_item(location)
+        assert_equals(store.collection.find.call_count, 2)
+
+    def test_structure_version_memoized_per_request(self):
+        versions = {}
+        shared_cache = Mock()
+        shared_cache.get.side_effect = versions.get
+        shared_cache.set.side_effect = versions.__setitem__
+        shared_cache.add.side_effect = versions.setdefault
+
+        def store_with(request_cache):
+            """
+            Return a store on the test db that shares structure versions
+            through `shared_cache`
+            """
+            return MongoModuleStore(
+                {'host': HOST, 'db': DB, 'collection': COLLECTION}, FS_ROOT, RENDER_TEMPLATE,
+                default_class=DEFAULT_CLASS, metadata_inheritance_cache_subsystem=shared_cache,
+                request_cache=request_cache,
+            )
+
+        location = Location('i4x', 'edX', 'toy', 'course', '2012_Fall')
+        in_request = store_with(Mock(data={}, request=Mock()))
+        outside_request = store_with(Mock(data={}, request=None))
+        version = in_request.get_course_version('edX/toy/2012_Fall')
+        assert_equals(outside_request.get_course_version('edX/toy/2012_Fall'), version)
+
+        # a write from another process is seen right away outside of requests,
+        # and at the next request otherwise
+        store_with(None)._bump_structure_version(location)
+        assert_not_equals(outside_request.get_course_version('edX/toy/2012_Fall'), version)
+        assert_equals(in_request.get_course_version('edX/toy/2012_Fall'), version)
+        assert_equals(outside_request.request_cache.data, {})
+
+    def test_course_structure_cache_lru(self):
+        cache = CourseStructureCache(2)
+        toy, created = cache.get('edX/toy', None)
+        assert_equals(created, True)
+        toy.documents['key'] = 'value'
+        cache.get('edX/simple', None)
+        toy, created = cache.get('edX/toy', None)
+        assert_equals(created, False)
+        assert_equals(toy.documents, {'key': 'value'})
+
+        # toy was used more recently than simple
+        cache.get('edX/test_unicode', None)
+        assert_equals(cache.get('edX/toy', None)[1], False)
+        assert_equals(cache.get('edX/simple', None)[1], True)
+
+        # entries are only valid for the structure version they were created for
+        toy, created = cache.get('edX/toy', 'new version')
+        assert_equals(created, True)
+        assert_equals(toy.documents, {})
+
+    def test_prefetch_course(self):
+        doc_store_config = {
+            'host': HOST,
+            'db': DB,
+            'collection': COLLECTION,
+        }
+        store = MongoModuleStore(doc_store_config, FS_ROOT, RENDER_TEMPLATE, default_class=DEFAULT_CLASS)
+        store.collection = Mock(wraps=store.collection)
+
+        course = store.get_course('edX/toy/2012_Fall', depth=None)
+
+        # one query for the course, one for all its modules (including the inheritance tree)
+        assert_equals(store.collection.find_one.call_count, 1)
+        assert_equals(store.collection.find.call_count, 1)
+
+        def walk(module):
+            """Return (location, display_name, due) for module and all its descendents."""
+            result = [(module.location, module.display_name, module.due)]
+            for child in module.get_children():
+                result.extend(walk(child))
+            return result
+
+        course_modules = walk(course)
+        assert_equals(store.collection.find.call_count, 1)
+        assert_equals(store.collection.find_one.call_count, 1)
+        assert_equals(course_modules, walk(self.store.get_course('edX/toy/2012_Fall')))
+
+    def test_prefetch_course_with_cache(self):
+        store = self._cached_store()
+        store.get_course('edX/toy/2012_Fall', depth=None)
+
+        store.collection = Mock(wraps=store.collection)
+        store.get_course('edX/toy/2012_Fall', depth=None)
+        assert_false(store.collection.find.called)
+        assert_false(store.collection.find_one.called)
+
+        # everything that isn't in a completely cached course doesn't exist
+        assert_false(store.has_item(None, Location('i4x', 'edX', 'toy', 'course', 'no_such_course')))
+        assert_false(store.collection.find.called)
+
+    def test_bulk_write_operations(self):
+        store = MongoModuleStore(
+            {'host': HOST, 'db': DB, 'collection': COLLECTION},
+            FS_ROOT, RENDER_TEMPLATE, default_class=DEFAULT_CLASS, modulestore_update_signal=Mock()
+        )
+        course_location = Location('i4x', 'edX', 'bulk_write', 'course', '2014')
+        locations = [course_location.replace(category='html', name='html{}'.format(i)) for i in range(3)]
+
+        with patch.object(store.collection, 'insert', wraps=store.collection.insert) as insert, \
+                patch.object(store.collection, 'update', wraps=store.collection.update) as update:
+            with store.bulk_write_operations(course_location):
+                for location in locations:
+                    store.create_and_save_xmodule(location, definition_data='<p>{}</p>'.format(location.name))
+                assert_false(insert.called)
+                assert_false(update.called)
+
+                # reading writes the buffered modules, all new, at once
+                assert_equals(store.get_item(locations[1]).data, '<p>html1</p>')
+                assert_equals(insert.call_count, 1)
+
+                store.create_and_save_xmodule(locations[0], definition_data='<p>changed</p>')
+                assert_false(store.modulestore_update_signal.send.called)
+
+        # the existing module is updated at commit, and the update signaled once
+        assert_equals(update.call_count, 1)
+        assert_equals(store.get_item(locations[0]).data, '<p>changed</p>')
+        assert_equals(store.get_item(locations[2]).data, '<p>html2</p>')
+        assert_equals(store.modulestore_update_signal.send.call_count, 1)
+
+    def test_reimport_only_writes_changes(self):
+        store = MongoModuleStore(
+            {'host': HOST, 'db': DB, 'collection': COLLECTION},
+            FS_ROOT, RENDER_TEMPLATE, default_class=DEFAULT_CLASS, modulestore_update_signal=Mock()
+        )
+        removed_location = Location('i4x', 'edX', 'test_unicode', 'html', 'removed_module')
+        store.create_and_save_xmodule(removed_location)
+        store.modulestore_update_signal.reset_mock()
+
+        with patch.object(store.collection, 'insert', wraps=store.collection.insert) as insert, \
+                patch.object(store.collection, 'update', wraps=store.collection.update) as update, \
+                patch.object(store.collection, 'remove', wraps=store.collection.remove) as remove:
+            import_from_xml(
+                store, DATA_DIR, ['test_unicode'], static_content_store=self.content_store,
+                delete_removed_modules=True
+            )
+
+        # the unchanged modules aren't written again, the removed one is deleted
+        assert_false(insert.called)
+        assert_false(update.called)
+        assert_equals(remove.call_count, 1)
+        assert_false(store.has_item(None, removed_location))
+        assert_equals(store.modulestore_update_signal.send.call_count, 1)
+
 
 class TestMongoKeyValueStore(object):
     """
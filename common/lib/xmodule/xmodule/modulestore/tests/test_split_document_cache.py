@@ -0,0 +1,111 @@
+"""
+Tests for the document cache of the split modulestore's MongoConnection.
+"""
+import datetime
+import unittest
+
+from bson.objectid import ObjectId
+from pytz import UTC
+
+from xmodule.modulestore.split_mongo.mongo_connection import DocumentCache
+
+
+class DictCache(object):
+    """
+    A minimal cache with the get/set/add/delete interface of Django caches.
+    """
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def set(self, key, value):
+        self.data[key] = value
+
+    def add(self, key, value):
+        self.data.setdefault(key, value)
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+
+class TestDocumentCache(unittest.TestCase):
+    """
+    Tests of DocumentCache.
+    """
+    def setUp(self):
+        self.structure_id = ObjectId()
+        self.structure = {
+            '_id': self.structure_id,
+            'root': 'head',
+            'blocks': {'head': {'category': 'course', 'fields': {'children': ['chapter']}}},
+            'edited_on': datetime.datetime(2013, 2, 14, 5, 0, tzinfo=UTC),
+        }
+
+    def test_get_returns_copies(self):
+        cache = DocumentCache(10, 'test')
+        self.assertIsNone(cache.get('structure', self.structure_id))
+
+        cache.set('structure', self.structure_id, self.structure)
+        cached = cache.get('structure', self.structure_id)
+        self.assertEqual(cached, self.structure)
+
+        # modifying a returned document doesn't change the cached one
+        cached['blocks']['head']['fields']['children'].append('another')
+        self.assertEqual(cache.get('structure', self.structure_id), self.structure)
+
+        # structures and definitions with the same id don't collide
+        self.assertIsNone(cache.get('definition', self.structure_id))
+
+    def test_lru(self):
+        cache = DocumentCache(2, 'test')
+        first, second, third = ObjectId(), ObjectId(), ObjectId()
+        cache.set('definition', first, {'_id': first})
+        cache.set('definition', second, {'_id': second})
+        cache.get('definition', first)
+        cache.set('definition', third, {'_id': third})
+
+        # second was the least recently used
+        self.assertIsNone(cache.get('definition', second))
+        self.assertEqual(cache.get('definition', first), {'_id': first})
+        self.assertEqual(cache.get('definition', third), {'_id': third})
+
+    def test_shared_cache(self):
+        shared_cache = DictCache()
+        cache = DocumentCache(10, 'test', shared_cache)
+        cache.set('structure', self.structure_id, self.structure)
+
+        # another process finds the document in the shared cache
+        other_cache = DocumentCache(10, 'test', shared_cache)
+        self.assertEqual(other_cache.get('structure', self.structure_id), self.structure)
+
+        cache.delete('structure', self.structure_id)
+        self.assertIsNone(DocumentCache(10, 'test', shared_cache).get('structure', self.structure_id))
+
+    def test_update_in_place_seen_by_other_processes(self):
+        shared_cache = DictCache()
+        cache = DocumentCache(10, 'test', shared_cache)
+        cache.set('structure', self.structure_id, self.structure)
+        other_cache = DocumentCache(10, 'test', shared_cache)
+        self.assertEqual(other_cache.get('structure', self.structure_id), self.structure)
+
+        # the structure is updated in place by this process: the other one
+        # doesn't use the copy it holds anymore
+        cache.delete('structure', self.structure_id)
+        self.assertIsNone(other_cache.get('structure', self.structure_id))
+
+        # a copy loaded before the update isn't cached under the new generation
+        _, generation = other_cache.lookup('structure', self.structure_id)
+        cache.delete('structure', self.structure_id)
+        other_cache.set('structure', self.structure_id, self.structure, generation)
+        self.assertIsNone(cache.get('structure', self.structure_id))
+        self.assertIsNone(other_cache.get('structure', self.structure_id))
+
+    def test_evicted_generation_not_reused(self):
+        shared_cache = DictCache()
+        cache = DocumentCache(10, 'test', shared_cache)
+        cache.set('structure', self.structure_id, self.structure)
+
+        shared_cache.data.clear()
+        self.assertIsNone(cache.get('structure', self.structure_id))
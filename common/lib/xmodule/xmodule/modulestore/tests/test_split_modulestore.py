@@ -8,6 +8,7 @@ from importlib import import_module
 from path import path
 import re
 import random
+from mock import patch
 
 from xblock.fields import Scope
 from xmodule.course_module import CourseDescriptor
@@ -791,6 +792,31 @@ class SplitModuleItemTests(SplitModuleTest):
         with self.assertRaises(InsufficientSpecificationError):
             modulestore().get_item(BlockUsageLocator(package_id='testx.GreekHero', branch='draft'))
 
+    # pylint: disable=W0212
+    def test_lazy_definitions_fetched_together(self):
+        """
+        The definitions of sibling blocks are fetched with a single query when the first is needed
+        """
+        store = modulestore()
+        store._clear_cache()
+        connection = store.db_connection
+        locator = BlockUsageLocator(package_id="testx.GreekHero", branch='draft', block_id='chapter3')
+        with patch.object(connection, 'get_definitions', wraps=connection.get_definitions) as get_definitions:
+            with patch.object(connection, 'get_definition', wraps=connection.get_definition) as get_definition:
+                chapter = store.get_item(locator, depth=1)
+                problems = chapter.get_children()
+                self.assertEqual(len(problems), 2)
+                self.assertFalse(get_definitions.called)
+
+                for problem in problems:
+                    self.assertIsNotNone(problem.data)
+                self.assertEqual(get_definitions.call_count, 1)
+                self.assertEqual(
+                    set(get_definitions.call_args[0][0]),
+                    set(problem.definition_locator.definition_id for problem in problems)
+                )
+                self.assertFalse(get_definition.called)
+
     # pylint: disable=W0212
     def test_matching(self):
         '''
@@ -7,11 +7,18 @@ import lxml.etree
 from xblock.fields import Scope
 from xmodule.modulestore import Location
 from xmodule.modulestore.inheritance import own_metadata
+from xmodule.x_module import exported_xml
 from fs.osfs import OSFS
 from json import dumps
+from multiprocessing.pool import ThreadPool
 import json
 import datetime
 import os
+import posixpath
+import tarfile
+import tempfile
+import threading
+import time
 from path import path
 import shutil
 
@@ -22,6 +29,16 @@ EXPORT_VERSION_KEY = "export_format"
 
 DEFAULT_CONTENT_FIELDS = ['metadata', 'data']
 
+# How many chapters of a course are exported at once
+CHAPTER_EXPORT_THREADS = 4
+
+# How many static assets of a course are read from the content store at once
+ASSET_EXPORT_THREADS = 4
+
+# Files written to a tar export are kept in memory up to this size (and in a
+# temporary file beyond it) until they are added to the tar file
+TAR_MEMBER_SPOOL_SIZE = 1024 * 1024
+
 
 class EdxJSONEncoder(json.JSONEncoder):
     """
@@ -45,6 +62,94 @@ class EdxJSONEncoder(json.JSONEncoder):
             return super(EdxJSONEncoder, self).default(obj)
 
 
+class TarExportFS(object):
+    """
+    A write only filesystem adding the files written to it to the tar file
+    `tar_file`, under the directory `prefix`.
+
+    It implements the part of the pyfilesystem API that exports use: opening
+    files for writing, `makedir` and `makeopendir`. A file is added to the tar
+    file when it is closed, so files can be written by several threads at
+    once.
+    """
+    def __init__(self, tar_file, prefix=u'', lock=None):
+        self.tar_file = tar_file
+        self.prefix = prefix
+        self._lock = lock or threading.Lock()
+
+    def _path(self, path_in_fs):
+        """Return the path in the tar file of `path_in_fs`."""
+        return posixpath.join(self.prefix, path_in_fs.lstrip('/'))
+
+    def open(self, path_in_fs, mode='r', **kwargs):  # pylint: disable=unused-argument
+        """Open the file `path_in_fs` for writing."""
+        if 'w' not in mode:
+            raise ValueError(u"{} is write only".format(self.__class__.__name__))
+        return TarMemberFile(self, self._path(path_in_fs))
+
+    def makedir(self, path_in_fs, recursive=False, allow_recreate=False):  # pylint: disable=unused-argument
+        """Directories are created along with the files in them."""
+        pass
+
+    def makeopendir(self, path_in_fs, recursive=False):  # pylint: disable=unused-argument
+        """Return the sub directory `path_in_fs`, as a TarExportFS."""
+        return TarExportFS(self.tar_file, self._path(path_in_fs), self._lock)
+
+    def add(self, name, fileobj, size):
+        """Add `size` bytes of `fileobj` to the tar file, as the file `name`."""
+        info = tarfile.TarInfo(name.encode('utf-8') if isinstance(name, unicode) else name)
+        info.size = size
+        info.mtime = time.time()
+        info.mode = 0644
+        with self._lock:
+            self.tar_file.addfile(info, fileobj)
+
+
+class TarMemberFile(object):
+    """
+    A file of a TarExportFS, spooled until it's closed (then added to the tar
+    file).
+    """
+    def __init__(self, export_fs, name):
+        self.export_fs = export_fs
+        self.name = name
+        self._file = tempfile.SpooledTemporaryFile(max_size=TAR_MEMBER_SPOOL_SIZE)
+
+    def write(self, data):
+        self._file.write(data)
+
+    def close(self):
+        """Add the file to the tar file."""
+        if self._file.closed:
+            return
+        try:
+            size = self._file.tell()
+            self._file.seek(0)
+            self.export_fs.add(self.name, self._file, size)
+        finally:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            # don't add partially written files
+            self._file.close()
+
+
+def _map_in_threads(func, items, processes):
+    """Return map(func, items), computed by `processes` threads."""
+    pool = ThreadPool(processes)
+    try:
+        return pool.map(func, items)
+    finally:
+        pool.close()
+        pool.join()
+
+
 def export_to_xml(modulestore, contentstore, course_location, root_dir, course_dir, draft_modulestore=None):
     """
     Export all modules from `modulestore` and content from `contentstore` as xml to `root_dir`.
@@ -57,15 +162,41 @@ def export_to_xml(modulestore, contentstore, course_location, root_dir, course_d
     `draft_modulestore`: An optional `DraftModuleStore` that contains draft content, which will be exported
         alongside the public content in the course.
     """
+    fs = OSFS(root_dir)
+    export_course_to_fs(modulestore, contentstore, course_location, fs.makeopendir(course_dir), draft_modulestore)
+
+
+def export_to_tar(modulestore, contentstore, course_location, fileobj, course_dir, draft_modulestore=None):
+    """
+    Export the course like `export_to_xml`, as a gzipped tar archive written
+    to the file object `fileobj`, in which the course is in `course_dir`.
+
+    The files of the course are added to the archive as they are exported:
+    the archive is written in a single pass, and doesn't need to be seekable.
+    """
+    with tarfile.open(fileobj=fileobj, mode='w|gz') as tar_file:
+        export_course_to_fs(
+            modulestore, contentstore, course_location, TarExportFS(tar_file, course_dir), draft_modulestore
+        )
 
+
+def export_course_to_fs(modulestore, contentstore, course_location, export_fs, draft_modulestore=None):
+    """
+    Export the course like `export_to_xml`, to the filesystem `export_fs`
+    (a pyfilesystem object, or a TarExportFS).
+    """
     course_id = course_location.course_id
     course = modulestore.get_course(course_id)
 
-    fs = OSFS(root_dir)
-    export_fs = course.runtime.export_fs = fs.makeopendir(course_dir)
+    course.runtime.export_fs = export_fs
+
+    # the chapters are exported first, concurrently: the course export
+    # reuses their xml
+    chapters_xml = _export_children_concurrently(course, export_fs)
 
     root = lxml.etree.Element('unknown')
-    course.add_xml_to_node(root)
+    with exported_xml(chapters_xml):
+        course.add_xml_to_node(root)
 
     with export_fs.open('course.xml', 'w') as course_xml:
         lxml.etree.ElementTree(root).write(course_xml)
@@ -73,11 +204,7 @@ def export_to_xml(modulestore, contentstore, course_location, root_dir, course_d
     # export the static assets
     policies_dir = export_fs.makeopendir('policies')
     if contentstore:
-        contentstore.export_all_for_course(
-            course_location,
-            root_dir + '/' + course_dir + '/static/',
-            root_dir + '/' + course_dir + '/policies/assets.json',
-        )
+        contentstore.export_all_for_course(course_location, export_fs, ASSET_EXPORT_THREADS)
 
     # export the static tabs
     export_extra_content(export_fs, modulestore, course_id, course_location, 'static_tab', 'tabs', '.html')
@@ -124,6 +251,21 @@ def export_to_xml(modulestore, contentstore, course_location, root_dir, course_d
                     draft_vertical.add_xml_to_node(node)
 
 
+def _export_children_concurrently(block, export_fs):
+    """
+    Export the children of `block` to `export_fs`, each in a thread of its
+    own, and return their xml by location (for `exported_xml`, so that
+    exporting `block` doesn't export them again).
+    """
+    children = [child for child in block.get_children() if hasattr(child, 'export_to_xml')]
+
+    def export_child(child):
+        """Export `child`, and return its location and xml."""
+        return child.location, child.export_to_xml(export_fs)
+
+    return dict(_map_in_threads(export_child, children, CHAPTER_EXPORT_THREADS))
+
+
 def _export_field_content(xblock_item, item_dir):
     """
     Export all fields related to 'xblock_item' other than 'metadata' and 'data' to json file in provided directory
@@ -1,13 +1,18 @@
+import hashlib
 import logging
+import multiprocessing
 import os
 import mimetypes
+from collections import namedtuple, OrderedDict
+from functools import partial
+from multiprocessing.pool import ThreadPool
 from path import path
 import json
 
 from .xml import XMLModuleStore, ImportSystem, ParentTracker
 from xmodule.modulestore import Location
 from xblock.fields import Scope, Reference, ReferenceList, ReferenceValueDict
-from xmodule.contentstore.content import StaticContent
+from xmodule.contentstore.content import StaticContent, StaticContentFile, make_thumbnail_data
 from .inheritance import own_metadata
 from xmodule.errortracker import make_error_tracker
 from .store_utilities import rewrite_nonportable_content_links
@@ -16,10 +21,151 @@ import xblock
 log = logging.getLogger(__name__)
 
 
+# Files larger than this are streamed into the content store, rather than
+# read in memory
+STATIC_CONTENT_STREAMING_SIZE = 1024 * 1024
+
+STATIC_CONTENT_CHUNK_SIZE = 256 * 1024
+
+# How many static files are read, hashed and saved at once
+STATIC_IMPORT_THREADS = 8
+
+# How many processes make the thumbnails of the imported images. 0 makes them
+# in the importing process.
+THUMBNAIL_PROCESSES = multiprocessing.cpu_count()
+
+
+# A file of the static directory of a course
+StaticFile = namedtuple('StaticFile', 'path location displayname content_type import_path locked')
+
+
+def _map_in_threads(func, items):
+    """Return map(func, items), computed by STATIC_IMPORT_THREADS threads."""
+    pool = ThreadPool(STATIC_IMPORT_THREADS)
+    try:
+        return pool.map(func, items)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _hash_static_file(static_file):
+    """
+    Return the md5 hex digest and the size of `static_file`, reading it in
+    chunks, or None if it should be skipped.
+    """
+    md5 = hashlib.md5()
+    size = 0
+    try:
+        with open(static_file.path, 'rb') as f:
+            for chunk in iter(partial(f.read, STATIC_CONTENT_CHUNK_SIZE), ''):
+                md5.update(chunk)
+                size += len(chunk)
+    except IOError:
+        if os.path.basename(static_file.path).startswith('._'):
+            # OS X "companion files". See
+            # http://www.diigo.com/annotated/0c936fda5da4aa1159c189cea227e174
+            return None
+        # Not a 'hidden file', then re-raise exception
+        raise
+    return md5.hexdigest(), size
+
+
+def _is_unchanged(static_file, digest, stored):
+    """
+    Whether `static_file`, with md5 `digest`, is already in the content store
+    as is, according to `stored`, its fs.files entry (or None).
+    """
+    if stored is None or stored.get('md5') != digest:
+        return False
+    if StaticContent.is_image(static_file.content_type) and not stored.get('thumbnail_location'):
+        return False
+    return (
+        stored.get('displayname') == static_file.displayname and
+        stored.get('contentType') == static_file.content_type and
+        stored.get('import_path') == static_file.import_path and
+        stored.get('locked', False) == static_file.locked
+    )
+
+
+def _make_thumbnail(path):
+    """
+    Return the thumbnail data of the image at `path`, or None if it can't be
+    made.
+    """
+    try:
+        return make_thumbnail_data(path)
+    except Exception:  # pylint: disable=broad-except
+        # log and continue as thumbnails are generally considered as optional
+        log.exception(u"Failed to generate thumbnail for %s", path)
+        return None
+
+
+def _make_thumbnails(paths):
+    """
+    Return the thumbnail data of the images at `paths` (see _make_thumbnail),
+    made in parallel by a pool of THUMBNAIL_PROCESSES processes.
+    """
+    processes = min(THUMBNAIL_PROCESSES, len(paths))
+    if processes < 2:
+        return [_make_thumbnail(path) for path in paths]
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        return pool.map(_make_thumbnail, paths)
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def _save_static_file(static_content_store, static_file, digest, size, thumbnail_data):
+    """
+    Save `static_file`, and its thumbnail if there's `thumbnail_data`, to
+    `static_content_store`.
+    """
+    try:
+        thumbnail_location = None
+        if thumbnail_data is not None:
+            thumbnail_name, thumbnail_location = StaticContent.compute_thumbnail_location(static_file.location)
+            static_content_store.save(
+                StaticContent(thumbnail_location, thumbnail_name, 'image/jpeg', thumbnail_data)
+            )
+
+        if size > STATIC_CONTENT_STREAMING_SIZE:
+            content = StaticContentFile(
+                static_file.location, static_file.displayname, static_file.content_type, static_file.path,
+                thumbnail_location=thumbnail_location, import_path=static_file.import_path,
+                length=size, locked=static_file.locked, content_digest=digest
+            )
+        else:
+            with open(static_file.path, 'rb') as f:
+                data = f.read()
+            content = StaticContent(
+                static_file.location, static_file.displayname, static_file.content_type, data,
+                thumbnail_location=thumbnail_location, import_path=static_file.import_path,
+                length=size, locked=static_file.locked, content_digest=digest
+            )
+
+        # then commit the content
+        static_content_store.save(content)
+    except Exception as err:
+        log.exception('Error importing {0}, error={1}'.format(
+            static_file.import_path, err
+        ))
+
+
 def import_static_content(
         modules, course_loc, course_data_path, static_content_store,
         target_location_namespace, subpath='static', verbose=False):
+    """
+    Import the files of the `subpath` directory of the course into
+    `static_content_store`, and return the map of their paths to their names
+    in the store.
 
+    The files are read and hashed, and then saved, by STATIC_IMPORT_THREADS
+    threads. Files which are already in the store, with the same data and
+    attributes, aren't saved again.
+    """
     remap_dict = {}
 
     # now import all static assets
@@ -35,6 +181,7 @@ def import_static_content(
     verbose = True
     mimetypes_list = mimetypes.types_map.values()
 
+    static_files = []
     for dirname, _, filenames in os.walk(static_dir):
         for filename in filenames:
 
@@ -45,20 +192,6 @@ def import_static_content(
                     log.debug('skipping static content %s...', content_path)
                 continue
 
-            if verbose:
-                log.debug('importing static content %s...', content_path)
-
-            try:
-                with open(content_path, 'rb') as f:
-                    data = f.read()
-            except IOError:
-                if filename.startswith('._'):
-                    # OS X "companion files". See
-                    # http://www.diigo.com/annotated/0c936fda5da4aa1159c189cea227e174
-                    continue
-                # Not a 'hidden file', then re-raise exception
-                raise
-
             # strip away leading path from the name
             fullname_with_subpath = content_path.replace(static_dir, '')
             if fullname_with_subpath.startswith('/'):
@@ -76,28 +209,50 @@ def import_static_content(
             # Check extracted contentType in list of all valid mimetypes
             if not mime_type or mime_type not in mimetypes_list:
                 mime_type = mimetypes.guess_type(filename)[0]   # Assign guessed mimetype
-            content = StaticContent(
-                content_loc, displayname, mime_type, data,
-                import_path=fullname_with_subpath, locked=locked
-            )
 
-            # first let's save a thumbnail so we can get back a thumbnail location
-            thumbnail_content, thumbnail_location = static_content_store.generate_thumbnail(content)
+            static_files.append(StaticFile(
+                content_path, content_loc, displayname, mime_type, fullname_with_subpath, locked
+            ))
+
+    stored_files, __ = static_content_store.get_all_content_for_course(target_location_namespace)
+    stored_files = dict((stored['_id']['name'], stored) for stored in stored_files)
 
-            if thumbnail_content is not None:
-                content.thumbnail_location = thumbnail_location
+    hashes = _map_in_threads(_hash_static_file, static_files)
 
-            # then commit the content
-            try:
-                static_content_store.save(content)
-            except Exception as err:
-                log.exception('Error importing {0}, error={1}'.format(
-                    fullname_with_subpath, err
-                ))
+    # location name -> (static file, digest, size) of the files to save.
+    # When several files have the same name, the last one is saved.
+    to_save = OrderedDict()
+    for static_file, hashed in zip(static_files, hashes):
+        if hashed is None:
+            continue
+        digest, size = hashed
 
-            # store the remapping information which will be needed
-            # to subsitute in the module data
-            remap_dict[fullname_with_subpath] = content_loc.name
+        # store the remapping information which will be needed
+        # to subsitute in the module data
+        remap_dict[static_file.import_path] = static_file.location.name
+
+        if _is_unchanged(static_file, digest, stored_files.get(static_file.location.name)):
+            if verbose:
+                log.debug('static content %s is unchanged', static_file.path)
+            to_save.pop(static_file.location.name, None)
+        else:
+            if verbose:
+                log.debug('importing static content %s...', static_file.path)
+            to_save[static_file.location.name] = (static_file, digest, size)
+
+    # first let's make the thumbnails, so we can get back their locations
+    images = [
+        static_file.path for static_file, _, _ in to_save.itervalues()
+        if StaticContent.is_image(static_file.content_type)
+    ]
+    thumbnails = dict(zip(images, _make_thumbnails(images)))
+
+    def save(item):
+        """Save a file of to_save, with its thumbnail."""
+        static_file, digest, size = item
+        _save_static_file(static_content_store, static_file, digest, size, thumbnails.get(static_file.path))
+
+    _map_in_threads(save, to_save.values())
 
     return remap_dict
 
@@ -107,7 +262,7 @@ def import_from_xml(
         default_class='xmodule.raw_module.RawDescriptor',
         load_error_modules=True, static_content_store=None,
         target_location_namespace=None, verbose=False, draft_store=None,
-        do_import_static=True):
+        do_import_static=True, delete_removed_modules=False):
     """
     Import the specified xml data_dir into the "store" modulestore,
     using org and course as the location org and course.
@@ -130,6 +285,13 @@ def import_from_xml(
         time the course is loaded. Static content for some courses may also be
         served directly by nginx, instead of going through django.
 
+    :param delete_removed_modules:
+        if True, the modules of the course already in the store which are
+        not in the imported xml are deleted (drafts excepted), unless the
+        course had errors while loading.
+
+    Modules whose content didn't change aren't rewritten, on stores which
+    can tell (see MongoModuleStore.begin_bulk_write).
     """
 
     xml_module_store = XMLModuleStore(
@@ -154,6 +316,9 @@ def import_from_xml(
             course_id_components = Location.parse_course_id(course_id)
             pseudo_course_id = u'{org}/{course}'.format(**course_id_components)
 
+        bulk_write_location = None
+        course_changed = True
+        imported_locations = set()
         try:
             # turn off all write signalling while importing as this
             # is a high volume operation on stores that need it
@@ -161,6 +326,12 @@ def import_from_xml(
                     pseudo_course_id not in store.ignore_write_events_on_courses):
                 store.ignore_write_events_on_courses.append(pseudo_course_id)
 
+            # and buffer the module writes, on stores that can write them in
+            # batches
+            if hasattr(store, 'begin_bulk_write'):
+                bulk_write_location = Location('i4x', *pseudo_course_id.split('/'))
+                store.begin_bulk_write(bulk_write_location)
+
             course_data_path = None
             course_location = None
 
@@ -214,6 +385,7 @@ def import_from_xml(
                         target_location_namespace or course_location,
                         do_import_static=do_import_static
                     )
+                    imported_locations.add(module.location)
 
                     course_items.append(module)
 
@@ -282,6 +454,26 @@ def import_from_xml(
                     target_location_namespace if target_location_namespace else course_location,
                     do_import_static=do_import_static
                 )
+                imported_locations.add(module.location)
+
+            if delete_removed_modules and hasattr(store, 'get_course_module_locations'):
+                if xml_module_store.get_item_errors(course_location):
+                    log.warning(
+                        u'Not deleting the modules removed from {0}, it had errors while loading'.format(course_id)
+                    )
+                else:
+                    removed_locations = store.get_course_module_locations(
+                        target_location_namespace or course_location
+                    ) - imported_locations
+                    for location in removed_locations:
+                        log.debug(u'deleting removed module {0}'.format(location.url()))
+                        store.delete_item(location)
+
+            # the draft store reads and writes the modules through a store
+            # of its own
+            if bulk_write_location is not None:
+                course_changed = store.commit_bulk_write(bulk_write_location) or draft_store is not None
+                bulk_write_location = None
 
             # now import any 'draft' items
             if draft_store is not None:
@@ -296,13 +488,18 @@ def import_from_xml(
                 )
 
         finally:
+            if bulk_write_location is not None:
+                store.commit_bulk_write(bulk_write_location)
+
             # turn back on all write signalling on stores that need it
             if (hasattr(store, 'ignore_write_events_on_courses') and
                     pseudo_course_id in store.ignore_write_events_on_courses):
                 store.ignore_write_events_on_courses.remove(pseudo_course_id)
-                store.refresh_cached_metadata_inheritance_tree(
-                    target_location_namespace if target_location_namespace is not None else course_location
-                )
+                # (no need to if the import didn't change any module)
+                if course_changed:
+                    store.refresh_cached_metadata_inheritance_tree(
+                        target_location_namespace if target_location_namespace is not None else course_location
+                    )
 
     return xml_module_store, course_items
 
@@ -3,6 +3,7 @@ Tests of XML export
 """
 
 import ddt
+import json
 import lxml.etree
 import mock
 import os
@@ -15,6 +16,7 @@ import uuid
 from datetime import datetime, timedelta, tzinfo
 from fs.osfs import OSFS
 from path import path
+from StringIO import StringIO
 from tempfile import mkdtemp
 from textwrap import dedent
 
@@ -22,10 +24,12 @@ from xblock.core import XBlock
 from xblock.fields import String, Scope, Integer
 from xblock.test.tools import blocks_are_equivalent
 
+from xmodule.contentstore.content import StaticContent, StaticContentStream
+from xmodule.contentstore.mongo import MongoContentStore
 from xmodule.modulestore import Location
 from xmodule.modulestore.xml import XMLModuleStore
 from xmodule.modulestore.xml_exporter import (
-    EdxJSONEncoder, convert_between_versions, get_version
+    EdxJSONEncoder, convert_between_versions, export_to_tar, export_to_xml, get_version
 )
 from xmodule.tests import DATA_DIR
 from xmodule.tests.helpers import directories_equal
@@ -152,6 +156,63 @@ class RoundTripTestCase(unittest.TestCase):
             ))
 
 
+class ExportToTarTestCase(unittest.TestCase):
+    """
+    Check that exporting a course to a tar archive gives the same files as
+    exporting it to a directory, along with the course's assets.
+    """
+    def setUp(self):
+        self.temp_dir = path(mkdtemp())
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+
+    def test_export_to_tar(self):
+        store = XMLModuleStore(DATA_DIR, course_dirs=['toy'], xblock_mixins=(XModuleMixin,))
+        course_location = store.get_courses()[0].location
+
+        os.mkdir(self.temp_dir / 'directory')
+        export_to_xml(store, None, course_location, self.temp_dir / 'directory', 'toy')
+
+        with open(self.temp_dir / 'toy.tar.gz', 'wb') as tar_gz:
+            export_to_tar(store, None, course_location, tar_gz, 'toy')
+        with tarfile.open(self.temp_dir / 'toy.tar.gz') as tar_file:
+            self.assertIn('toy/course.xml', tar_file.getnames())
+            tar_file.extractall(self.temp_dir / 'tar')
+
+        self.assertTrue(directories_equal(self.temp_dir / 'directory', self.temp_dir / 'tar'))
+
+    def test_export_assets_to_tar(self):
+        store = XMLModuleStore(DATA_DIR, course_dirs=['toy'], xblock_mixins=(XModuleMixin,))
+        course_location = store.get_courses()[0].location
+        asset_location = StaticContent.compute_location(course_location.org, course_location.course, 'images/logo.png')
+        asset = {
+            '_id': asset_location.dict(), 'displayname': 'logo.png', 'contentType': 'image/png',
+            'import_path': 'images/logo.png', 'md5': '0' * 32, 'length': 4,
+        }
+
+        # a content store of the one asset, which isn't connected to mongo
+        with mock.patch.object(MongoContentStore, '__init__', return_value=None):
+            content_store = MongoContentStore()
+        content_store.get_all_content_for_course = mock.Mock(return_value=([asset], 1))
+        content_store.find = mock.Mock(return_value=StaticContentStream(
+            asset_location, 'logo.png', 'image/png', StringIO('logo'), import_path='images/logo.png', length=4
+        ))
+
+        with open(self.temp_dir / 'toy.tar.gz', 'wb') as tar_gz:
+            export_to_tar(store, content_store, course_location, tar_gz, 'toy')
+        with tarfile.open(self.temp_dir / 'toy.tar.gz') as tar_file:
+            tar_file.extractall(self.temp_dir / 'tar')
+
+        content_store.find.assert_called_once_with(asset_location, as_stream=True)
+        with open(self.temp_dir / 'tar' / 'toy' / 'static' / 'images' / 'logo.png') as asset_file:
+            self.assertEqual(asset_file.read(), 'logo')
+        with open(self.temp_dir / 'tar' / 'toy' / 'policies' / 'assets.json') as assets_policy:
+            self.assertEqual(json.load(assets_policy), {
+                'images_logo.png': {
+                    'displayname': 'logo.png', 'contentType': 'image/png', 'import_path': 'images/logo.png',
+                },
+            })
+
+
 class TestEdxJsonEncoder(unittest.TestCase):
     """
     Tests for xml_exporter.EdxJSONEncoder
@@ -1,8 +1,10 @@
 """
 Tests that check that we ignore the appropriate files when importing courses.
 """
+import hashlib
 import unittest
-from mock import Mock
+from mock import Mock, patch
+from xmodule.contentstore.content import StaticContentFile
 from xmodule.modulestore import Location
 from xmodule.modulestore.xml_importer import import_static_content
 from xmodule.tests import DATA_DIR
@@ -15,9 +17,57 @@ class IgnoredFilesTestCase(unittest.TestCase):
         loc = Location("edX", "tilde", "Fall_2012")
         content_store = Mock()
         content_store.generate_thumbnail.return_value = ("content", "location")
+        content_store.get_all_content_for_course.return_value = ([], 0)
         import_static_content(Mock(), Mock(), course_dir, content_store, loc)
         saved_static_content = [call[0][0] for call in content_store.save.call_args_list]
         name_val = {sc.name: sc.data for sc in saved_static_content}
         self.assertIn("example.txt", name_val)
         self.assertNotIn("example.txt~", name_val)
         self.assertIn("GREEN", name_val["example.txt"])
+
+
+class ImportStaticContentTestCase(unittest.TestCase):
+    "Tests of the saving of the imported static files"
+    def setUp(self):
+        self.course_dir = DATA_DIR / "tilde"
+        self.loc = Location("edX", "tilde", "Fall_2012")
+        self.content_store = Mock()
+        self.content_store.get_all_content_for_course.return_value = ([], 0)
+
+    def _import(self):
+        """Import the static files of the course, and return the content saved."""
+        remap = import_static_content(Mock(), Mock(), self.course_dir, self.content_store, self.loc)
+        self.assertEqual(remap, {"example.txt": "example.txt"})
+        return [call[0][0] for call in self.content_store.save.call_args_list]
+
+    def _stored(self, **attrs):
+        """Return the fs.files entry of example.txt, as it is on disk, updated with `attrs`."""
+        with open(self.course_dir / "static" / "example.txt", 'rb') as f:
+            md5 = hashlib.md5(f.read()).hexdigest()
+        stored = {
+            '_id': {'name': 'example.txt'}, 'md5': md5, 'displayname': 'example.txt',
+            'contentType': 'text/plain', 'import_path': 'example.txt', 'locked': False,
+        }
+        stored.update(attrs)
+        return stored
+
+    def test_unchanged_files_not_saved(self):
+        self.content_store.get_all_content_for_course.return_value = ([self._stored()], 1)
+        self.assertEqual(self._import(), [])
+
+    def test_changed_files_saved(self):
+        for stored in [self._stored(md5='0' * 32), self._stored(locked=True)]:
+            self.content_store.get_all_content_for_course.return_value = ([stored], 1)
+            self.content_store.save.reset_mock()
+
+            saved = self._import()
+
+            self.assertEqual([content.name for content in saved], ["example.txt"])
+            self.assertEqual(saved[0].content_digest, self._stored()['md5'])
+
+    @patch('xmodule.modulestore.xml_importer.STATIC_CONTENT_STREAMING_SIZE', 0)
+    def test_large_files_streamed(self):
+        saved = self._import()
+
+        self.assertIsInstance(saved[0], StaticContentFile)
+        self.assertIn("GREEN", ''.join(saved[0].stream_data()))
@@ -1,8 +1,10 @@
 import logging
 import os
 import sys
+import threading
 import yaml
 
+from contextlib import contextmanager
 from functools import partial
 from lxml import etree
 from collections import namedtuple
@@ -31,6 +33,26 @@ from xmodule.exceptions import UndefinedContext
 
 log = logging.getLogger(__name__)
 
+# The xml of blocks already exported by the export running in this thread,
+# by location (see `exported_xml`)
+_EXPORTED_XML = threading.local()
+
+
+@contextmanager
+def exported_xml(xml_by_location):
+    """
+    Within this context, the blocks whose locations are in `xml_by_location`
+    are added to xml nodes (by `add_xml_to_node`) as the xml given for them,
+    rather than being exported again. Only the current thread's exports use
+    `xml_by_location`.
+    """
+    previous = getattr(_EXPORTED_XML, 'xml_by_location', {})
+    _EXPORTED_XML.xml_by_location = xml_by_location
+    try:
+        yield
+    finally:
+        _EXPORTED_XML.xml_by_location = previous
+
 
 def dummy_track(_event_type, _event):
     pass
@@ -539,6 +561,14 @@ class XModule(XModuleMixin, HTMLSnippet, XBlock):  # pylint: disable=abstract-me
         """
         return Fragment(self.get_html())
 
+    def has_user_independent_student_view(self):
+        """
+        Whether the student_view of this module is the same for every user,
+        depending only on the module's content and settings, so that runtimes
+        may cache it. Modules which render any user state must return False.
+        """
+        return False
+
 
 def policy_key(location):
     """
@@ -706,7 +736,9 @@ class XModuleDescriptor(XModuleMixin, HTMLSnippet, ResourceTemplates, XBlock):
         Export this :class:`XModuleDescriptor` as XML, by setting attributes on the provided
         `node`.
         """
-        xml_string = self.export_to_xml(self.runtime.export_fs)
+        xml_string = getattr(_EXPORTED_XML, 'xml_by_location', {}).get(self.location)
+        if xml_string is None:
+            xml_string = self.export_to_xml(self.runtime.export_fs)
         exported_node = etree.fromstring(xml_string)
         node.tag = exported_node.tag
         node.text = exported_node.text
@@ -21,10 +21,22 @@ from django.utils.timezone import UTC
 from student.models import CourseEnrollment
 from student.roles import (
     GlobalStaff, CourseStaffRole, CourseInstructorRole,
-    OrgStaffRole, OrgInstructorRole, CourseBetaTesterRole
+    OrgStaffRole, OrgInstructorRole, CourseBetaTesterRole,
+    user_group_names,
 )
+from request_cache.middleware import RequestCache
 DEBUG_ACCESS = False
 
+# Bits of the role bitmaps returned by _course_roles
+COURSE_STAFF = 1 << 0
+ORG_STAFF = 1 << 1
+COURSE_INSTRUCTOR = 1 << 2
+ORG_INSTRUCTOR = 1 << 3
+BETA_TESTER = 1 << 4
+
+STAFF_ROLES = COURSE_STAFF | ORG_STAFF
+INSTRUCTOR_ROLES = COURSE_INSTRUCTOR | ORG_INSTRUCTOR
+
 log = logging.getLogger(__name__)
 
 
@@ -245,23 +257,35 @@ def _has_access_descriptor(user, descriptor, action, course_context=None):
 
         # Check start date
         if 'detached' not in descriptor._class_tags and descriptor.start is not None:
-            now = datetime.now(UTC())
-            effective_start = _adjust_start_date_for_beta_testers(
-                user,
-                descriptor,
-                course_context=course_context
+            # The children of a sequence mostly share their start date, so
+            # this is only decided once per request for all of them
+            return _cached_decision(
+                user, descriptor.location, course_context,
+                ('load', descriptor.start, descriptor.days_early_for_beta),
+                can_load_started
             )
-            if now > effective_start:
-                # after start date, everyone can see it
-                debug("Allow: now > effective start date")
-                return True
-            # otherwise, need staff access
-            return _has_staff_access_to_descriptor(user, descriptor, course_context)
 
         # No start date, so can always load.
         debug("Allow: no start date")
         return True
 
+    def can_load_started():
+        """
+        Can this user load this descriptor, which has a start date?
+        """
+        now = datetime.now(UTC())
+        effective_start = _adjust_start_date_for_beta_testers(
+            user,
+            descriptor,
+            course_context=course_context
+        )
+        if now > effective_start:
+            # after start date, everyone can see it
+            debug("Allow: now > effective start date")
+            return True
+        # otherwise, need staff access
+        return _has_staff_access_to_descriptor(user, descriptor, course_context)
+
     checkers = {
         'load': can_load,
         'staff': lambda: _has_staff_access_to_descriptor(user, descriptor, course_context)
@@ -346,6 +370,110 @@ def _dispatch(table, action, user, obj):
         type(obj), action))
 
 
+def _request_cache(name):
+    """
+    Return the dict named `name` in the request cache (cleared at the start
+    and end of each request), or None outside of requests: nothing clears
+    the cache in celery tasks or management commands, so it would grow
+    without bound and hold on to stale start date decisions.
+    """
+    if RequestCache.get_current_request() is None:
+        return None
+    return RequestCache.get_request_cache().data.setdefault(name, {})
+
+
+def _course_key(location, course_context):
+    """
+    Return a key identifying the course of `location` as far as roles are
+    concerned: the groups of the course roles only depend on its org, course
+    and course id.
+    """
+    if location.category == 'course':
+        course_context = location.course_id
+    return (location.org, location.course, course_context)
+
+
+def _cached_decision(user, location, course_context, key, decide):
+    """
+    Return the access decision of `user` for `key`, an action on a
+    descriptor of the course of `location` along with the descriptor fields
+    the decision depends on. `decide` is only called the first time the
+    decision is needed in the request, and every time outside of requests.
+
+    The roles of the user are part of the cache key, so that changing them
+    in the middle of a request is taken into account.
+    """
+    if course_context is None and location.category != 'course':
+        # the course roles can't be determined without the course (see
+        # CourseContextRequired), so don't risk asking for them
+        return decide()
+
+    full_key = key + (
+        user.id,
+        user.is_staff,
+        is_masquerading_as_student(user),
+        _course_roles(user, location, course_context),
+    )
+    cache = _request_cache('courseware.access.decisions')
+    if cache is None:
+        return decide()
+    if full_key not in cache:
+        cache[full_key] = decide()
+    return cache[full_key]
+
+
+def _course_roles(user, location, course_context):
+    """
+    Return the bitmap (of COURSE_STAFF, ORG_STAFF etc.) of the roles `user`
+    has in the course of `location`.
+
+    All the groups of the user are loaded in one query, and the groups of the
+    course roles are computed once per request, so this is cheap to call for
+    every descriptor of a course.
+    """
+    if not (user.is_authenticated() and user.is_active):
+        return 0
+
+    groups = user_group_names(user)
+    # The bitmaps are cached on the user along with the groups they were
+    # computed from: GroupBasedRole drops those when the user's roles change
+    cached = getattr(user, '_course_roles', None)
+    if cached is None or cached[0] is not groups:
+        cached = user._course_roles = (groups, {})  # pylint: disable=protected-access
+
+    course_key = _course_key(location, course_context)
+    roles = cached[1].get(course_key)
+    if roles is None:
+        roles = 0
+        for bit, group_names in _course_role_groups(location, course_context):
+            if not groups.isdisjoint(group_names):
+                roles |= bit
+        cached[1][course_key] = roles
+    return roles
+
+
+def _course_role_groups(location, course_context):
+    """
+    Return the (role bit, group names) pairs of the roles of the course of
+    `location`, computed once per request.
+    """
+    cache = _request_cache('courseware.access.role_groups')
+    if cache is None:
+        cache = {}
+    course_key = _course_key(location, course_context)
+    if course_key not in cache:
+        roles = (
+            (COURSE_STAFF, CourseStaffRole(location, course_context)),
+            (ORG_STAFF, OrgStaffRole(location)),
+            (COURSE_INSTRUCTOR, CourseInstructorRole(location, course_context)),
+            (ORG_INSTRUCTOR, OrgInstructorRole(location)),
+            (BETA_TESTER, CourseBetaTesterRole(location, course_context=course_context)),
+        )
+        # pylint: disable=protected-access
+        cache[course_key] = [(bit, frozenset(role._group_names)) for bit, role in roles]
+    return cache[course_key]
+
+
 def _adjust_start_date_for_beta_testers(user, descriptor, course_context=None):
     """
     If user is in a beta test group, adjust the start date by the appropriate number of
@@ -359,9 +487,6 @@ def _adjust_start_date_for_beta_testers(user, descriptor, course_context=None):
     Returns:
         A datetime.  Either the same as start, or earlier for beta testers.
 
-    NOTE: number of days to adjust should be cached to avoid looking it up thousands of
-    times per query.
-
     NOTE: For now, this function assumes that the descriptor's location is in the course
     the user is looking at.  Once we have proper usages and definitions per the XBlock
     design, this should use the course the usage is in.
@@ -373,7 +498,7 @@ def _adjust_start_date_for_beta_testers(user, descriptor, course_context=None):
         # bail early if no beta testing is set up
         return descriptor.start
 
-    if CourseBetaTesterRole(descriptor.location, course_context=course_context).has_user(user):
+    if _course_roles(user, descriptor.location, course_context) & BETA_TESTER:
         debug("Adjust start time: user in beta role for %s", descriptor)
         delta = timedelta(descriptor.days_early_for_beta)
         effective = descriptor.start - delta
@@ -421,20 +546,13 @@ def _has_access_to_location(user, location, access_level, course_context):
         debug("Deny: unknown access level")
         return False
 
-    staff_access = (
-        CourseStaffRole(location, course_context).has_user(user) or
-        OrgStaffRole(location).has_user(user)
-    )
+    roles = _course_roles(user, location, course_context)
 
-    if staff_access and access_level == 'staff':
+    if (roles & STAFF_ROLES) and access_level == 'staff':
         debug("Allow: user has course staff access")
         return True
 
-    instructor_access = (
-        CourseInstructorRole(location, course_context).has_user(user) or
-        OrgInstructorRole(location).has_user(user)
-    )
-
+    instructor_access = roles & INSTRUCTOR_ROLES
     if instructor_access and access_level in ('staff', 'instructor'):
         debug("Allow: user has course instructor access")
         return True
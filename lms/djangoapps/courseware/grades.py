@@ -1,31 +1,41 @@
 # Compute grades using real division, with no integer truncation
 from __future__ import division
-from collections import defaultdict
+from collections import defaultdict, namedtuple
+import hashlib
+import itertools
 import json
 import random
 import logging
 
 from contextlib import contextmanager
 from django.conf import settings
-from django.db import transaction
+from django.db import IntegrityError, transaction
 from django.test.client import RequestFactory
+from django.utils import timezone
 
 from dogapi import dog_stats_api
 
 from courseware import courses
+from courseware.access import has_access
 from courseware.model_data import FieldDataCache
 from student.models import anonymous_id_for_user
 from submissions import api as sub_api
+from util.query import use_read_replica_if_available
+from xblock.fields import Scope
 from xmodule import graders
 from xmodule.graders import Score
 from xmodule.modulestore.django import modulestore
 from xmodule.modulestore.exceptions import ItemNotFoundError
 from xmodule.util.duedate import get_extended_due_date
-from .models import StudentModule
+from .models import StudentModule, StudentSectionScore
 from .module_render import get_module_for_descriptor
 
 log = logging.getLogger("edx.courseware")
 
+# Number of students whose StudentModules are read with a single query when
+# grading students in bulk
+BULK_GRADING_CHUNK_SIZE = 100
+
 
 def yield_dynamic_descriptor_descendents(descriptor, module_creator):
     """
@@ -50,6 +60,203 @@ def yield_dynamic_descriptor_descendents(descriptor, module_creator):
         yield next_descriptor
 
 
+SectionFingerprint = namedtuple("SectionFingerprint", "state_keys scored_keys always_recalculate content_hash")
+
+
+def section_fingerprint(section_descriptor):
+    """
+    Summarize the scorable content of a section as a SectionFingerprint:
+
+    - state_keys: location urls of the section and all of its possible
+      descendants, i.e. the module_state_keys its student state can live under
+    - scored_keys: location urls of the descendants that have a score
+    - always_recalculate: whether any descendant is always regraded
+    - content_hash: hash of everything about the scored descendants that
+      feeds into the section's scores: their settings, and their content
+      (which determines e.g. the max_score of problems)
+    """
+    state_keys = []
+    scored = []
+    always_recalculate = False
+    stack = [section_descriptor]
+    while stack:
+        descriptor = stack.pop()
+        stack.extend(descriptor.get_children())
+        location_url = descriptor.location.url()
+        state_keys.append(location_url)
+        always_recalculate = always_recalculate or descriptor.always_recalculate_grades
+        if descriptor.has_score:
+            scored.append((
+                location_url, descriptor.weight, descriptor.graded, descriptor.display_name_with_default,
+                descriptor.get_explicitly_set_fields_by_scope(Scope.content),
+            ))
+
+    return SectionFingerprint(
+        state_keys,
+        [score[0] for score in scored],
+        always_recalculate,
+        hashlib.md5(json.dumps(scored, sort_keys=True, default=unicode)).hexdigest(),
+    )
+
+
+class SectionScoreCache(object):
+    """
+    Read-through cache of section scores for a single student in a single
+    course, backed by the StudentSectionScore table.
+
+    The persisted rows and the modification times of all of the student's
+    StudentModules in the course are loaded with one query each up front, so
+    deciding whether a section has to be rescored costs no further queries.
+    A persisted row is fresh as long as the section content hasn't changed,
+    and the student's StudentModules in the section haven't either: none of
+    them was modified after the row was computed (which the `publish` grade
+    event in module_render, xqueue callbacks, rescoring and resetting attempts
+    all do), and the same ones still exist (resetting attempts and the
+    instructor task can delete them instead). Both are summarized by the
+    `content_hash` of the row (see `_row_hash`), so rows are invalidated
+    without extra bookkeeping.
+
+    Sections containing problems that are always regraded, or that are scored
+    through the submissions API, are never persisted, since their scores can
+    change without any StudentModule being saved.
+
+    The cache is only active if the ENABLE_PERSISTENT_SECTION_SCORES feature
+    flag is set (and `enabled` is True); otherwise every lookup misses and
+    nothing is written.
+    """
+
+    def __init__(self, student, course_id, submissions_scores, enabled=True):
+        self.student = student
+        self.course_id = course_id
+        self.submissions_scores = submissions_scores
+        self.enabled = (
+            enabled and
+            settings.FEATURES.get('ENABLE_PERSISTENT_SECTION_SCORES', False) and
+            student.is_authenticated()
+        )
+        self._fingerprints = {}
+        self._rows = {}
+        self._modified = {}
+
+        # Read the clock before the student state, so that writes which land
+        # while we are computing scores make the resulting rows stale.
+        self._computed = timezone.now()
+        if self.enabled:
+            with manual_transaction():
+                self._rows = {
+                    row.section_key: row
+                    for row in StudentSectionScore.objects.filter(student=student, course_id=course_id)
+                }
+                self._modified = dict(
+                    StudentModule.objects.filter(
+                        student=student, course_id=course_id
+                    ).values_list('module_state_key', 'modified')
+                )
+
+    def _fingerprint(self, section_descriptor):
+        """
+        Memoized `section_fingerprint`, or None if the section's scores can't
+        be persisted.
+        """
+        section_key = section_descriptor.location.url()
+        if section_key not in self._fingerprints:
+            fingerprint = section_fingerprint(section_descriptor)
+            if fingerprint.always_recalculate or any(
+                location_url in self.submissions_scores for location_url in fingerprint.scored_keys
+            ):
+                fingerprint = None
+            self._fingerprints[section_key] = fingerprint
+        return self._fingerprints[section_key]
+
+    def _row_hash(self, fingerprint):
+        """
+        Return the `content_hash` of the row of the section of `fingerprint`:
+        the hash of its content together with the set of the student's
+        StudentModules in it, so that deleting one makes the row stale.
+        """
+        state_keys = sorted(key for key in fingerprint.state_keys if key in self._modified)
+        return hashlib.md5(json.dumps([fingerprint.content_hash, state_keys])).hexdigest()
+
+    def has_state(self, descriptors):
+        """
+        Return whether the student has any StudentModule for one of
+        `descriptors`. Only meaningful if the cache is enabled.
+        """
+        return any(descriptor.location.url() in self._modified for descriptor in descriptors)
+
+    def get_scores(self, section_descriptor):
+        """
+        Return the persisted list of Scores for `section_descriptor`, or None
+        if there is no usable row for it.
+        """
+        if not self.enabled:
+            return None
+
+        row = self._rows.get(section_descriptor.location.url())
+        if row is None:
+            return None
+
+        fingerprint = self._fingerprint(section_descriptor)
+        if fingerprint is None or row.content_hash != self._row_hash(fingerprint):
+            return None
+
+        if any(self._modified[key] >= row.computed for key in fingerprint.state_keys if key in self._modified):
+            return None
+
+        return [Score(*score) for score in json.loads(row.scores)]
+
+    def set_scores(self, section_descriptor, scores):
+        """
+        Persist `scores` (a list of Scores) for `section_descriptor`, if its
+        scores can be persisted at all.
+        """
+        if not self.enabled:
+            return
+
+        fingerprint = self._fingerprint(section_descriptor)
+        if fingerprint is None:
+            return
+
+        section_key = section_descriptor.location.url()
+        row = self._rows.get(section_key)
+        if row is None:
+            row = StudentSectionScore(student=self.student, course_id=self.course_id, section_key=section_key)
+
+        row.content_hash = self._row_hash(fingerprint)
+        row.scores = json.dumps([list(score) for score in scores])
+        row.computed = self._computed
+        try:
+            with manual_transaction():
+                row.save()
+        except IntegrityError:
+            # A concurrent request stored the same section first. Its scores
+            # are at least as recent as ours, so just drop ours.
+            return
+
+        self._rows[section_key] = row
+
+
+def score_section(course_id, student, section_descriptor, module_creator, scores_cache=None):
+    """
+    Return a list of Scores, one for every scored descendant of
+    `section_descriptor` (including dynamic children), in course order.
+
+    Each Score carries the `graded` setting of the problem it belongs to.
+    See get_score() for the meaning of the arguments.
+    """
+    scores = []
+    for module_descriptor in yield_dynamic_descriptor_descendents(section_descriptor, module_creator):
+        (correct, total) = get_score(
+            course_id, student, module_descriptor, module_creator, scores_cache=scores_cache
+        )
+        if correct is None and total is None:
+            continue
+
+        scores.append(Score(correct, total, module_descriptor.graded, module_descriptor.display_name_with_default))
+
+    return scores
+
+
 def answer_distributions(course_id):
     """
     Given a course_id, return answer distributions in the form of a dictionary
@@ -147,16 +354,16 @@ def answer_distributions(course_id):
     return answer_counts
 
 @transaction.commit_manually
-def grade(student, request, course, keep_raw_scores=False):
+def grade(student, request, course, keep_raw_scores=False, use_persisted_scores=True):
     """
     Wraps "_grade" with the manual_transaction context manager just in case
     there are unanticipated errors.
     """
     with manual_transaction():
-        return _grade(student, request, course, keep_raw_scores)
+        return _grade(student, request, course, keep_raw_scores, use_persisted_scores)
 
 
-def _grade(student, request, course, keep_raw_scores):
+def _grade(student, request, course, keep_raw_scores, use_persisted_scores):
     """
     Unwrapped version of "grade"
 
@@ -175,16 +382,105 @@ def _grade(student, request, course, keep_raw_scores):
     - keep_raw_scores : if True, then value for key 'raw_scores' contains scores
       for every graded module
 
+    If use_persisted_scores is False, persisted section scores are neither read
+    nor written, and every section is scored from scratch.
+
     More information on the format is in the docstring for CourseGrader.
     """
-    grading_context = course.grading_context
-    raw_scores = []
-
     # Dict of item_ids -> (earned, possible) point tuples. This *only* grabs
     # scores that were registered with the submissions API, which for the moment
     # means only openassessment (edx-ora2)
     submissions_scores = sub_api.get_scores(course.id, anonymous_id_for_user(student, course.id))
 
+    section_score_cache = SectionScoreCache(student, course.id, submissions_scores, enabled=use_persisted_scores)
+
+    def section_scorer(section):
+        """Score `section` for `student`, instantiating modules as needed."""
+        return _score_graded_section(student, request, course, section, submissions_scores, section_score_cache)
+
+    return _grade_summary(course, section_scorer, keep_raw_scores)
+
+
+def _score_graded_section(student, request, course, section, submissions_scores, section_score_cache):
+    """
+    Return the list of Scores of one entry of `course.grading_context['graded_sections']`
+    for `student`, or None if the student hasn't seen a single problem in the
+    section and it doesn't have to be graded at all.
+    """
+    section_descriptor = section['section_descriptor']
+
+    # some problems have state that is updated independently of interaction
+    # with the LMS, so they need to always be scored. (E.g. foldit.,
+    # combinedopenended)
+    should_grade_section = any(
+        descriptor.always_recalculate_grades for descriptor in section['xmoduledescriptors']
+    )
+
+    # If there are no problems that always have to be regraded, check to
+    # see if any of our locations are in the scores from the submissions
+    # API. If scores exist, we have to calculate grades for this section.
+    if not should_grade_section:
+        should_grade_section = any(
+            descriptor.location.url() in submissions_scores
+            for descriptor in section['xmoduledescriptors']
+        )
+
+    if not should_grade_section:
+        if section_score_cache.enabled:
+            should_grade_section = section_score_cache.has_state(section['xmoduledescriptors'])
+        else:
+            with manual_transaction():
+                should_grade_section = StudentModule.objects.filter(
+                    student=student,
+                    module_state_key__in=[
+                        descriptor.location for descriptor in section['xmoduledescriptors']
+                    ]
+                ).exists()
+
+    # If we haven't seen a single problem in the section, we don't have
+    # to grade it at all! We can assume 0%
+    if not should_grade_section:
+        return None
+
+    scores = section_score_cache.get_scores(section_descriptor)
+    if scores is None:
+        scores = score_section(
+            course.id, student, section_descriptor, _module_creator(student, request, course),
+            scores_cache=submissions_scores
+        )
+        section_score_cache.set_scores(section_descriptor, scores)
+
+    return scores
+
+
+def _module_creator(student, request, course):
+    """
+    Return a function that creates an XModule instance for `student` given a
+    descriptor (or None if the student has no access to it).
+    """
+    def create_module(descriptor):
+        '''creates an XModule instance given a descriptor'''
+        # TODO: We need the request to pass into here. If we could forego that, our arguments
+        # would be simpler
+        with manual_transaction():
+            field_data_cache = FieldDataCache([descriptor], course.id, student)
+        return get_module_for_descriptor(student, request, descriptor, field_data_cache, course.id)
+
+    return create_module
+
+
+def _grade_summary(course, section_scorer, keep_raw_scores):
+    """
+    Run the grader of `course` over its graded sections and return the grade
+    summary described in `_grade`.
+
+    section_scorer is called with every entry of
+    `course.grading_context['graded_sections']` and returns the list of Scores
+    for that section, or None if the section counts as 0%.
+    """
+    grading_context = course.grading_context
+    raw_scores = []
+
     totaled_scores = {}
     # This next complicated loop is just to collect the totaled_scores, which is
     # passed to the grader
@@ -194,68 +490,25 @@ def _grade(student, request, course, keep_raw_scores):
             section_descriptor = section['section_descriptor']
             section_name = section_descriptor.display_name_with_default
 
-            # some problems have state that is updated independently of interaction
-            # with the LMS, so they need to always be scored. (E.g. foldit.,
-            # combinedopenended)
-            should_grade_section = any(
-                descriptor.always_recalculate_grades for descriptor in section['xmoduledescriptors']
-            )
-
-            # If there are no problems that always have to be regraded, check to
-            # see if any of our locations are in the scores from the submissions
-            # API. If scores exist, we have to calculate grades for this section.
-            if not should_grade_section:
-                should_grade_section = any(
-                    descriptor.location.url() in submissions_scores
-                    for descriptor in section['xmoduledescriptors']
-                )
-
-            if not should_grade_section:
-                with manual_transaction():
-                    should_grade_section = StudentModule.objects.filter(
-                        student=student,
-                        module_state_key__in=[
-                            descriptor.location for descriptor in section['xmoduledescriptors']
-                        ]
-                    ).exists()
-
-            # If we haven't seen a single problem in the section, we don't have
-            # to grade it at all! We can assume 0%
-            if should_grade_section:
-                scores = []
-
-                def create_module(descriptor):
-                    '''creates an XModule instance given a descriptor'''
-                    # TODO: We need the request to pass into here. If we could forego that, our arguments
-                    # would be simpler
-                    with manual_transaction():
-                        field_data_cache = FieldDataCache([descriptor], course.id, student)
-                    return get_module_for_descriptor(student, request, descriptor, field_data_cache, course.id)
-
-                for module_descriptor in yield_dynamic_descriptor_descendents(section_descriptor, create_module):
-
-                    (correct, total) = get_score(
-                        course.id, student, module_descriptor, create_module, scores_cache=submissions_scores
-                    )
-                    if correct is None and total is None:
-                        continue
-
+            scores = section_scorer(section)
+            if scores is not None:
+                graded_scores = []
+                for correct, total, graded, display_name in scores:
                     if settings.GENERATE_PROFILE_SCORES:  	# for debugging!
                         if total > 1:
                             correct = random.randrange(max(total - 2, 1), total + 1)
                         else:
                             correct = total
 
-                    graded = module_descriptor.graded
                     if not total > 0:
                         #We simply cannot grade a problem that is 12/0, because we might need it as a percentage
                         graded = False
 
-                    scores.append(Score(correct, total, graded, module_descriptor.display_name_with_default))
+                    graded_scores.append(Score(correct, total, graded, display_name))
 
-                _, graded_total = graders.aggregate_scores(scores, section_name)
+                _, graded_total = graders.aggregate_scores(graded_scores, section_name)
                 if keep_raw_scores:
-                    raw_scores += scores
+                    raw_scores += graded_scores
             else:
                 graded_total = Score(0.0, 1.0, True, section_name)
 
@@ -351,6 +604,7 @@ def _progress_summary(student, request, course):
             return None
 
     submissions_scores = sub_api.get_scores(course.id, anonymous_id_for_user(student, course.id))
+    section_score_cache = SectionScoreCache(student, course.id, submissions_scores)
 
     chapters = []
     # Don't include chapters that aren't displayable (e.g. due to error)
@@ -368,19 +622,19 @@ def _progress_summary(student, request, course):
                     continue
 
                 graded = section_module.graded
-                scores = []
 
-                module_creator = section_module.xmodule_runtime.get_module
-
-                for module_descriptor in yield_dynamic_descriptor_descendents(section_module, module_creator):
-                    course_id = course.id
-                    (correct, total) = get_score(
-                        course_id, student, module_descriptor, module_creator, scores_cache=submissions_scores
+                section_scores = section_score_cache.get_scores(section_module)
+                if section_scores is None:
+                    section_scores = score_section(
+                        course.id, student, section_module, section_module.xmodule_runtime.get_module,
+                        scores_cache=submissions_scores
                     )
-                    if correct is None and total is None:
-                        continue
+                    section_score_cache.set_scores(section_module, section_scores)
 
-                    scores.append(Score(correct, total, graded, module_descriptor.display_name_with_default))
+                scores = [
+                    Score(correct, total, graded, display_name)
+                    for correct, total, _, display_name in section_scores
+                ]
 
                 scores.reverse()
                 section_total, _ = graders.aggregate_scores(
@@ -475,11 +729,18 @@ def get_score(course_id, user, problem_descriptor, module_creator, scores_cache=
         if total is None:
             return (None, None)
 
-    # Now we re-weight the problem, if specified
+    return weighted_score(problem_descriptor, correct, total)
+
+
+def weighted_score(problem_descriptor, correct, total):
+    """
+    Re-weight the raw score (correct, total) of a problem if it has a weight
+    specified, and return it as a tuple (correct, total).
+    """
     weight = problem_descriptor.weight
     if weight is not None:
         if total == 0:
-            log.exception("Cannot reweight a problem with zero total points. Problem: " + str(student_module))
+            log.exception("Cannot reweight a problem with zero total points. Problem: " + problem_descriptor.location.url())
             return (correct, total)
         correct = correct * weight / total
         total = weight
@@ -547,3 +808,185 @@ def iterate_grades_for(course_id, students):
                     exc.message
                 )
                 yield student, {}, exc.message
+
+
+def iterate_bulk_grades_for(course_id, students, chunk_size=BULK_GRADING_CHUNK_SIZE):
+    """
+    Like `iterate_grades_for`, but optimized for grading many students at once.
+
+    Instead of looking up every problem of every student separately, the
+    scores of `chunk_size` students are read with one query (from the read
+    replica, if there is one) and all students are graded against the same
+    course tree. Problems a student hasn't been scored on are instantiated
+    once per course to find their maximum score, rather than once per student.
+
+    Sections whose problems depend on student state (dynamic children such as
+    randomize blocks), contain problems that are always regraded, or contain
+    problems scored through the submissions API for a given student are graded
+    the same way `grade` would do it.
+
+    Yields the same (student, gradeset, err_msg) tuples as `iterate_grades_for`.
+    """
+    course = courses.get_course_by_id(course_id)
+    bulk_sections = _bulk_scorable_sections(course)
+
+    # location url -> max score of problems, shared by all students
+    max_scores = {}
+
+    # We make a fake request because grading code expects to be able to look at
+    # the request. See iterate_grades_for.
+    request = RequestFactory().get('/')
+
+    students = iter(students)
+    while True:
+        chunk = list(itertools.islice(students, chunk_size))
+        if not chunk:
+            break
+
+        student_module_scores = _student_module_scores(course_id, chunk)
+        for student in chunk:
+            with dog_stats_api.timer('lms.grades.iterate_bulk_grades_for', tags=['action:{}'.format(course_id)]):
+                try:
+                    request.user = student
+                    request.session = {}
+                    gradeset = _bulk_grade(
+                        student, request, course, bulk_sections, student_module_scores[student.id], max_scores
+                    )
+                    yield student, gradeset, ""
+                except Exception as exc:  # pylint: disable=broad-except
+                    # Keep marching on even if this student couldn't be graded for
+                    # some reason, but log it for future reference.
+                    log.exception(
+                        'Cannot grade student %s (%s) in course %s because of exception: %s',
+                        student.username,
+                        student.id,
+                        course_id,
+                        exc.message
+                    )
+                    yield student, {}, exc.message
+
+
+def _bulk_scorable_sections(course):
+    """
+    Return the location urls of the graded sections of `course` that can be
+    scored from StudentModule rows alone: those without dynamic children and
+    without problems that are always regraded.
+    """
+    section_urls = set()
+    for sections in course.grading_context['graded_sections'].itervalues():
+        for section in sections:
+            stack = [section['section_descriptor']]
+            while stack:
+                descriptor = stack.pop()
+                if descriptor.has_dynamic_children() or descriptor.always_recalculate_grades:
+                    break
+                stack.extend(descriptor.get_children())
+            else:
+                section_urls.add(section['section_descriptor'].location.url())
+
+    return section_urls
+
+
+def _student_module_scores(course_id, students):
+    """
+    Return a dict mapping the id of every student in `students` to a dict of
+    {module_state_key: (grade, max_grade)} for all of the student's
+    StudentModules in `course_id`, read with a single query.
+    """
+    scores = defaultdict(dict)
+    student_modules = use_read_replica_if_available(
+        StudentModule.objects.filter(
+            course_id=course_id,
+            student__in=[student.id for student in students]
+        ).order_by('student', 'id')
+    ).values_list('student_id', 'module_state_key', 'grade', 'max_grade')
+
+    for student_id, module_state_key, student_grade, max_grade in student_modules:
+        scores[student_id][module_state_key] = (student_grade, max_grade)
+
+    return scores
+
+
+@transaction.commit_manually
+def _bulk_grade(student, request, course, bulk_sections, student_module_scores, max_scores):
+    """
+    Grade `student` the way `grade` does, but score the sections in
+    `bulk_sections` from `student_module_scores` (as returned by
+    `_student_module_scores`) and `max_scores`, a cache of the maximum scores
+    of problems shared between students.
+    """
+    with manual_transaction():
+        submissions_scores = sub_api.get_scores(course.id, anonymous_id_for_user(student, course.id))
+        create_module = _module_creator(student, request, course)
+
+        # Only sections that can't be scored in bulk need the persisted
+        # section scores, so only load them if there is one.
+        section_score_caches = []
+
+        def bulk_score(problem_descriptor):
+            """
+            Return the (correct, total) score of `problem_descriptor`, with
+            the same semantics as `get_score`.
+            """
+            location_url = problem_descriptor.location.url()
+            student_grade, max_grade = student_module_scores.get(location_url, (None, None))
+            if max_grade is not None:
+                correct = student_grade if student_grade is not None else 0
+                total = max_grade
+            else:
+                # The student has not been scored on this problem, so we need
+                # the max score of the problem -- which is the same for all
+                # students, so only the first student who has access to the
+                # problem pays for instantiating it.
+                if not has_access(student, problem_descriptor, 'load', course.id):
+                    return (None, None)
+
+                if location_url not in max_scores:
+                    problem = create_module(problem_descriptor)
+                    if problem is None:
+                        return (None, None)
+                    max_scores[location_url] = problem.max_score()
+
+                correct = 0.0
+                total = max_scores[location_url]
+
+                # Problem may be an error module (if something in the problem builder failed)
+                # In which case total might be None
+                if total is None:
+                    return (None, None)
+
+            return weighted_score(problem_descriptor, correct, total)
+
+        def section_scorer(section):
+            """Score `section` from StudentModule rows if possible."""
+            section_descriptor = section['section_descriptor']
+            if section_descriptor.location.url() not in bulk_sections or any(
+                descriptor.location.url() in submissions_scores for descriptor in section['xmoduledescriptors']
+            ):
+                if not section_score_caches:
+                    section_score_caches.append(SectionScoreCache(student, course.id, submissions_scores))
+                return _score_graded_section(
+                    student, request, course, section, submissions_scores, section_score_caches[0]
+                )
+
+            # If we haven't seen a single problem in the section, we don't have
+            # to grade it at all! We can assume 0%
+            if not any(descriptor.location.url() in student_module_scores for descriptor in section['xmoduledescriptors']):
+                return None
+
+            scores = []
+            # Bulk scorable sections have no dynamic children, so this never
+            # needs to create a module.
+            for module_descriptor in yield_dynamic_descriptor_descendents(section_descriptor, create_module):
+                if not module_descriptor.has_score:
+                    continue
+
+                (correct, total) = bulk_score(module_descriptor)
+                if correct is None and total is None:
+                    continue
+
+                scores.append(Score(correct, total, module_descriptor.graded, module_descriptor.display_name_with_default))
+
+            return scores
+
+        return _grade_summary(course, section_scorer, keep_raw_scores=False)
@@ -0,0 +1,294 @@
+"""
+Batched, asynchronous writing of StudentModuleHistory rows.
+
+When the ENABLE_ASYNC_STUDENT_MODULE_HISTORY feature is enabled, the history
+entries of StudentModules are not inserted by the request which saved the
+StudentModule, but queued and inserted in batches by a background thread.
+
+Entries of the same StudentModule created less than
+StudentModuleHistoryCleaner.DELETE_GAP_SECS apart are coalesced before they
+are written, keeping only the last one, since the clean_history command would
+delete the others anyway.
+
+The writer is configured by settings.STUDENT_MODULE_HISTORY_WRITER::
+
+  STUDENT_MODULE_HISTORY_WRITER = {
+      'BATCH_SIZE': 500,
+      'FLUSH_INTERVAL': 1.0,
+      'MAX_QUEUE_SIZE': 10000,
+  }
+
+"""
+
+import atexit
+import logging
+import os
+import threading
+import time
+
+from dogapi import dog_stats_api
+from django.conf import settings
+from django.db import connection, DatabaseError, IntegrityError, transaction
+
+from courseware.management.commands.clean_history import StudentModuleHistoryCleaner
+
+
+log = logging.getLogger(__name__)
+
+
+class StudentModuleHistoryWriter(object):
+    """
+    Queue StudentModuleHistory entries in memory, and insert them in batches
+    from a background thread.
+
+    Entries are inserted once `batch_size` of them are queued, or
+    `flush_interval` seconds after the first of them was queued, whichever
+    comes first. When `max_queue_size` entries are queued, the caller waits
+    (up to `flush_interval` seconds) for the background thread to catch up,
+    rather than inserting them itself: it may be in the middle of a managed
+    transaction, which the inserts would join. Queued entries are flushed
+    when the process exits.
+
+    """
+
+    # Entries which failed to insert because their StudentModule wasn't
+    # committed yet are retried this many times
+    MAX_RETRIES = 1
+
+    def __init__(self, batch_size=500, flush_interval=1.0, max_queue_size=10000):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue_size = max_queue_size
+
+        # student_module_id -> list of the entries queued for it, oldest first
+        self._pending = {}
+        self._queued = 0
+        self._first_queued_at = None
+        # entries to retry, with the number of times they failed
+        self._retries = []
+        self._lock = threading.Condition(threading.Lock())
+
+        self._worker = None
+        self._worker_pid = None
+        self._flushing = threading.Lock()
+
+        atexit.register(self.flush)
+
+    def add(self, entries):
+        """
+        Queue the (unsaved) StudentModuleHistory `entries` to be inserted.
+        """
+        self._ensure_worker()
+
+        overflow = False
+        with self._lock:
+            for entry in entries:
+                self._queue_entry(entry)
+            if self._queued >= self.max_queue_size:
+                overflow = True
+            elif self._queued >= self.batch_size:
+                self._lock.notify()
+
+        if overflow:
+            dog_stats_api.increment('courseware.history.overflow')
+            self._wait_for_room()
+
+    def _wait_for_room(self):
+        """
+        Wake the worker thread up, and wait until it has taken enough entries
+        off the queue to get it under `max_queue_size`, or for
+        `flush_interval` seconds. The entries stay queued either way.
+        """
+        deadline = time.time() + self.flush_interval
+        with self._lock:
+            self._lock.notify_all()
+            while self._queued >= self.max_queue_size:
+                timeout = deadline - time.time()
+                if timeout <= 0:
+                    log.warning('%d student module history entries queued', self._queued)
+                    return
+                self._lock.wait(timeout)
+
+    def flush(self):
+        """
+        Insert all the queued entries, from the calling thread.
+
+        Entries which fail to insert are retried by the next flush.
+        """
+        with self._flushing:
+            with self._lock:
+                retries, self._retries = self._retries, []
+            if retries:
+                self._write(retries)
+            while True:
+                batch = self._take_batch()
+                if not batch:
+                    break
+                self._write(batch)
+
+    def _queue_entry(self, entry):
+        """
+        Queue `entry`, replacing the last entry queued for the same
+        StudentModule if it was created less than DELETE_GAP_SECS before it.
+        Must be called with the lock held.
+        """
+        queued = self._pending.setdefault(entry.student_module_id, [])
+        if queued:
+            gap = (entry.created - queued[-1].created).total_seconds()
+            if 0 <= gap < StudentModuleHistoryCleaner.DELETE_GAP_SECS:
+                queued[-1] = entry
+                dog_stats_api.increment('courseware.history.coalesced')
+                return
+
+        queued.append(entry)
+        self._queued += 1
+        if self._first_queued_at is None:
+            self._first_queued_at = time.time()
+
+    def _take_batch(self):
+        """
+        Take up to `batch_size` queued entries off the queue. Returns a list
+        of (entry, failures) pairs.
+        """
+        with self._lock:
+            batch = []
+            while self._pending and len(batch) < self.batch_size:
+                _, entries = self._pending.popitem()
+                batch.extend((entry, 0) for entry in entries)
+                self._queued -= len(entries)
+            if not self._pending:
+                self._first_queued_at = None
+            if batch:
+                # callers may be waiting for room in the queue
+                self._lock.notify_all()
+            return batch
+
+    def _write(self, batch):
+        """
+        Insert the entries of `batch` in one query, or one by one if that
+        fails.
+        """
+        from courseware.models import StudentModuleHistory
+
+        entries = [entry for entry, _ in batch]
+        try:
+            with dog_stats_api.timer('courseware.history.write'):
+                StudentModuleHistory.objects.bulk_create(entries)
+            transaction.commit_unless_managed()
+        except DatabaseError:
+            transaction.rollback_unless_managed()
+            log.warning('Bulk insert of %d history entries failed, inserting them one by one', len(entries))
+            for entry, failures in batch:
+                self._write_one(entry, failures)
+        else:
+            dog_stats_api.increment('courseware.history.written', len(entries))
+        finally:
+            if threading.current_thread() is self._worker:
+                # the worker thread's connection would otherwise stay open
+                # (and in the same transaction) for the life of the process
+                connection.close()
+
+    def _write_one(self, entry, failures):
+        """Insert `entry` on its own, queueing it to be retried if it fails."""
+        try:
+            entry.save(force_insert=True)
+            transaction.commit_unless_managed()
+        except DatabaseError as error:
+            transaction.rollback_unless_managed()
+            entry.pk = None
+            if isinstance(error, IntegrityError) and failures < self.MAX_RETRIES:
+                # Likely the request which saved the StudentModule hadn't
+                # committed it yet
+                with self._lock:
+                    self._retries.append((entry, failures + 1))
+            else:
+                dog_stats_api.increment('courseware.history.failed')
+                log.exception('Could not save history entry of student_module_id %s', entry.student_module_id)
+        else:
+            dog_stats_api.increment('courseware.history.written')
+
+    def _worker_alive(self):
+        """Whether the worker thread is running in this process."""
+        return (
+            self._worker is not None and
+            self._worker_pid == os.getpid() and
+            self._worker.is_alive()
+        )
+
+    def _ensure_worker(self):
+        """
+        Start the worker thread, in this process, if it isn't running.
+
+        Threads do not survive a fork, so a process forked after the writer
+        was created starts a worker of its own.
+        """
+        if self._worker_alive():
+            return
+
+        with self._lock:
+            if self._worker_alive():
+                return
+            if self._worker_pid != os.getpid():
+                # Entries queued by the parent process belong to it
+                self._pending = {}
+                self._queued = 0
+                self._first_queued_at = None
+                self._retries = []
+            self._worker = threading.Thread(target=self._run, name='student-module-history-writer')
+            self._worker.daemon = True
+            self._worker_pid = os.getpid()
+            self._worker.start()
+
+    def _run(self):
+        """Worker thread loop."""
+        while True:
+            self._wait_for_batch()
+            try:
+                self.flush()
+            except Exception:  # pylint: disable=broad-except
+                log.exception('Error writing student module history')
+
+    def _wait_for_batch(self):
+        """
+        Wait until a full batch (or a full queue) is queued, or the oldest
+        queued entry has waited `flush_interval` seconds.
+        """
+        with self._lock:
+            while True:
+                if self._queued >= min(self.batch_size, self.max_queue_size):
+                    return
+                if self._first_queued_at is None:
+                    self._lock.wait(self.flush_interval)
+                    if self._retries:
+                        return
+                    continue
+                timeout = self._first_queued_at + self.flush_interval - time.time()
+                if timeout <= 0:
+                    return
+                self._lock.wait(timeout)
+
+
+_WRITER = None
+_WRITER_LOCK = threading.Lock()
+
+
+def history_writer():
+    """
+    Return the process-wide StudentModuleHistoryWriter, or None if history
+    entries are to be written synchronously.
+    """
+    global _WRITER  # pylint: disable=global-statement
+
+    if not settings.FEATURES.get('ENABLE_ASYNC_STUDENT_MODULE_HISTORY', False):
+        return None
+
+    if _WRITER is None:
+        with _WRITER_LOCK:
+            if _WRITER is None:
+                options = getattr(settings, 'STUDENT_MODULE_HISTORY_WRITER', {})
+                _WRITER = StudentModuleHistoryWriter(
+                    batch_size=options.get('BATCH_SIZE', 500),
+                    flush_interval=options.get('FLUSH_INTERVAL', 1.0),
+                    max_queue_size=options.get('MAX_QUEUE_SIZE', 10000),
+                )
+    return _WRITER
@@ -0,0 +1,93 @@
+"""
+Compute and store persisted section scores (StudentSectionScore) for every
+student enrolled in a course, optionally checking the resulting grades against
+grades computed without persisted scores.
+"""
+
+from optparse import make_option
+from textwrap import dedent
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.client import RequestFactory
+
+from courseware import courses, grades
+from courseware.models import StudentSectionScore
+from student.models import CourseEnrollment
+
+
+class Command(BaseCommand):
+    """
+    Backfill persisted section scores for all students enrolled in a course.
+
+    With --verify, every student is graded a second time without using
+    persisted scores and any mismatch is reported.
+    """
+    help = dedent(__doc__).strip()
+    args = '<course_id>'
+    option_list = BaseCommand.option_list + (
+        make_option('--reset',
+                    action='store_true',
+                    default=False,
+                    help='Delete all persisted section scores for the course before backfilling.'),
+        make_option('--verify',
+                    action='store_true',
+                    default=False,
+                    help='Compare grades computed from persisted scores with grades computed from scratch.'),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError("backfill_section_scores requires one argument: <course_id>")
+
+        if not settings.FEATURES.get('ENABLE_PERSISTENT_SECTION_SCORES', False):
+            raise CommandError("The ENABLE_PERSISTENT_SECTION_SCORES feature is not enabled")
+
+        course_id = args[0]
+        try:
+            course = courses.get_course_by_id(course_id)
+        except Exception:  # pylint: disable=broad-except
+            raise CommandError("Unknown course {}".format(course_id))
+
+        if options['reset']:
+            StudentSectionScore.objects.filter(course_id=course_id).delete()
+
+        # Grading expects a request; see grades.iterate_grades_for
+        request = RequestFactory().get('/')
+        request.session = {}
+
+        num_students = 0
+        mismatches = []
+        for student in CourseEnrollment.users_enrolled_in(course_id):
+            request.user = student
+            gradeset = grades.grade(student, request, course)
+            num_students += 1
+
+            if options['verify']:
+                expected = grades.grade(student, request, course, use_persisted_scores=False)
+                if _summarize(gradeset) != _summarize(expected):
+                    mismatches.append(student.username)
+                    self.stdout.write(
+                        u"Mismatch for {}: persisted {} vs. computed {}\n".format(
+                            student.username, gradeset['percent'], expected['percent']
+                        )
+                    )
+
+        self.stdout.write("Scored {} students in {}\n".format(num_students, course_id))
+        if options['verify']:
+            self.stdout.write("{} mismatches\n".format(len(mismatches)))
+
+
+def _summarize(gradeset):
+    """
+    Return the parts of a gradeset that have to agree between the persisted
+    and the slow path.
+    """
+    return (
+        gradeset['percent'],
+        gradeset['grade'],
+        sorted(
+            (section_format, [tuple(score) for score in scores])
+            for section_format, scores in gradeset['totaled_scores'].iteritems()
+        ),
+    )
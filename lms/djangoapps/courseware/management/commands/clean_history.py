@@ -6,17 +6,35 @@ need to clean out the unnecessary rows from the database.
 
 This command that does that.
 
+It also enforces the retention policy of the history, if there is one: only
+the last `KEEP_VERSIONS` rows of each StudentModule are kept, and rows older
+than `MAX_AGE_DAYS` are deleted (except for the last one of each
+StudentModule). The policy comes from settings.STUDENT_MODULE_HISTORY_RETENTION,
+or from the --keep-versions and --max-age-days options.
+
+Unlike the cleaning, which walks the StudentModules once (resuming where it
+stopped), the retention policy is enforced on every run, on the StudentModules
+with rows created since the previous run (for KEEP_VERSIONS) or before the
+MAX_AGE_DAYS cutoff, so the command is meant to be run periodically.
+
 """
 
+import calendar
 import datetime
 import json
 import logging
+import operator
 import optparse
 import time
 import traceback
 
+from django.conf import settings
 from django.core.management.base import NoArgsCommand
 from django.db import connection
+from django.db.models import Q
+from django.utils.timezone import UTC
+
+from courseware.models import StudentModuleHistory
 
 
 class Command(NoArgsCommand):
@@ -43,14 +61,36 @@ class Command(NoArgsCommand):
             default=0,
             help="Seconds to sleep between batches.",
         ),
+        optparse.make_option(
+            '--keep-versions',
+            type='int',
+            default=None,
+            help="Number of history rows to keep per student module.",
+        ),
+        optparse.make_option(
+            '--max-age-days',
+            type='float',
+            default=None,
+            help="Delete history rows older than this, except the last one of each student module.",
+        ),
     )
 
     def handle_noargs(self, **options):
         # We don't want to see the SQL output from the db layer.
         logging.getLogger("django.db.backends").setLevel(logging.INFO)
 
+        retention = getattr(settings, 'STUDENT_MODULE_HISTORY_RETENTION', {})
+        keep_versions = options["keep_versions"]
+        if keep_versions is None:
+            keep_versions = retention.get('KEEP_VERSIONS')
+        max_age_days = options["max_age_days"]
+        if max_age_days is None:
+            max_age_days = retention.get('MAX_AGE_DAYS')
+
         smhc = StudentModuleHistoryCleaner(
             dry_run=options["dry_run"],
+            keep_versions=keep_versions,
+            max_age=datetime.timedelta(days=max_age_days) if max_age_days is not None else None,
         )
         smhc.main(batch_size=options["batch"], sleep=options["sleep"])
 
@@ -60,12 +100,24 @@ class StudentModuleHistoryCleaner(object):
 
     DELETE_GAP_SECS = 0.5   # Rows this close can be discarded.
     STATE_FILE = "clean_history.json"
+    PRUNE_STATE_FILE = "clean_history_prune.json"
     BATCH_SIZE = 100
 
-    def __init__(self, dry_run=False):
+    def __init__(self, dry_run=False, keep_versions=None, max_age=None):
+        """
+        `keep_versions`: if not None, the number of rows to keep per student
+        module.
+
+        `max_age`: if not None, a timedelta; older rows are deleted, except
+        the last row of each student module.
+
+        """
         self.dry_run = dry_run
+        self.keep_versions = keep_versions
+        self.max_age = max_age
         self.next_student_module_id = 0
         self.last_student_module_id = 0
+        self.last_pruned = None
 
     def main(self, batch_size=None, sleep=0):
         """Invoked from the management command to do all the work."""
@@ -90,6 +142,34 @@ class StudentModuleHistoryCleaner(object):
             if sleep:
                 time.sleep(sleep)
 
+        if self.keep_versions is not None or self.max_age is not None:
+            self.prune(batch_size, sleep)
+
+    def prune(self, batch_size, sleep=0):
+        """
+        Enforce the retention policy on the StudentModules whose history may
+        have gone past it since the last time.
+        """
+        started = datetime.datetime.now(UTC())
+        self.load_prune_state()
+
+        smids = self.module_ids_to_prune(started)
+        for start in range(0, len(smids), batch_size):
+            for smid in smids[start:start + batch_size]:
+                try:
+                    self.prune_one_student_module(smid)
+                except Exception:       # pylint: disable=W0703
+                    trace = traceback.format_exc()
+                    self.say("Couldn't prune student_module_id {}:\n{}".format(smid, trace))
+            if not self.dry_run:
+                self.commit()
+            if sleep:
+                time.sleep(sleep)
+
+        if not self.dry_run:
+            self.last_pruned = started
+            self.save_prune_state()
+
     def say(self, message):
         """
         Display a message to the user.
@@ -136,6 +216,29 @@ class StudentModuleHistoryCleaner(object):
             json.dump(state, state_file)
         self.say("Saved state: {}".format(json.dumps(state, sort_keys=True)))
 
+    def load_prune_state(self):
+        """
+        Load the time of the last pruning from disk.
+        """
+        try:
+            state_file = open(self.PRUNE_STATE_FILE)
+        except IOError:
+            self.last_pruned = None
+        else:
+            with state_file:
+                state = json.load(state_file)
+            self.last_pruned = datetime.datetime.fromtimestamp(state['last_pruned'], UTC())
+
+    def save_prune_state(self):
+        """
+        Save the time of the last pruning to disk.
+        """
+        state = {
+            'last_pruned': calendar.timegm(self.last_pruned.utctimetuple()),
+        }
+        with open(self.PRUNE_STATE_FILE, "w") as state_file:
+            json.dump(state, state_file)
+
     def get_last_student_module_id(self):
         """
         Return the id of the last student_module.
@@ -202,6 +305,49 @@ class StudentModuleHistoryCleaner(object):
             """.format(ids=",".join(str(i) for i in ids_to_delete))
         )
 
+    def module_ids_to_prune(self, now):
+        """
+        Return the sorted ids of the student modules which may have history
+        rows past the retention policy: the ones with rows created since the
+        last pruning if `keep_versions` is set (all of them the first time),
+        and the ones with rows older than `max_age`.
+        """
+        rows = StudentModuleHistory.objects.all()
+        if self.keep_versions is None or self.last_pruned is not None:
+            conditions = []
+            if self.keep_versions is not None:
+                conditions.append(Q(created__gte=self.last_pruned))
+            if self.max_age is not None:
+                conditions.append(Q(created__lt=now - self.max_age))
+            if not conditions:
+                return []
+            rows = rows.filter(reduce(operator.or_, conditions))
+
+        return list(
+            rows.order_by('student_module')
+            .values_list('student_module', flat=True)
+            .distinct()
+        )
+
+    def ids_past_retention(self, history):
+        """
+        Return the ids of the rows of `history` (as returned by
+        get_history_for_student_modules) which the retention policy doesn't
+        keep.
+        """
+        expired = set()
+        if self.keep_versions is not None:
+            expired.update(history_id for history_id, _ in history[:-max(self.keep_versions, 1)])
+        if self.max_age is not None:
+            cutoff = datetime.datetime.now(UTC()) - self.max_age
+            for history_id, created in history[:-1]:
+                if created.tzinfo is None:
+                    created = created.replace(tzinfo=UTC())
+                if created < cutoff:
+                    expired.add(history_id)
+        # newest first, like the rows closely followed by others
+        return [history_id for history_id, _ in reversed(history) if history_id in expired]
+
     def clean_one_student_module(self, student_module_id):
         """Clean one StudentModule's-worth of history.
 
@@ -237,3 +383,23 @@ class StudentModuleHistoryCleaner(object):
 
         if ids_to_delete and not self.dry_run:
             self.delete_history(ids_to_delete)
+
+    def prune_one_student_module(self, student_module_id):
+        """Enforce the retention policy on one StudentModule's history.
+
+        `student_module_id`: the id of the StudentModule to process.
+
+        """
+        history = self.get_history_for_student_modules(student_module_id)
+        ids_to_delete = self.ids_past_retention(history)
+
+        verb = "Would have pruned" if self.dry_run else "Pruning"
+        self.say("{verb} {to_delete} rows of {total} for student_module_id {id}".format(
+            verb=verb,
+            to_delete=len(ids_to_delete),
+            total=len(history),
+            id=student_module_id,
+        ))
+
+        if ids_to_delete and not self.dry_run:
+            self.delete_history(ids_to_delete)
@@ -1,5 +1,6 @@
 """Test the clean_history management command."""
 
+import datetime
 import fnmatch
 from mock import Mock
 import os.path
@@ -9,6 +10,7 @@ import dateutil.parser
 
 from django.test import TransactionTestCase
 from django.db import connection
+from django.utils.timezone import UTC
 
 from courseware.management.commands.clean_history import StudentModuleHistoryCleaner
 
@@ -66,8 +68,9 @@ class HistoryCleanerTest(TransactionTestCase):
 
     def clean_up_state_file(self):
         """Remove any state file lying around."""
-        if os.path.exists(StudentModuleHistoryCleaner.STATE_FILE):
-            os.remove(StudentModuleHistoryCleaner.STATE_FILE)
+        for state_file in (StudentModuleHistoryCleaner.STATE_FILE, StudentModuleHistoryCleaner.PRUNE_STATE_FILE):
+            if os.path.exists(state_file):
+                os.remove(state_file)
 
     def assert_said(self, smhc, *msgs):
         """Fail if the `smhc` didn't say `msgs`.
@@ -207,6 +210,41 @@ class HistoryCleanerNoDbTest(HistoryCleanerTest):
         self.assert_said(smhc, "Deleting 4 rows of 8 for student_module_id 17")
         smhc.delete_history.assert_called_once_with([42, 23, 15, 8])
 
+    def test_keep_versions(self):
+        smhc = SmhcDbMocked(keep_versions=2)
+        smhc.set_rows([
+            (4, "2013-07-13 16:30:00.000"),
+            (8, "2013-07-13 16:30:01.100"),
+            (15, "2013-07-13 16:30:01.200"),
+            (16, "2013-07-13 16:30:01.300"),    # keep
+            (99, "2013-07-13 16:30:59.000"),    # keep
+        ])
+        smhc.prune_one_student_module(17)
+        self.assert_said(smhc, "Pruning 3 rows of 5 for student_module_id 17")
+        smhc.delete_history.assert_called_once_with([15, 8, 4])
+
+    def test_max_age(self):
+        now = datetime.datetime.now(UTC())
+        smhc = SmhcDbMocked(max_age=datetime.timedelta(days=30))
+        smhc.get_history_for_student_modules.return_value = [
+            (4, now - datetime.timedelta(days=60)),
+            (8, now - datetime.timedelta(days=40)),
+            (15, now - datetime.timedelta(days=10)),    # keep
+        ]
+        smhc.prune_one_student_module(17)
+        self.assert_said(smhc, "Pruning 2 rows of 3 for student_module_id 17")
+        smhc.delete_history.assert_called_once_with([8, 4])
+
+    def test_max_age_keeps_last_row(self):
+        smhc = SmhcDbMocked(max_age=datetime.timedelta(days=30))
+        smhc.set_rows([
+            (4, "2013-07-13 16:30:00.000"),
+            (8, "2013-07-13 16:31:00.000"),    # keep
+        ])
+        smhc.prune_one_student_module(17)
+        self.assert_said(smhc, "Pruning 1 rows of 2 for student_module_id 17")
+        smhc.delete_history.assert_called_once_with([4])
+
 
 class HistoryCleanerWitDbTest(HistoryCleanerTest):
     """Tests of StudentModuleHistoryCleaner with a real db."""
@@ -340,6 +378,44 @@ class HistoryCleanerWitDbTest(HistoryCleanerTest):
             (50, "2013-07-13 16:30:02.500", 11),    # keep
         ])
 
+    def test_prune_on_every_run(self):
+        # The retention policy is enforced on modules that were already walked
+        smhc = SmhcSayStubbed(keep_versions=1)
+        self.write_state_file('{"next_student_module_id": 23}')
+        self.write_history([
+            (1, "2013-07-13 16:30:00.000", 11),
+            (2, "2013-07-13 16:31:00.000", 11),     # keep
+            (3, "2013-07-13 16:30:00.000", 22),     # keep
+        ])
+        smhc.main()
+        self.assert_history([
+            (2, "2013-07-13 16:31:00.000", 11),
+            (3, "2013-07-13 16:30:00.000", 22),
+        ])
+
+        # only the modules with new rows are looked at by the next run
+        now = datetime.datetime.now(UTC()).strftime("%Y-%m-%d %H:%M:%S.%f")
+        self.write_history([
+            (4, now, 11),
+        ])
+        smhc = SmhcSayStubbed(keep_versions=1)
+        smhc.main()
+        self.assertIn("Pruning 1 rows of 2 for student_module_id 11", smhc.said_lines)
+        self.assertFalse(any("student_module_id 22" in line for line in smhc.said_lines))
+        self.assert_history([
+            (3, "2013-07-13 16:30:00.000", 22),
+            (4, now, 11),
+        ])
+
+    def test_module_ids_to_prune_by_age(self):
+        now = datetime.datetime.now(UTC())
+        smhc = SmhcSayStubbed(max_age=datetime.timedelta(days=30))
+        self.write_history([
+            (1, "2013-07-13 16:30:00.000", 11),
+            (2, now.strftime("%Y-%m-%d %H:%M:%S.%f"), 22),
+        ])
+        self.assertEqual(smhc.module_ids_to_prune(now), [11])
+
     def test_get_last_student_module(self):
         # Can we find the last student_module_id properly?
         smhc = SmhcSayStubbed()
@@ -0,0 +1,34 @@
+"""
+Middleware that buffers the writes of student state made during a request,
+to write them all at once at the end of it.
+"""
+from django.conf import settings
+
+from courseware.model_data import StudentStateWriteBuffer
+
+
+class StudentStateWriteMiddleware(object):
+    """
+    Keeps a StudentStateWriteBuffer active during each request, if the
+    ENABLE_BUFFERED_STUDENT_STATE_WRITES feature is enabled, and flushes it
+    before the response is returned.
+
+    Must come after TransactionMiddleware, so that the buffered writes are
+    part of the request's transaction.
+    """
+    def process_request(self, request):
+        if settings.FEATURES.get('ENABLE_BUFFERED_STUDENT_STATE_WRITES', False):
+            StudentStateWriteBuffer.start()
+        else:
+            StudentStateWriteBuffer.stop()
+
+    def process_response(self, request, response):
+        write_buffer = StudentStateWriteBuffer.stop()
+        if write_buffer is not None:
+            write_buffer.flush()
+        return response
+
+    def process_exception(self, request, exception):
+        # TransactionMiddleware rolls back whatever the request wrote, so
+        # drop the writes which haven't been made yet as well
+        StudentStateWriteBuffer.stop()
@@ -3,18 +3,21 @@ Classes to provide the LMS runtime data storage to XBlocks
 """
 
 import json
+import threading
 from collections import defaultdict
 from itertools import chain
 from .models import (
     StudentModule,
+    StudentModuleHistory,
     XModuleUserStateSummaryField,
     XModuleStudentPrefsField,
     XModuleStudentInfoField
 )
 import logging
 
-from django.db import DatabaseError
+from django.db import DatabaseError, IntegrityError, transaction
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 from xblock.runtime import KeyValueStore
 from xblock.exceptions import KeyValueMultiSaveError, InvalidScopeError
@@ -263,6 +266,230 @@ class FieldDataCache(object):
         self.cache[cache_key] = field_object
         return field_object
 
+    def find_or_build(self, key):
+        '''
+        Find a model data object in this cache, or build (but don't save) it
+        if it doesn't exist. Built objects are added to the cache, and are
+        meant to be saved by a StudentStateWriteBuffer.
+
+        Objects of scopes which aren't buffered are created as with
+        find_or_create.
+        '''
+        field_object = self.find(key)
+
+        if field_object is not None:
+            return field_object
+
+        if key.scope == Scope.user_state:
+            field_object = StudentModule(
+                course_id=self.course_id,
+                student_id=key.user_id,
+                module_state_key=key.block_scope_id.url(),
+                state=json.dumps({}),
+                module_type=key.block_scope_id.category,
+            )
+        elif key.scope == Scope.preferences:
+            field_object = XModuleStudentPrefsField(
+                field_name=key.field_name,
+                module_type=key.block_scope_id,
+                student_id=key.user_id,
+            )
+        elif key.scope == Scope.user_info:
+            field_object = XModuleStudentInfoField(
+                field_name=key.field_name,
+                student_id=key.user_id,
+            )
+        else:
+            return self.find_or_create(key)
+
+        cache_key = self._cache_key_from_kvs_key(key)
+        self.cache[cache_key] = field_object
+        return field_object
+
+    def forget(self, key):
+        '''
+        Drop the model data object of `key` (selected as in find) from this
+        cache, after it has been deleted.
+        '''
+        self.cache.pop(self._cache_key_from_kvs_key(key), None)
+
+
+class StudentStateWriteBuffer(object):
+    """
+    Collects the per-student rows (StudentModule, XModuleStudentPrefsField
+    and XModuleStudentInfoField objects) changed while it is active, and
+    writes them all at once when flushed: new rows with one bulk insert per
+    model, changed rows with updates of only their changing columns, and the
+    history entries of the StudentModules with one bulk insert.
+
+    Buffers are per thread; courseware.middleware.StudentStateWriteMiddleware
+    keeps one active for the duration of each request.
+    """
+
+    # model -> the columns of its rows which change after creation
+    UPDATED_FIELDS = {
+        StudentModule: ('state', 'grade', 'max_grade'),
+        XModuleStudentPrefsField: ('value',),
+        XModuleStudentInfoField: ('value',),
+    }
+    MODELS = (StudentModule, XModuleStudentPrefsField, XModuleStudentInfoField)
+    SCOPES = (Scope.user_state, Scope.preferences, Scope.user_info)
+
+    _local = threading.local()
+
+    def __init__(self):
+        self._rows = []
+        self._row_ids = set()
+
+    @classmethod
+    def current(cls):
+        """
+        Return the active buffer of this thread, or None.
+        """
+        return getattr(cls._local, 'buffer', None)
+
+    @classmethod
+    def start(cls):
+        """
+        Make a new buffer the active buffer of this thread, and return it.
+        """
+        cls._local.buffer = cls()
+        return cls._local.buffer
+
+    @classmethod
+    def stop(cls):
+        """
+        Deactivate the active buffer of this thread, and return it (without
+        flushing it).
+        """
+        buffer_ = cls.current()
+        cls._local.buffer = None
+        return buffer_
+
+    def add(self, row):
+        """
+        Remember `row` (saved or not) to be written when the buffer is flushed.
+        """
+        if id(row) not in self._row_ids:
+            self._row_ids.add(id(row))
+            self._rows.append(row)
+
+    def discard(self, row):
+        """
+        Forget `row`, which has been deleted (or must not be created anymore).
+        """
+        if id(row) in self._row_ids:
+            self._row_ids.remove(id(row))
+            # unsaved rows all compare equal, so they can't be removed by value
+            self._rows = [other for other in self._rows if other is not row]
+
+    def __len__(self):
+        return len(self._rows)
+
+    def flush(self):
+        """
+        Write all the rows added since the last flush.
+        """
+        rows, self._rows, self._row_ids = self._rows, [], set()
+        now = timezone.now()
+
+        history_entries = []
+        for model in self.MODELS:
+            model_rows = [row for row in rows if isinstance(row, model)]
+            if not model_rows:
+                continue
+
+            new_rows = [row for row in model_rows if row.pk is None]
+            to_update, saved = self._create(model, new_rows)
+            saved_ids = set(id(row) for row in saved)
+            new_ids = set(id(row) for row in new_rows)
+            to_update.extend(row for row in model_rows if id(row) not in new_ids)
+            for row in to_update:
+                row.modified = now
+                values = dict((name, getattr(row, name)) for name in self.UPDATED_FIELDS[model])
+                model.objects.filter(pk=row.pk).update(modified=now, **values)
+
+            if model is StudentModule:
+                # rows saved on their own got their history entry from the post_save signal
+                history_entries.extend(
+                    StudentModuleHistory.history_entry_for(row) for row in model_rows if id(row) not in saved_ids
+                )
+
+        history_entries = [entry for entry in history_entries if entry is not None]
+        StudentModuleHistory.save_entries(history_entries)
+
+    def _create(self, model, rows):
+        """
+        Insert the new `rows` of `model` and set their ids.
+
+        If another request created some of them in the meantime, their stored
+        versions are updated instead, and the others are inserted one by one.
+        Returns (the rows which have to be updated, the rows which were saved
+        one by one).
+        """
+        if not rows:
+            return [], []
+
+        sid = transaction.savepoint()
+        try:
+            model.objects.bulk_create(rows)
+        except IntegrityError:
+            transaction.savepoint_rollback(sid)
+        else:
+            transaction.savepoint_commit(sid)
+            stored_rows = self._stored_rows(model, rows)
+            for row in rows:
+                row.pk = stored_rows[self._natural_key(model, row)].pk
+            return [], []
+
+        stored_rows = self._stored_rows(model, rows)
+        to_update = []
+        saved = []
+        for row in rows:
+            stored = stored_rows.get(self._natural_key(model, row))
+            if stored is None:
+                row.save()
+                saved.append(row)
+                continue
+
+            row.pk = stored.pk
+            row.created = stored.created
+            if model is StudentModule:
+                # Only the fields set in this request are in row.state
+                state = json.loads(stored.state or '{}')
+                state.update(json.loads(row.state))
+                row.state = json.dumps(state)
+            for name in self.UPDATED_FIELDS[model]:
+                if getattr(row, name) is None:
+                    setattr(row, name, getattr(stored, name))
+            to_update.append(row)
+        return to_update, saved
+
+    @staticmethod
+    def _natural_key(model, row):
+        """
+        Return the values of the unique_together fields of `row`.
+        """
+        return tuple(
+            getattr(row, model._meta.get_field(name).attname)  # pylint: disable=protected-access
+            for name in model._meta.unique_together[0]  # pylint: disable=protected-access
+        )
+
+    def _stored_rows(self, model, rows):
+        """
+        Return the stored rows of `model` with the natural keys of `rows`, by
+        natural key.
+        """
+        attnames = [
+            model._meta.get_field(name).attname  # pylint: disable=protected-access
+            for name in model._meta.unique_together[0]  # pylint: disable=protected-access
+        ]
+        query = model.objects.filter(**dict(
+            (attname + '__in', set(getattr(row, attname) for row in rows))
+            for attname in attnames
+        ))
+        return dict((self._natural_key(model, row), row) for row in query)
+
 
 class DjangoKeyValueStore(KeyValueStore):
     """
@@ -321,19 +548,25 @@ class DjangoKeyValueStore(KeyValueStore):
 
         """
         saved_fields = []
-        # field_objects maps a field_object to a list of associated fields
+        # field_objects maps the id of a field_object to the field_object and
+        # a list of associated fields. (Objects which haven't been saved yet
+        # all compare equal, so they can't be used as keys themselves.)
         field_objects = dict()
+        write_buffer = StudentStateWriteBuffer.current()
         for field in kv_dict:
             # Check field for validity
             if field.scope not in self._allowed_scopes:
                 raise InvalidScopeError(field)
 
             # If the field is valid and isn't already in the dictionary, add it.
-            field_object = self._field_data_cache.find_or_create(field)
-            if field_object not in field_objects.keys():
-                field_objects[field_object] = []
+            if write_buffer is not None:
+                field_object = self._field_data_cache.find_or_build(field)
+            else:
+                field_object = self._field_data_cache.find_or_create(field)
+            if id(field_object) not in field_objects:
+                field_objects[id(field_object)] = (field_object, [])
             # Update the list of associated fields
-            field_objects[field_object].append(field)
+            field_objects[id(field_object)][1].append(field)
 
             # Special case when scope is for the user state, because this scope saves fields in a single row
             if field.scope == Scope.user_state:
@@ -345,15 +578,20 @@ class DjangoKeyValueStore(KeyValueStore):
             # we don't have to worry about conflicts
                 field_object.value = json.dumps(kv_dict[field])
 
-        for field_object in field_objects:
+        for field_object, fields in field_objects.values():
+            if write_buffer is not None and isinstance(field_object, StudentStateWriteBuffer.MODELS):
+                # Written when the buffer is flushed, at the end of the request
+                write_buffer.add(field_object)
+                saved_fields.extend([field.field_name for field in fields])
+                continue
             try:
                 # Save the field object that we made above
                 field_object.save()
                 # If save is successful on this scope, add the saved fields to
                 # the list of successful saves
-                saved_fields.extend([field.field_name for field in field_objects[field_object]])
+                saved_fields.extend([field.field_name for field in fields])
             except DatabaseError:
-                log.exception('Error saving fields %r', field_objects[field_object])
+                log.exception('Error saving fields %r', fields)
                 raise KeyValueMultiSaveError(saved_fields)
 
     def delete(self, key):
@@ -364,13 +602,23 @@ class DjangoKeyValueStore(KeyValueStore):
         if field_object is None:
             raise KeyError(key.field_name)
 
+        write_buffer = StudentStateWriteBuffer.current()
         if key.scope == Scope.user_state:
             state = json.loads(field_object.state)
             del state[key.field_name]
             field_object.state = json.dumps(state)
-            field_object.save()
+            if write_buffer is not None:
+                # Written, with its history entry, when the buffer is flushed
+                write_buffer.add(field_object)
+            else:
+                field_object.save()
         else:
-            field_object.delete()
+            if write_buffer is not None:
+                write_buffer.discard(field_object)
+            # Objects built by find_or_build may not have been saved yet
+            if field_object.pk is not None:
+                field_object.delete()
+            self._field_data_cache.forget(key)
 
     def has(self, key):
         if key.scope not in self._allowed_scopes:
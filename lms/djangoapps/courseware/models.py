@@ -107,16 +107,90 @@ class StudentModuleHistory(models.Model):
     grade = models.FloatField(null=True, blank=True)
     max_grade = models.FloatField(null=True, blank=True)
 
+    @classmethod
+    def history_entry_for(cls, student_module):
+        """
+        Return an (unsaved) history entry recording the current state of
+        `student_module`, or None if the history of its type isn't kept.
+        """
+        if student_module.module_type not in cls.HISTORY_SAVING_TYPES:
+            return None
+        return cls(student_module=student_module,
+                   version=None,
+                   created=student_module.modified,
+                   state=student_module.state,
+                   grade=student_module.grade,
+                   max_grade=student_module.max_grade)
+
+    @classmethod
+    def save_entries(cls, entries):
+        """
+        Save the (unsaved) history `entries`, in bulk, or queue them to be
+        saved in the background if ENABLE_ASYNC_STUDENT_MODULE_HISTORY is on.
+        """
+        from courseware.history import history_writer
+
+        writer = history_writer()
+        if writer is not None:
+            writer.add(entries)
+        elif len(entries) == 1:
+            entries[0].save()
+        elif entries:
+            cls.objects.bulk_create(entries)
+
     @receiver(post_save, sender=StudentModule)
     def save_history(sender, instance, **kwargs):
-        if instance.module_type in StudentModuleHistory.HISTORY_SAVING_TYPES:
-            history_entry = StudentModuleHistory(student_module=instance,
-                                                 version=None,
-                                                 created=instance.modified,
-                                                 state=instance.state,
-                                                 grade=instance.grade,
-                                                 max_grade=instance.max_grade)
-            history_entry.save()
+        history_entry = StudentModuleHistory.history_entry_for(instance)
+        if history_entry is not None:
+            StudentModuleHistory.save_entries([history_entry])
+
+
+class StudentSectionScore(models.Model):
+    """
+    Persisted scores for one section (sequential) of a course for one student.
+
+    Rows are written by `courseware.grades` whenever a section has to be
+    scored the slow way (instantiating XModules), and reused for as long as
+    none of the StudentModule rows inside the section have been modified
+    since, deleted or created, and the section content (as summarized by
+    `content_hash`) is unchanged.
+    """
+
+    class Meta:
+        unique_together = (('student', 'course_id', 'section_key'),)
+
+    student = models.ForeignKey(User, db_index=True)
+    course_id = models.CharField(max_length=255, db_index=True)
+
+    # Location url of the section descriptor
+    section_key = models.CharField(max_length=255)
+
+    # Fingerprint of the scorable content of the section, and of which of the
+    # student's StudentModules existed in it, at the time the scores were
+    # computed.
+    content_hash = models.CharField(max_length=32)
+
+    # JSON list of [earned, possible, graded, display_name] for every scored
+    # descendant of the section, in course order.
+    scores = models.TextField(default='[]')
+
+    # When the student state used to compute `scores` was read. StudentModules
+    # modified at or after this time make the row stale.
+    computed = models.DateTimeField()
+
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
+    modified = models.DateTimeField(auto_now=True, db_index=True)
+
+    def __repr__(self):
+        return 'StudentSectionScore<%r>' % ({
+            'course_id': self.course_id,
+            'student': self.student.username,
+            'section_key': self.section_key,
+            'scores': self.scores[:40],
+        },)
+
+    def __unicode__(self):
+        return unicode(repr(self))
 
 
 class XModuleUserStateSummaryField(models.Model):
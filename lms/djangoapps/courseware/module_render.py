@@ -1,9 +1,11 @@
+import hashlib
 import json
 import logging
 import mimetypes
 
 import static_replace
 
+from datetime import datetime
 from functools import partial
 from requests.auth import HTTPBasicAuth
 from dogapi import dog_stats_api
@@ -14,12 +16,15 @@ from django.core.cache import cache
 from django.core.exceptions import PermissionDenied
 from django.core.urlresolvers import reverse
 from django.http import Http404, HttpResponse
+from django.utils.timezone import UTC
+from django.utils.translation import get_language
 from django.views.decorators.csrf import csrf_exempt
 
 from capa.xqueue_interface import XQueueInterface
 from courseware.access import has_access, get_user_role
 from courseware.masquerade import setup_masquerade
-from courseware.model_data import FieldDataCache, DjangoKeyValueStore
+from courseware.model_data import FieldDataCache, DjangoKeyValueStore, StudentStateWriteBuffer
+from courseware.outline import get_course_outline
 from lms.lib.xblock.field_data import LmsFieldData
 from lms.lib.xblock.runtime import LmsModuleSystem, unquote_slashes
 from edxmako.shortcuts import render_to_string
@@ -33,6 +38,7 @@ from xblock.exceptions import NoSuchHandlerError
 from xblock.django.request import django_to_webob_request, webob_to_django_response
 from xmodule.error_module import ErrorDescriptor, NonStaffErrorDescriptor
 from xmodule.exceptions import NotFoundError, ProcessingError
+from xmodule.fields import Date
 from xmodule.modulestore import Location
 from xmodule.modulestore.django import modulestore, ModuleI18nService
 from xmodule.modulestore.exceptions import ItemNotFoundError
@@ -94,8 +100,88 @@ def toc_for_course(user, request, course, active_chapter, active_section, field_
     None if this is not the case.
 
     field_data_cache must include data from the course module and 2 levels of its descendents
+
+    The parts of the table of contents which are the same for every student
+    come from the cached course outline (see courseware.outline), so that no
+    XModules have to be created for it.
     '''
+    if not has_access(user, course, 'load', course.id):
+        return None
+
+    outline = get_course_outline(course)
+    if outline is None:
+        return _toc_from_modules(user, request, course, active_chapter, active_section, field_data_cache)
+
+    kvs = DjangoKeyValueStore(field_data_cache)
+    now = datetime.now(UTC())
+
+    chapters = list()
+    for chapter in outline:
+        if chapter['hide_from_toc'] or not _can_load_outline_node(user, course, chapter, now):
+            continue
+
+        sections = list()
+        for section in chapter['sections']:
+            if section['hide_from_toc'] or not _can_load_outline_node(user, course, section, now):
+                continue
+
+            sections.append({'display_name': section['display_name'],
+                             'url_name': section['url_name'],
+                             'format': section['format'],
+                             'due': get_extended_due_date({
+                                 'due': section['due'],
+                                 'extended_due': _extended_due(kvs, user, section['location']),
+                             }),
+                             'active': (chapter['url_name'] == active_chapter and
+                                        section['url_name'] == active_section),
+                             'graded': section['graded'],
+                             })
+
+        chapters.append({'display_name': chapter['display_name'],
+                         'url_name': chapter['url_name'],
+                         'sections': sections,
+                         'active': chapter['url_name'] == active_chapter})
+    return chapters
 
+
+def _can_load_outline_node(user, course, node, now):
+    """
+    Return whether `user` can load the chapter or section described by the
+    course outline entry `node`.
+
+    Anyone can load a node without a start date, or whose start date has
+    passed (see courseware.access); the descriptor is only loaded to check the
+    access of nodes which haven't started yet.
+    """
+    if node['start'] is None or now > node['start']:
+        return True
+    descriptor = modulestore().get_instance(course.id, Location(node['location']))
+    return has_access(user, descriptor, 'load', course.id)
+
+
+def _extended_due(kvs, user, location):
+    """
+    Return the due date `user` has been granted for the module at `location`
+    (see get_extended_due_date), or None.
+    """
+    key = KeyValueStore.Key(
+        scope=Scope.user_state,
+        user_id=user.id,
+        block_scope_id=Location(location),
+        field_name='extended_due'
+    )
+    try:
+        return Date().from_json(kvs.get(key))
+    except KeyError:
+        return None
+
+
+def _toc_from_modules(user, request, course, active_chapter, active_section, field_data_cache):
+    """
+    Create the table of contents (see toc_for_course) from the course's
+    XModules. Used for courses whose chapters and sections can differ from
+    student to student.
+    """
     course_module = get_module_for_descriptor(user, request, course, field_data_cache, course.id)
     if course_module is None:
         return None
@@ -310,12 +396,19 @@ def get_module_for_descriptor_internal(user, descriptor, field_data_cache, cours
             field_name='grade'
         )
 
-        student_module = field_data_cache.find_or_create(key)
+        write_buffer = StudentStateWriteBuffer.current()
+        if write_buffer is not None:
+            student_module = field_data_cache.find_or_build(key)
+        else:
+            student_module = field_data_cache.find_or_create(key)
         # Update the grades
         student_module.grade = event.get('value')
         student_module.max_grade = event.get('max_value')
         # Save all changes to the underlying KeyValueStore
-        student_module.save()
+        if write_buffer is not None:
+            write_buffer.add(student_module)
+        else:
+            student_module.save()
 
         # Bin score into range and increment stats
         score_bucket = get_score_bucket(student_module.grade, student_module.max_grade)
@@ -369,9 +462,13 @@ def get_module_for_descriptor_internal(user, descriptor, field_data_cache, cours
         reverse('jump_to_id', kwargs={'course_id': course_id, 'module_id': ''}),
     ))
 
-    if settings.FEATURES.get('DISPLAY_DEBUG_INFO_TO_STAFF'):
-        if has_access(user, descriptor, 'staff', course_id):
-            block_wrappers.append(partial(add_staff_debug_info, user))
+    student_view_cache_key = None
+    if settings.FEATURES.get('DISPLAY_DEBUG_INFO_TO_STAFF') and has_access(user, descriptor, 'staff', course_id):
+        block_wrappers.append(partial(add_staff_debug_info, user))
+    else:
+        student_view_cache_key = _student_view_cache_key(
+            descriptor, course_id, wrap_xmodule_display, static_asset_path or descriptor.static_asset_path
+        )
 
     # These modules store data using the anonymous_student_id as a key.
     # To prevent loss of data, we will continue to provide old modules with
@@ -433,6 +530,7 @@ def get_module_for_descriptor_internal(user, descriptor, field_data_cache, cours
         },
         get_user_role=lambda: get_user_role(user, course_id),
         descriptor_runtime=descriptor.runtime,
+        student_view_cache_key=student_view_cache_key,
     )
 
     # pass position specified in URL to module through ModuleSystem
@@ -456,6 +554,35 @@ def get_module_for_descriptor_internal(user, descriptor, field_data_cache, cours
     return descriptor
 
 
+def _student_view_cache_key(descriptor, course_id, wrap_xmodule_display, static_asset_path):
+    """
+    Return the key under which the rendered student_view of `descriptor` may
+    be cached if the block is user independent, or None if it mustn't be
+    cached.
+
+    The key covers the version of the course (so that any change to the
+    course invalidates it) and everything else the wrapped fragment depends
+    on: the block's location, the language and the url rewriting settings.
+    """
+    if not settings.FEATURES.get('ENABLE_XBLOCK_FRAGMENT_CACHE', False):
+        return None
+
+    version = modulestore().get_course_version(course_id)
+    if version is None:
+        return None
+
+    key = u'|'.join(unicode(part) for part in (
+        course_id,
+        version,
+        descriptor.location.url(),
+        get_language(),
+        settings.STATIC_URL,
+        wrap_xmodule_display,
+        static_asset_path,
+    ))
+    return 'xblock_fragment.' + hashlib.md5(key.encode('utf-8')).hexdigest()
+
+
 def find_target_student_module(request, user_id, course_id, mod_id):
     """
     Retrieve target StudentModule
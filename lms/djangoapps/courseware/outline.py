@@ -0,0 +1,104 @@
+"""
+Precomputed outlines (chapters and sections) of courses.
+
+The outline holds everything about a course's chapters and sections which is
+the same for every student, so that the table of contents can be rendered
+without instantiating the course's XModules. It is cached per course version
+(see ModuleStoreReadBase.get_course_version).
+"""
+
+from django.core.cache import cache
+
+from xmodule.error_module import ErrorDescriptor
+from xmodule.modulestore.django import modulestore
+
+
+OUTLINE_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def outline_cache_key(course_id, version):
+    """
+    Return the cache key of the outline of version `version` of the course.
+    """
+    return u"course_outline/{0}/{1}".format(course_id, version)
+
+
+def get_course_outline(course):
+    """
+    Return the outline of `course`, a list of chapters of the form
+
+    [ {'location': url, 'display_name': name, 'url_name': url_name,
+       'hide_from_toc': bool, 'start': datetime, 'sections': SECTIONS}, ... ]
+
+    where SECTIONS is a list
+
+    [ {'location': url, 'display_name': name, 'url_name': url_name,
+       'format': format, 'due': due, 'graded': bool, 'hide_from_toc': bool,
+       'start': datetime}, ...]
+
+    Returns None if the chapters or sections of the course can differ from
+    student to student (e.g. an A/B test in place of a section), or if some
+    of them failed to load.
+    """
+    version = modulestore().get_course_version(course.id)
+    if version is None:
+        return _build_course_outline(course)
+
+    key = outline_cache_key(course.id, version)
+    outline = cache.get(key)
+    if outline is None:
+        outline = _build_course_outline(course)
+        # Also cache outlines which are None, as a list, so that they can be
+        # told apart from cache misses
+        cache.set(key, outline if outline is not None else [None], OUTLINE_CACHE_TIMEOUT)
+    elif outline == [None]:
+        outline = None
+    return outline
+
+
+def _is_static(descriptor):
+    """
+    Whether `descriptor` is shown the same way to every student (as far as
+    the outline is concerned).
+    """
+    return not isinstance(descriptor, ErrorDescriptor) and not descriptor.has_dynamic_children()
+
+
+def _build_course_outline(course):
+    """
+    Compute the outline of `course` from its descriptor tree (see
+    get_course_outline).
+    """
+    if not _is_static(course):
+        return None
+
+    chapters = []
+    for chapter in course.get_children():
+        if not _is_static(chapter):
+            return None
+
+        sections = []
+        for section in chapter.get_children():
+            if not _is_static(section):
+                return None
+
+            sections.append({
+                'location': section.location.url(),
+                'display_name': section.display_name_with_default,
+                'url_name': section.url_name,
+                'format': section.format if section.format is not None else '',
+                'due': section.due,
+                'graded': section.graded,
+                'hide_from_toc': section.hide_from_toc,
+                'start': section.start,
+            })
+
+        chapters.append({
+            'location': chapter.location.url(),
+            'display_name': chapter.display_name_with_default,
+            'url_name': chapter.url_name,
+            'hide_from_toc': chapter.hide_from_toc,
+            'start': chapter.start,
+            'sections': sections,
+        })
+    return chapters
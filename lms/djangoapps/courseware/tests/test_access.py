@@ -1,7 +1,7 @@
 import courseware.access as access
 import datetime
 
-from mock import Mock
+from mock import Mock, patch
 
 from django.test import TestCase
 from django.test.utils import override_settings
@@ -10,6 +10,8 @@ from courseware.tests.factories import UserFactory, CourseEnrollmentAllowedFacto
 from student.tests.factories import AnonymousUserFactory
 from xmodule.modulestore import Location
 from courseware.tests.tests import TEST_DATA_MIXED_MODULESTORE
+from request_cache.middleware import RequestCache
+from student.roles import CourseBetaTesterRole, CourseStaffRole
 import pytz
 
 
@@ -69,6 +71,48 @@ class AccessTestCase(TestCase):
         self.assertTrue(access._has_access_descriptor(u, d, 'load'))
         self.assertRaises(ValueError, access._has_access_descriptor, u, d, 'not_load_or_staff')
 
+    @patch.dict('django.conf.settings.FEATURES', {'DISABLE_START_DATES': False})
+    def test__has_access_descriptor_decided_once_per_request(self):
+        request_cache = RequestCache()
+        request_cache.process_request(Mock())
+        self.addCleanup(request_cache.process_response, None, None)
+        tomorrow = datetime.datetime.now(pytz.utc) + datetime.timedelta(days=1)
+        descriptors = [
+            Mock(
+                _class_tags=set(), start=tomorrow, days_early_for_beta=2,
+                location=Location('i4x://edX/toy/problem/problem_{}'.format(i)),
+            )
+            for i in range(10)
+        ]
+
+        with patch('courseware.access.CourseStaffRole', wraps=CourseStaffRole) as staff_role:
+            for descriptor in descriptors:
+                self.assertFalse(access._has_access_descriptor(self.student, descriptor, 'load', self.course.course_id))
+                self.assertTrue(access._has_access_descriptor(self.course_staff, descriptor, 'load', self.course.course_id))
+        self.assertEqual(staff_role.call_count, 1)
+
+        # changing the roles of a user is taken into account right away
+        CourseBetaTesterRole(self.course).add_users(self.student)
+        for descriptor in descriptors:
+            self.assertTrue(access._has_access_descriptor(self.student, descriptor, 'load', self.course.course_id))
+
+    @patch.dict('django.conf.settings.FEATURES', {'DISABLE_START_DATES': False})
+    def test__has_access_descriptor_not_cached_outside_requests(self):
+        # celery tasks and management commands never clear the request cache
+        tomorrow = datetime.datetime.now(pytz.utc) + datetime.timedelta(days=1)
+        descriptor = Mock(
+            _class_tags=set(), start=tomorrow, days_early_for_beta=None,
+            location=Location('i4x://edX/toy/problem/problem'),
+        )
+        with patch(
+            'courseware.access._adjust_start_date_for_beta_testers',
+            wraps=access._adjust_start_date_for_beta_testers
+        ) as adjust_start_date:
+            for __ in range(2):
+                self.assertFalse(access._has_access_descriptor(self.student, descriptor, 'load', self.course.course_id))
+        self.assertEqual(adjust_start_date.call_count, 2)
+        self.assertNotIn('courseware.access.decisions', RequestCache.get_request_cache().data)
+
     def test__has_access_course_desc_can_enroll(self):
         u = Mock()
         yesterday = datetime.datetime.now(pytz.utc) - datetime.timedelta(days=1)
@@ -10,7 +10,8 @@ from student.tests.factories import UserFactory
 from xmodule.modulestore.tests.factories import CourseFactory
 from xmodule.modulestore.tests.django_utils import ModuleStoreTestCase
 
-from courseware.grades import grade, iterate_grades_for
+from courseware import grades
+from courseware.grades import grade, iterate_grades_for, iterate_bulk_grades_for
 
 
 def _grade_with_errors(student, request, course, keep_raw_scores=False):
@@ -105,8 +106,42 @@ class TestGradeIteration(ModuleStoreTestCase):
         self.assertTrue(all_gradesets[student2])
         self.assertTrue(all_gradesets[student5])
 
+    def test_bulk_empty_student_list(self):
+        """Bulk grading an empty list of students yields nothing."""
+        self.assertEqual(list(iterate_bulk_grades_for(self.course.id, [])), [])
+
+    def test_bulk_all_empty_grades(self):
+        """No students have grade entries, and students span several chunks"""
+        all_gradesets, all_errors = self._gradesets_and_errors_for(
+            self.course.id, self.students, iterate_bulk_grades_for, chunk_size=2
+        )
+        self.assertEqual(len(all_gradesets), 5)
+        self.assertEqual(len(all_errors), 0)
+        for gradeset in all_gradesets.values():
+            self.assertIsNone(gradeset['grade'])
+            self.assertEqual(gradeset['percent'], 0.0)
+
+    def test_bulk_grading_exception(self):
+        """Errors grading one student don't stop bulk grading the others."""
+        real_bulk_grade = grades._bulk_grade
+
+        def bulk_grade_with_errors(student, *args):
+            """Fail for student3, like `_grade_with_errors`"""
+            if student.username == 'student3':
+                raise Exception("I don't like {}".format(student.username))
+            return real_bulk_grade(student, *args)
+
+        with patch('courseware.grades._bulk_grade', bulk_grade_with_errors):
+            all_gradesets, all_errors = self._gradesets_and_errors_for(
+                self.course.id, self.students, iterate_bulk_grades_for
+            )
+
+        self.assertEqual(all_errors, {self.students[2]: "I don't like student3"})
+        self.assertEqual(len(all_gradesets), 5)
+        self.assertFalse(all_gradesets[self.students[2]])
+
     ################################# Helpers #################################
-    def _gradesets_and_errors_for(self, course_id, students):
+    def _gradesets_and_errors_for(self, course_id, students, iterate_grades=iterate_grades_for, **kwargs):
         """Simple helper method to iterate through student grades and give us
         two dictionaries -- one that has all students and their respective
         gradesets, and one that has only students that could not be graded and
@@ -114,7 +149,7 @@ class TestGradeIteration(ModuleStoreTestCase):
         students_to_gradesets = {}
         students_to_errors = {}
 
-        for student, gradeset, err_msg in iterate_grades_for(course_id, students):
+        for student, gradeset, err_msg in iterate_grades(course_id, students, **kwargs):
             students_to_gradesets[student] = gradeset
             if err_msg:
                 students_to_errors[student] = err_msg
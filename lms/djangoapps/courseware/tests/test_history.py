@@ -0,0 +1,87 @@
+"""
+Tests for courseware.history.
+"""
+from datetime import timedelta
+
+from mock import patch
+
+from django.db import DatabaseError
+from django.test import TestCase
+
+from courseware.history import StudentModuleHistoryWriter
+from courseware.models import StudentModuleHistory
+from courseware.tests.factories import StudentModuleFactory
+
+
+class TestStudentModuleHistoryWriter(TestCase):
+    """
+    Tests of StudentModuleHistoryWriter, with the entries written by the
+    test's thread (a worker thread wouldn't see the test's transaction).
+    """
+    def setUp(self):
+        for target in ('courseware.history.dog_stats_api', 'courseware.history.atexit'):
+            patcher = patch(target)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = patch.object(StudentModuleHistoryWriter, '_ensure_worker')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.student_module = StudentModuleFactory()
+        StudentModuleHistory.objects.all().delete()
+        self.writer = StudentModuleHistoryWriter(batch_size=2)
+
+    def _entry(self, seconds, state):
+        """Return a history entry of the student module, `seconds` after it was modified."""
+        self.student_module.modified += timedelta(seconds=seconds)
+        self.student_module.state = state
+        return StudentModuleHistory.history_entry_for(self.student_module)
+
+    def test_entries_written_on_flush(self):
+        self.writer.add([self._entry(0, '1'), self._entry(10, '2'), self._entry(10, '3')])
+        self.assertEqual(StudentModuleHistory.objects.count(), 0)
+
+        self.writer.flush()
+
+        self.assertEqual(
+            [entry.state for entry in StudentModuleHistory.objects.order_by('created')],
+            ['1', '2', '3']
+        )
+
+    def test_close_entries_coalesced(self):
+        self.writer.add([self._entry(0, '1'), self._entry(0.1, '2')])
+        self.writer.add([self._entry(0.1, '3')])
+        self.writer.flush()
+
+        self.assertEqual([entry.state for entry in StudentModuleHistory.objects.all()], ['3'])
+
+    def test_full_queue_left_to_worker(self):
+        writer = StudentModuleHistoryWriter(max_queue_size=2, flush_interval=0.01)
+
+        writer.add([self._entry(0, '1')])
+        writer.add([self._entry(10, '2')])
+        # the caller may be in a transaction of its own, so it doesn't write
+        # the entries itself even when the worker doesn't catch up
+        self.assertEqual(StudentModuleHistory.objects.count(), 0)
+
+        writer.flush()
+        self.assertEqual(StudentModuleHistory.objects.count(), 2)
+
+    def test_failed_bulk_insert_retried_one_by_one(self):
+        self.writer.add([self._entry(0, '1'), self._entry(10, '2')])
+
+        with patch.object(StudentModuleHistory.objects, 'bulk_create', side_effect=DatabaseError):
+            self.writer.flush()
+
+        self.assertEqual(StudentModuleHistory.objects.count(), 2)
+
+    @patch.dict('django.conf.settings.FEATURES', {'ENABLE_ASYNC_STUDENT_MODULE_HISTORY': True})
+    def test_saving_student_module_queues_history(self):
+        with patch('courseware.history._WRITER', self.writer):
+            self.student_module.state = 'queued'
+            self.student_module.save()
+
+            self.assertEqual(StudentModuleHistory.objects.count(), 0)
+            self.writer.flush()
+
+        self.assertEqual(StudentModuleHistory.objects.get().state, 'queued')
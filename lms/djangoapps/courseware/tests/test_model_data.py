@@ -6,8 +6,8 @@ from mock import Mock, patch
 from functools import partial
 
 from courseware.model_data import DjangoKeyValueStore
-from courseware.model_data import InvalidScopeError, FieldDataCache
-from courseware.models import StudentModule, XModuleUserStateSummaryField
+from courseware.model_data import InvalidScopeError, FieldDataCache, StudentStateWriteBuffer
+from courseware.models import StudentModule, StudentModuleHistory, XModuleUserStateSummaryField
 from courseware.models import XModuleStudentInfoField, XModuleStudentPrefsField
 
 from student.tests.factories import UserFactory
@@ -343,3 +343,103 @@ class TestStudentInfoStorage(OtherUserFailureTestMixin, StorageTestBase, TestCas
     storage_class = XModuleStudentInfoField
     other_key_factory = partial(DjangoKeyValueStore.Key, Scope.user_info, 2, 'mock_problem')  # user_id=2, not 1
     existing_field_name = "existing_field"
+
+
+class TestStudentStateWriteBuffer(TestCase):
+    """Tests for writing student state through a StudentStateWriteBuffer"""
+
+    def setUp(self):
+        self.user = UserFactory.create(username='user')
+        self.assertEqual(self.user.id, 1)   # check our assumption hard-coded in the key functions above.
+        self.field_data_cache = FieldDataCache([mock_descriptor()], course_id, self.user)
+        self.kvs = DjangoKeyValueStore(self.field_data_cache)
+        self.write_buffer = StudentStateWriteBuffer.start()
+        self.addCleanup(StudentStateWriteBuffer.stop)
+
+    def test_existing_student_module(self):
+        "Test that changes to existing rows are only written, with their history, when flushed"
+        StudentModuleFactory(student=self.user, state=json.dumps({'a_field': 'a_value', 'b_field': 'b_value'}))
+        field_data_cache = FieldDataCache([mock_descriptor([mock_field(Scope.user_state, 'a_field')])], course_id, self.user)
+        kvs = DjangoKeyValueStore(field_data_cache)
+        history_count = StudentModuleHistory.objects.count()
+
+        kvs.set(user_state_key('a_field'), 'new_value')
+
+        self.assertEquals('a_value', json.loads(StudentModule.objects.get().state)['a_field'])
+        self.assertEquals(history_count, StudentModuleHistory.objects.count())
+
+        self.write_buffer.flush()
+
+        student_module = StudentModule.objects.get()
+        self.assertEquals({'a_field': 'new_value', 'b_field': 'b_value'}, json.loads(student_module.state))
+        self.assertEquals(history_count + 1, StudentModuleHistory.objects.count())
+        self.assertEquals(student_module.state, StudentModuleHistory.objects.latest().state)
+
+    def test_new_rows(self):
+        "Test that new rows of every buffered scope are created when flushed"
+        self.kvs.set_many({
+            user_state_key('a_field'): 'a_value',
+            prefs_key('pref_a'): 'pref_a_value',
+            prefs_key('pref_b'): 'pref_b_value',
+            user_info_key('info'): 'info_value',
+        })
+        self.assertEquals(0, StudentModule.objects.count())
+        self.assertEquals(0, XModuleStudentPrefsField.objects.count())
+
+        self.write_buffer.flush()
+
+        self.assertEquals({'a_field': 'a_value'}, json.loads(StudentModule.objects.get().state))
+        self.assertEquals(
+            {'pref_a': 'pref_a_value', 'pref_b': 'pref_b_value'},
+            dict((pref.field_name, json.loads(pref.value)) for pref in XModuleStudentPrefsField.objects.all())
+        )
+        self.assertEquals('info_value', json.loads(XModuleStudentInfoField.objects.get().value))
+        self.assertEquals(1, StudentModuleHistory.objects.count())
+
+        # the cached objects know their ids, so later changes update them
+        self.kvs.set(user_state_key('b_field'), 'b_value')
+        self.write_buffer.flush()
+        self.assertEquals({'a_field': 'a_value', 'b_field': 'b_value'}, json.loads(StudentModule.objects.get().state))
+
+    def test_row_created_meanwhile(self):
+        "Test that rows created by someone else before the flush are merged with"
+        self.kvs.set(user_state_key('a_field'), 'a_value')
+        StudentModuleFactory(student=self.user, state=json.dumps({'b_field': 'b_value'}), grade=1)
+
+        self.write_buffer.flush()
+
+        student_module = StudentModule.objects.get()
+        self.assertEquals({'a_field': 'a_value', 'b_field': 'b_value'}, json.loads(student_module.state))
+        self.assertEquals(1, student_module.grade)
+
+    def test_delete_unsaved_rows(self):
+        "Test that deleting fields whose rows haven't been created yet drops those rows"
+        self.kvs.set_many({
+            prefs_key('pref_a'): 'pref_a_value',
+            prefs_key('pref_b'): 'pref_b_value',
+            user_info_key('info'): 'info_value',
+        })
+        self.kvs.delete(prefs_key('pref_a'))
+        self.kvs.delete(user_info_key('info'))
+        self.assertFalse(self.kvs.has(prefs_key('pref_a')))
+        self.assertFalse(self.kvs.has(user_info_key('info')))
+
+        self.write_buffer.flush()
+
+        self.assertEquals('pref_b', XModuleStudentPrefsField.objects.get().field_name)
+        self.assertEquals(0, XModuleStudentInfoField.objects.count())
+
+    def test_delete_from_existing_student_module(self):
+        "Test that deleting a user_state field is only written, with its history, when flushed"
+        StudentModuleFactory(student=self.user, state=json.dumps({'a_field': 'a_value', 'b_field': 'b_value'}))
+        field_data_cache = FieldDataCache([mock_descriptor([mock_field(Scope.user_state, 'a_field')])], course_id, self.user)
+        kvs = DjangoKeyValueStore(field_data_cache)
+        history_count = StudentModuleHistory.objects.count()
+
+        kvs.delete(user_state_key('a_field'))
+        self.assertEquals(history_count, StudentModuleHistory.objects.count())
+
+        self.write_buffer.flush()
+
+        self.assertEquals({'b_field': 'b_value'}, json.loads(StudentModule.objects.get().state))
+        self.assertEquals(history_count + 1, StudentModuleHistory.objects.count())
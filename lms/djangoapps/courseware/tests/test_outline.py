@@ -0,0 +1,101 @@
+"""
+Tests for courseware.outline and its use in the table of contents.
+"""
+from datetime import datetime, timedelta
+
+from mock import patch
+
+from django.test.client import RequestFactory
+from django.test.utils import override_settings
+from django.utils.timezone import UTC
+
+from xmodule.modulestore.django import modulestore
+from xmodule.modulestore.tests.django_utils import ModuleStoreTestCase
+from xmodule.modulestore.tests.factories import CourseFactory, ItemFactory
+
+from courseware import outline
+from courseware.model_data import FieldDataCache
+from courseware.module_render import toc_for_course
+from courseware.tests.factories import GlobalStaffFactory, UserFactory
+from courseware.tests.modulestore_config import TEST_DATA_MIXED_MODULESTORE
+
+
+@override_settings(MODULESTORE=TEST_DATA_MIXED_MODULESTORE)
+class TestCourseOutline(ModuleStoreTestCase):
+    """
+    Check that course outlines are built once per course version, and that
+    the table of contents built from them only shows what the user can see.
+    """
+    def setUp(self):
+        self.course = CourseFactory.create()
+        self.chapter = ItemFactory.create(
+            parent_location=self.course.location,
+            category='chapter',
+            display_name='Chapter',
+        )
+        self.section = ItemFactory.create(
+            parent_location=self.chapter.location,
+            category='sequential',
+            display_name='Section',
+            metadata={'format': 'Homework', 'graded': True},
+        )
+        self.later_section = ItemFactory.create(
+            parent_location=self.chapter.location,
+            category='sequential',
+            display_name='Later',
+            start=datetime.now(UTC()) + timedelta(days=7),
+        )
+
+    def _get_course(self):
+        """Load the course the way the courseware does."""
+        return modulestore().get_instance(self.course.id, self.course.location, depth=2)
+
+    def _toc(self, user):
+        """Return the table of contents of the course for `user`."""
+        course = self._get_course()
+        request = RequestFactory().get('/')
+        request.user = user
+        field_data_cache = FieldDataCache.cache_for_descriptor_descendents(course.id, user, course, depth=2)
+        return toc_for_course(user, request, course, 'Chapter', 'Section', field_data_cache)
+
+    def test_outline_cached_per_version(self):
+        with patch('courseware.outline._build_course_outline', wraps=outline._build_course_outline) as build:
+            first = outline.get_course_outline(self._get_course())
+            second = outline.get_course_outline(self._get_course())
+
+        self.assertEqual(build.call_count, 1)
+        self.assertEqual(first, second)
+        self.assertEqual([chapter['display_name'] for chapter in first], ['Chapter'])
+        section = first[0]['sections'][0]
+        self.assertEqual(section['display_name'], 'Section')
+        self.assertEqual(section['format'], 'Homework')
+        self.assertTrue(section['graded'])
+
+        # Any change to the course starts a new version of its outline
+        self.section.display_name = 'Renamed'
+        modulestore().update_item(self.section, '**replace_user**')
+
+        renamed = outline.get_course_outline(self._get_course())
+        self.assertEqual(renamed[0]['sections'][0]['display_name'], 'Renamed')
+
+    @patch.dict('django.conf.settings.FEATURES', {'DISABLE_START_DATES': False})
+    def test_toc_for_student(self):
+        toc = self._toc(UserFactory())
+
+        self.assertEqual(len(toc), 1)
+        self.assertTrue(toc[0]['active'])
+        self.assertEqual(
+            toc[0]['sections'],
+            [{'display_name': 'Section', 'url_name': self.section.url_name, 'format': 'Homework',
+              'due': None, 'active': True, 'graded': True}]
+        )
+
+    @patch.dict('django.conf.settings.FEATURES', {'DISABLE_START_DATES': False})
+    def test_toc_for_staff(self):
+        toc = self._toc(GlobalStaffFactory())
+
+        # staff also see sections which haven't started yet
+        self.assertEqual(
+            [section['display_name'] for section in toc[0]['sections']],
+            ['Section', 'Later']
+        )
@@ -5,6 +5,7 @@ Integration tests for submitting problem responses and getting grades.
 # text processing dependencies
 import json
 import os
+from StringIO import StringIO
 from textwrap import dedent
 
 from mock import patch
@@ -12,12 +13,13 @@ from mock import patch
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.test.client import RequestFactory
+from django.core.management import call_command
 from django.core.urlresolvers import reverse
 from django.test.utils import override_settings
 
 # Need access to internal func to put users in the right group
 from courseware import grades
-from courseware.models import StudentModule
+from courseware.models import StudentModule, StudentSectionScore
 
 from xmodule.modulestore.django import modulestore, editable_modulestore
 
@@ -516,6 +518,22 @@ class TestCourseGrader(TestSubmittingProblems):
             # Verify that the submissions API was sent an anonymized student ID
             mock_get_scores.assert_called_with(self.course.id, '99ac6730dc5f900d69fd735975243b31')
 
+    def test_bulk_grades_match(self):
+        """
+        Check that bulk grading agrees with grading a single student,
+        including for problems the student hasn't answered.
+        """
+        self.basic_setup()
+        self.submit_question_answer('p1', {'2_1': 'Correct'})
+        self.submit_question_answer('p2', {'2_1': 'Incorrect'})
+
+        grade_summary = self.get_grade_summary()
+        [(student, gradeset, err_msg)] = list(grades.iterate_bulk_grades_for(self.course.id, [self.student_user]))
+        self.assertEqual(student, self.student_user)
+        self.assertEqual(err_msg, "")
+        self.assertEqual(gradeset['percent'], grade_summary['percent'])
+        self.assertEqual(gradeset['totaled_scores'], grade_summary['totaled_scores'])
+
     def test_weighted_homework(self):
         """
         Test that the homework section has proper weight.
@@ -595,6 +613,83 @@ class TestCourseGrader(TestSubmittingProblems):
         self.assertEqual(self.score_for_hw('homework3'), [1.0, 1.0])
 
 
+@patch.dict(settings.FEATURES, {'ENABLE_PERSISTENT_SECTION_SCORES': True})
+class TestCourseGraderPersistedScores(TestCourseGrader):
+    """
+    Run the course grader suite with persisted section scores enabled, and
+    check that persisted scores are reused and invalidated correctly.
+    """
+
+    def test_persisted_scores_are_reused(self):
+        """
+        Check that unchanged sections are not rescored.
+        """
+        self.basic_setup()
+        self.submit_question_answer('p1', {'2_1': 'Correct'})
+        self.check_grade_percent(0.33)
+        self.assertEqual(
+            StudentSectionScore.objects.filter(student=self.student_user, course_id=self.course.id).count(), 1
+        )
+
+        # Nothing changed, so the section must not be rescored
+        with patch('courseware.grades.score_section') as mock_score_section:
+            self.check_grade_percent(0.33)
+            self.assertFalse(mock_score_section.called)
+
+    def test_submission_invalidates_persisted_scores(self):
+        """
+        Check that submitting an answer makes the persisted section scores stale.
+        """
+        self.basic_setup()
+        self.submit_question_answer('p1', {'2_1': 'Correct'})
+        self.check_grade_percent(0.33)
+        self.submit_question_answer('p2', {'2_1': 'Correct'})
+        self.check_grade_percent(0.67)
+        self.assertEqual(self.score_for_hw('homework'), [1.0, 1.0, 0.0])
+
+    def test_content_change_invalidates_persisted_scores(self):
+        """
+        Check that changing the section content makes the persisted scores stale.
+        """
+        self.basic_setup()
+        self.submit_question_answer('p1', {'2_1': 'Correct'})
+        self.check_grade_percent(0.33)
+
+        # A new problem changes the section content, but no student state
+        self.add_dropdown_to_section(self.homework.location, 'p4', 1)
+        self.refresh_course()
+        self.check_grade_percent(0.25)
+
+    def test_state_deletion_invalidates_persisted_scores(self):
+        """
+        Check that deleting student state (as resetting attempts does) makes the persisted scores stale.
+        """
+        self.basic_setup()
+        self.submit_question_answer('p1', {'2_1': 'Correct'})
+        self.check_grade_percent(0.33)
+
+        StudentModule.objects.filter(
+            student=self.student_user, module_state_key=self.problem_location('p1')
+        ).delete()
+        self.check_grade_percent(0)
+
+    def test_backfill_command(self):
+        """
+        Check that the backfill command stores scores that agree with the slow path.
+        """
+        self.basic_setup()
+        self.submit_question_answer('p1', {'2_1': 'Correct'})
+        self.submit_question_answer('p2', {'2_1': 'Incorrect'})
+
+        output = StringIO()
+        call_command('backfill_section_scores', self.course.id, verify=True, stdout=output)
+
+        self.assertIn('0 mismatches', output.getvalue())
+        self.assertTrue(
+            StudentSectionScore.objects.filter(student=self.student_user, course_id=self.course.id).exists()
+        )
+
+
 class ProblemWithUploadedFilesTest(TestSubmittingProblems):
     """Tests of problems with uploaded files."""
 
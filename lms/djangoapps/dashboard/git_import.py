@@ -209,7 +209,8 @@ def add_repo(repo, rdir_in, branch=None):
 
     try:
         management.call_command('import', GIT_REPO_DIR, rdir,
-                                nostatic=not GIT_IMPORT_STATIC)
+                                nostatic=not GIT_IMPORT_STATIC,
+                                delete_removed=True)
     except CommandError:
         raise GitImportError(GitImportError.XML_IMPORT_FAILED)
     except NotImplementedError:
@@ -12,8 +12,8 @@ file and check it in at the same time as your model changes. To do that,
 ASSUMPTIONS: modules have unique IDs, even across different module_types
 
 """
-from cStringIO import StringIO
 from gzip import GzipFile
+from tempfile import TemporaryFile
 from uuid import uuid4
 import csv
 import json
@@ -192,9 +192,13 @@ class InstructorTask(models.Model):
 class ReportStore(object):
     """
     Simple abstraction layer that can fetch and store CSV files for reports
-    download. Should probably refactor later to create a ReportFile object that
-    can simply be appended to for the sake of memory efficiency, rather than
-    passing in the whole dataset. Doing that for now just because it's simpler.
+    download. `store_rows` accepts any iterable of rows, so reports can be
+    streamed into the store without holding them in memory.
+
+    Reports that are generated by several subtasks are first written as
+    "partial" files, which are kept apart from the reports (they don't show up
+    in `links_for`) and are merged into the final report when all subtasks are
+    done. See `store_partial_rows`, `partial_rows` and `delete_partial`.
     """
     @classmethod
     def from_config(cls):
@@ -303,12 +307,65 @@ class S3ReportStore(ReportStore):
         Even though we store it in gzip format, browsers will transparently
         download and decompress it. Filenames should end in `.csv`, not `.gz`.
         """
-        output_buffer = StringIO()
-        gzip_file = GzipFile(fileobj=output_buffer, mode="wb")
-        csv.writer(gzip_file).writerows(rows)
-        gzip_file.close()
+        with TemporaryFile() as output_file:
+            gzip_file = GzipFile(fileobj=output_file, mode="wb")
+            csv.writer(gzip_file).writerows(rows)
+            gzip_file.close()
+
+            output_file.seek(0)
+            key = self.key_for(course_id, filename)
+            key.set_contents_from_file(
+                output_file,
+                headers={
+                    "Content-Encoding": "gzip",
+                    "Content-Type": "text/csv",
+                }
+            )
+
+    def partial_key_for(self, course_id, name):
+        """
+        Return the S3 key used for the partial file `name` of `course_id`.
+        Partial files live outside of the course directory used by `key_for`.
+        """
+        key = Key(self.bucket)
+        key.key = "{}/partials/{}/{}".format(
+            self.root_path,
+            hashlib.sha1(course_id).hexdigest(),
+            name
+        )
+        return key
+
+    def store_partial_rows(self, course_id, name, rows):
+        """
+        Write `rows` as an (uncompressed) csv partial file called `name`.
+        """
+        with TemporaryFile() as output_file:
+            csv.writer(output_file).writerows(rows)
+            output_file.seek(0)
+            self.partial_key_for(course_id, name).set_contents_from_file(output_file)
+
+    def partial_rows(self, course_id, name):
+        """
+        Yield the rows of the partial file `name`, or nothing if it doesn't
+        exist. The file is spooled to local disk rather than read into memory.
+        """
+        key = self.bucket.get_key(self.partial_key_for(course_id, name).key)
+        if key is None:
+            return
+
+        with TemporaryFile() as input_file:
+            key.get_contents_to_file(input_file)
+            input_file.seek(0)
+            for row in csv.reader(input_file):
+                yield row
 
-        self.store(course_id, filename, output_buffer)
+    def has_partial(self, course_id, name):
+        """Return whether the partial file `name` exists."""
+        return self.bucket.get_key(self.partial_key_for(course_id, name).key) is not None
+
+    def delete_partial(self, course_id, name):
+        """Delete the partial file `name`, if it exists."""
+        self.bucket.delete_key(self.partial_key_for(course_id, name).key)
 
     def links_for(self, course_id):
         """
@@ -382,9 +439,63 @@ class LocalFSReportStore(ReportStore):
         Given a course_id, filename, and rows (each row is an iterable of strings),
         write this data out.
         """
-        output_buffer = StringIO()
-        csv.writer(output_buffer).writerows(rows)
-        self.store(course_id, filename, output_buffer)
+        full_path = self.path_to(course_id, filename)
+        directory = os.path.dirname(full_path)
+        if not os.path.exists(directory):
+            os.mkdir(directory)
+
+        with open(full_path, "wb") as f:
+            csv.writer(f).writerows(rows)
+
+    def partial_path_to(self, course_id, name):
+        """
+        Return the full path to the partial file `name` for a given course.
+        Partial files live outside of the course directory used by `path_to`.
+        """
+        return os.path.join(self.root_path, "partials", urllib.quote(course_id, safe=''), name)
+
+    def store_partial_rows(self, course_id, name, rows):
+        """
+        Write `rows` as a csv partial file called `name`. The file only
+        appears once it is complete.
+        """
+        full_path = self.partial_path_to(course_id, name)
+        directory = os.path.dirname(full_path)
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        tmp_path = full_path + ".tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                csv.writer(f).writerows(rows)
+            os.rename(tmp_path, full_path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def partial_rows(self, course_id, name):
+        """
+        Yield the rows of the partial file `name`, or nothing if it doesn't
+        exist.
+        """
+        full_path = self.partial_path_to(course_id, name)
+        if not os.path.exists(full_path):
+            return
+
+        with open(full_path, "rb") as f:
+            for row in csv.reader(f):
+                yield row
+
+    def has_partial(self, course_id, name):
+        """Return whether the partial file `name` exists."""
+        return os.path.exists(self.partial_path_to(course_id, name))
+
+    def delete_partial(self, course_id, name):
+        """Delete the partial file `name`, if it exists."""
+        full_path = self.partial_path_to(course_id, name)
+        if os.path.exists(full_path):
+            os.remove(full_path)
 
     def links_for(self, course_id):
         """
@@ -424,7 +424,7 @@ def check_subtask_is_valid(entry_id, current_task_id, new_subtask_status):
         raise DuplicateTaskException(msg)
 
 
-def update_subtask_status(entry_id, current_task_id, new_subtask_status, retry_count=0):
+def update_subtask_status(entry_id, current_task_id, new_subtask_status, retry_count=0, complete_task=True):
     """
     Update the status of the subtask in the parent InstructorTask object tracking its progress.
 
@@ -435,9 +435,14 @@ def update_subtask_status(entry_id, current_task_id, new_subtask_status, retry_c
 
     The subtask lock acquired in the call to check_subtask_is_valid() is released here, only when
     the attempting of retries has concluded.
+
+    If `complete_task` is False, the InstructorTask is left in progress when its last subtask
+    completes, for the caller to finish it.
+
+    Returns True if this update completed the last outstanding subtask of the InstructorTask.
     """
     try:
-        _update_subtask_status(entry_id, current_task_id, new_subtask_status)
+        return _update_subtask_status(entry_id, current_task_id, new_subtask_status, complete_task)
     except DatabaseError:
         # If we fail, try again recursively.
         retry_count += 1
@@ -445,7 +450,7 @@ def update_subtask_status(entry_id, current_task_id, new_subtask_status, retry_c
             TASK_LOG.info("Retrying to update status for subtask %s of instructor task %d with status %s:  retry %d",
                           current_task_id, entry_id, new_subtask_status, retry_count)
             dog_stats_api.increment('instructor_task.subtask.retry_after_failed_update')
-            update_subtask_status(entry_id, current_task_id, new_subtask_status, retry_count)
+            return update_subtask_status(entry_id, current_task_id, new_subtask_status, retry_count, complete_task)
         else:
             TASK_LOG.info("Failed to update status after %d retries for subtask %s of instructor task %d with status %s",
                           retry_count, current_task_id, entry_id, new_subtask_status)
@@ -459,7 +464,7 @@ def update_subtask_status(entry_id, current_task_id, new_subtask_status, retry_c
 
 
 @transaction.commit_manually
-def _update_subtask_status(entry_id, current_task_id, new_subtask_status):
+def _update_subtask_status(entry_id, current_task_id, new_subtask_status, complete_task=True):
     """
     Update the status of the subtask in the parent InstructorTask object tracking its progress.
 
@@ -479,12 +484,14 @@ def _update_subtask_status(entry_id, current_task_id, new_subtask_status):
     subtasks.  'Total' is expected to have been set at the time the subtasks were created.
     The other three counters are incremented depending on the value of `status`.  Once the counters
     for 'succeeded' and 'failed' match the 'total', the subtasks are done and the InstructorTask's
-    "status" is changed to SUCCESS.
+    "status" is changed to SUCCESS (unless `complete_task` is False).
 
     The "subtasks" field also contains a 'status' key, that contains a dict that stores status
     information for each subtask.  At the moment, the value for each subtask (keyed by its task_id)
     is the value of the SubtaskStatus.to_dict(), but could be expanded in future to store information
     about failure messages, progress made, etc.
+
+    Returns True if this update completed the last outstanding subtask.
     """
     TASK_LOG.info("Preparing to update status for subtask %s for instructor task %d with status %s",
                   current_task_id, entry_id, new_subtask_status)
@@ -535,7 +542,7 @@ def _update_subtask_status(entry_id, current_task_id, new_subtask_status):
         # At present, we mark the task as having succeeded.  In future, we should see
         # if there was a catastrophic failure that occurred, and figure out how to
         # report that here.
-        if num_remaining <= 0:
+        if num_remaining <= 0 and complete_task:
             entry.task_state = SUCCESS
         entry.subtasks = json.dumps(subtask_dict)
         entry.task_output = InstructorTask.create_output_for_success(task_progress)
@@ -552,3 +559,4 @@ def _update_subtask_status(entry_id, current_task_id, new_subtask_status):
     else:
         TASK_LOG.debug("about to commit....")
         transaction.commit()
+        return num_remaining <= 0
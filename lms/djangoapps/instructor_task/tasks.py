@@ -19,6 +19,8 @@ a problem URL and optionally a student.  These are used to set up the initial va
 of the query for traversing StudentModule objects.
 
 """
+import traceback
+
 from django.conf import settings
 from django.utils.translation import ugettext_noop
 from celery import task
@@ -31,6 +33,9 @@ from instructor_task.tasks_helper import (
     reset_attempts_module_state,
     delete_problem_module_state,
     push_grades_to_s3,
+    push_grades_to_partial,
+    merge_grade_report,
+    fail_grade_report,
 )
 from bulk_email.tasks import perform_delegate_email_batches
 
@@ -139,3 +144,41 @@ def calculate_grades_csv(entry_id, xmodule_instance_args):
     action_name = ugettext_noop('graded')
     task_fn = partial(push_grades_to_s3, xmodule_instance_args)
     return run_main_task(entry_id, task_fn, action_name)
+
+
+@task(routing_key=settings.GRADES_DOWNLOAD_ROUTING_KEY)  # pylint: disable=E1102
+def calculate_grades_csv_subtask(entry_id, course_id, subtask_index, student_ids, timestamp_str, subtask_status_dict):
+    """
+    Grade one chunk of the students of a `calculate_grades_csv` task.
+
+    The `entry_id` is the id of the parent InstructorTask entry. The grades of
+    the students with ids `student_ids` are stored in a partial report, which
+    is merged into the final report by the last subtask to complete. See
+    `push_grades_to_partial` for details.
+    """
+    return push_grades_to_partial(
+        entry_id, course_id, subtask_index, student_ids, timestamp_str, subtask_status_dict
+    )
+
+
+@task(  # pylint: disable=E1102
+    routing_key=settings.GRADES_DOWNLOAD_ROUTING_KEY,
+    default_retry_delay=settings.GRADES_DOWNLOAD_MERGE_RETRY_DELAY,
+    max_retries=settings.GRADES_DOWNLOAD_MERGE_MAX_RETRIES,
+)
+def calculate_grades_csv_merge(entry_id, course_id, timestamp_str):
+    """
+    Merge the partial reports of the subtasks of a `calculate_grades_csv`
+    task into the final report, once they have all completed.
+
+    The merge is retried when it fails (e.g. on a storage error). Once the
+    retries are exhausted, the InstructorTask `entry_id` is marked as failed.
+    See `merge_grade_report` for details.
+    """
+    try:
+        merge_grade_report(entry_id, course_id, timestamp_str)
+    except Exception as exc:  # pylint: disable=broad-except
+        if calculate_grades_csv_merge.request.retries < calculate_grades_csv_merge.max_retries:
+            raise calculate_grades_csv_merge.retry(exc=exc)
+        fail_grade_report(entry_id, course_id, exc, traceback.format_exc())
+        raise
@@ -3,6 +3,7 @@ This file contains tasks that are designed to perform background operations on t
 running state of a course.
 
 """
+import itertools
 import json
 import urllib
 from datetime import datetime
@@ -11,6 +12,7 @@ from time import time
 from celery import Task, current_task
 from celery.utils.log import get_task_logger
 from celery.states import SUCCESS, FAILURE
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.db import transaction, reset_queries
 from dogapi import dog_stats_api
@@ -19,11 +21,17 @@ from pytz import UTC
 from xmodule.modulestore.django import modulestore
 from track.views import task_track
 
-from courseware.grades import iterate_grades_for
+from courseware.grades import iterate_bulk_grades_for
 from courseware.models import StudentModule
 from courseware.model_data import FieldDataCache
 from courseware.module_render import get_module_for_descriptor_internal
 from instructor_task.models import ReportStore, InstructorTask, PROGRESS
+from instructor_task.subtasks import (
+    SubtaskStatus,
+    queue_subtasks_for_query,
+    check_subtask_is_valid,
+    update_subtask_status,
+)
 from student.models import CourseEnrollment
 
 # define different loggers for use within tasks and on client side
@@ -470,105 +478,288 @@ def delete_problem_module_state(xmodule_instance_args, _module_descriptor, stude
     return UPDATE_STATUS_SUCCEEDED
 
 
-def push_grades_to_s3(_xmodule_instance_args, _entry_id, course_id, _task_input, action_name):
+def push_grades_to_s3(_xmodule_instance_args, entry_id, course_id, _task_input, action_name):
     """
     For a given `course_id`, generate a grades CSV file for all students that
     are enrolled, and store using a `ReportStore`. Once created, the files can
     be accessed by instantiating another `ReportStore` (via
-    `ReportStore.from_config()`) and calling `link_for()` on it. Writes are
-    buffered, so we'll never write part of a CSV file to S3 -- i.e. any files
-    that are visible in ReportStore will be complete ones.
-
-    As we start to add more CSV downloads, it will probably be worthwhile to
-    make a more general CSVDoc class instead of building out the rows like we
-    do here.
+    `ReportStore.from_config()`) and calling `link_for()` on it.
+
+    The enrolled students are split into subtasks of at most
+    settings.GRADES_DOWNLOAD_STUDENTS_PER_TASK students, queued the same way as
+    bulk email subtasks (see `queue_subtasks_for_query`). Each subtask grades
+    its students and streams its rows into a partial file, and the subtask
+    that completes last merges the partial files into the final report (see
+    `merge_grade_report`). The final files only show up in the ReportStore
+    once they are complete.
     """
-    start_time = datetime.now(UTC)
-    status_interval = 100
+    # Deferred to avoid a circular import, since tasks imports this module.
+    from instructor_task.tasks import calculate_grades_csv_subtask
+
+    entry = InstructorTask.objects.get(pk=entry_id)
+
+    # If this task is being rerun after its subtasks were queued (e.g. after
+    # losing the connection to the broker), don't queue them again.
+    if len(entry.subtasks) > 0 and len(entry.task_output) > 0:
+        TASK_LOG.warning("Task %s has already been processed for course %s!  InstructorTask = %s",
+                         entry.task_id, course_id, entry)
+        return json.loads(entry.task_output)
 
+    timestamp_str = datetime.now(UTC).strftime("%Y-%m-%d-%H%M")
     enrolled_students = CourseEnrollment.users_enrolled_in(course_id)
-    num_total = enrolled_students.count()
-    num_attempted = 0
-    num_succeeded = 0
-    num_failed = 0
-    curr_step = "Calculating Grades"
 
-    def update_task_progress():
-        """Return a dict containing info about current task"""
-        current_time = datetime.now(UTC)
-        progress = {
+    if not enrolled_students.exists():
+        # There is nothing to split into subtasks, so just store an empty report.
+        ReportStore.from_config().store_rows(course_id, _grade_report_filename(course_id, timestamp_str), [])
+        return {
             'action_name': action_name,
-            'attempted': num_attempted,
-            'succeeded': num_succeeded,
-            'failed': num_failed,
-            'total': num_total,
-            'duration_ms': int((current_time - start_time).total_seconds() * 1000),
-            'step': curr_step,
+            'attempted': 0,
+            'succeeded': 0,
+            'failed': 0,
+            'skipped': 0,
+            'total': 0,
+            'duration_ms': 0,
         }
-        _get_current_task().update_state(state=PROGRESS, meta=progress)
 
-        return progress
+    subtask_indexes = itertools.count()
+
+    def _create_grade_report_subtask(student_list, initial_subtask_status):
+        """Creates a subtask to grade the students in `student_list`."""
+        return calculate_grades_csv_subtask.subtask(
+            (
+                entry_id,
+                course_id,
+                next(subtask_indexes),
+                [student['pk'] for student in student_list],
+                timestamp_str,
+                initial_subtask_status.to_dict(),
+            ),
+            task_id=initial_subtask_status.task_id,
+            routing_key=settings.GRADES_DOWNLOAD_ROUTING_KEY,
+        )
 
-    # Loop over all our students and build our CSV lists in memory
-    header = None
-    rows = []
-    err_rows = [["id", "username", "error_msg"]]
-    for student, gradeset, err_msg in iterate_grades_for(course_id, enrolled_students):
-        # Periodically update task status (this is a cache write)
-        if num_attempted % status_interval == 0:
-            update_task_progress()
-        num_attempted += 1
+    return queue_subtasks_for_query(
+        entry,
+        action_name,
+        _create_grade_report_subtask,
+        enrolled_students,
+        [],
+        settings.GRADES_DOWNLOAD_STUDENTS_PER_QUERY,
+        settings.GRADES_DOWNLOAD_STUDENTS_PER_TASK,
+    )
 
-        if gradeset:
-            # We were able to successfully grade this student for this course.
-            num_succeeded += 1
-            if not header:
-                # Encode the header row in utf-8 encoding in case there are unicode characters
-                header = [section['label'].encode('utf-8') for section in gradeset[u'section_breakdown']]
-                rows.append(["id", "email", "username", "grade"] + header)
-
-            percents = {
-                section['label']: section.get('percent', 0.0)
-                for section in gradeset[u'section_breakdown']
-                if 'label' in section
-            }
-
-            # Not everybody has the same gradable items. If the item is not
-            # found in the user's gradeset, just assume it's a 0. The aggregated
-            # grades for their sections and overall course will be calculated
-            # without regard for the item they didn't have access to, so it's
-            # possible for a student to have a 0.0 show up in their row but
-            # still have 100% for the course.
-            row_percents = [percents.get(label, 0.0) for label in header]
-            rows.append([student.id, student.email, student.username, gradeset['percent']] + row_percents)
-        else:
-            # An empty gradeset means we failed to grade a student.
-            num_failed += 1
-            err_rows.append([student.id, student.username, err_msg])
 
-    # By this point, we've got the rows we're going to stuff into our CSV files.
-    curr_step = "Uploading CSVs"
-    update_task_progress()
+def push_grades_to_partial(entry_id, course_id, subtask_index, student_ids, timestamp_str, subtask_status_dict):
+    """
+    Grade the students with ids `student_ids` for one subtask of a grade
+    report, and store the resulting rows in partial files of the ReportStore:
+    one for the grades and, if any students couldn't be graded, one for the
+    errors. Grade rows are streamed to the ReportStore as they are produced.
+
+    If this is the last subtask of the InstructorTask to complete, merge all
+    partial files into the final report.
 
-    # Generate parts of the file name
-    timestamp_str = start_time.strftime("%Y-%m-%d-%H%M")
-    course_id_prefix = urllib.quote(course_id.replace("/", "_"))
+    Returns the final status of the subtask as a dict (see SubtaskStatus).
+    """
+    subtask_status = SubtaskStatus.from_dict(subtask_status_dict)
+    current_task_id = subtask_status.task_id
+    TASK_LOG.info("Preparing to grade %d students as subtask %s for instructor task %d",
+                  len(student_ids), current_task_id, entry_id)
+
+    # Reject the subtask if it is a duplicate, or already completed.
+    check_subtask_is_valid(entry_id, current_task_id, subtask_status)
+
+    entry = InstructorTask.objects.get(pk=entry_id)
+    students = User.objects.filter(pk__in=student_ids).order_by('pk')
+    report_store = ReportStore.from_config()
+    err_rows = []
+
+    def grade_rows():
+        """
+        Yield the header row and a row of grades for every student that could
+        be graded, collecting the students that couldn't in err_rows.
+        """
+        header = None
+        for student, gradeset, err_msg in iterate_bulk_grades_for(course_id, students):
+            if gradeset:
+                # We were able to successfully grade this student for this course.
+                subtask_status.increment(succeeded=1)
+                if not header:
+                    # Encode the header row in utf-8 encoding in case there are unicode characters
+                    header = [section['label'].encode('utf-8') for section in gradeset[u'section_breakdown']]
+                    yield ["id", "email", "username", "grade"] + header
+
+                percents = {
+                    section['label']: section.get('percent', 0.0)
+                    for section in gradeset[u'section_breakdown']
+                    if 'label' in section
+                }
+
+                # Not everybody has the same gradable items. If the item is not
+                # found in the user's gradeset, just assume it's a 0. The aggregated
+                # grades for their sections and overall course will be calculated
+                # without regard for the item they didn't have access to, so it's
+                # possible for a student to have a 0.0 show up in their row but
+                # still have 100% for the course.
+                row_percents = [percents.get(label, 0.0) for label in header]
+                yield [student.id, student.email, student.username, gradeset['percent']] + row_percents
+            else:
+                # An empty gradeset means we failed to grade a student.
+                subtask_status.increment(failed=1)
+                if not err_rows:
+                    err_rows.append(["id", "username", "error_msg"])
+                err_rows.append([student.id, student.username, err_msg])
+
+    grade_partial = _grade_report_partial_name(entry.task_id, subtask_index)
+    err_partial = _grade_report_partial_name(entry.task_id, subtask_index, err=True)
+    failure = None
+    try:
+        report_store.store_partial_rows(course_id, grade_partial, grade_rows())
+        if err_rows:
+            report_store.store_partial_rows(course_id, err_partial, err_rows)
+    except Exception as exc:  # pylint: disable=broad-except
+        TASK_LOG.exception("Grade report subtask %s for instructor task %d: failed unexpectedly!",
+                           current_task_id, entry_id)
+        failure = exc
+        subtask_status = SubtaskStatus.create(
+            current_task_id, failed=len(student_ids), retried_nomax=subtask_status.retried_nomax,
+            retried_withmax=subtask_status.retried_withmax, state=FAILURE
+        )
+        _store_failed_grade_partials(report_store, course_id, grade_partial, err_partial, students, exc)
+    else:
+        subtask_status.increment(state=SUCCESS)
+
+    if update_subtask_status(entry_id, current_task_id, subtask_status, complete_task=False):
+        # Deferred to avoid a circular import, since tasks imports this module.
+        from instructor_task.tasks import calculate_grades_csv_merge
+        calculate_grades_csv_merge.apply_async(
+            (entry_id, course_id, timestamp_str),
+            routing_key=settings.GRADES_DOWNLOAD_ROUTING_KEY,
+        )
 
-    # Perform the actual upload
+    if failure is not None:
+        raise failure
+    return subtask_status.to_dict()
+
+
+def _store_failed_grade_partials(report_store, course_id, grade_partial, err_partial, students, exc):
+    """
+    Replace the partial files of a grade report subtask that failed with an
+    empty grade partial, and an error partial listing all of its `students`.
+
+    If they can't be written either, the grade partial is left missing, which
+    makes the merge of the report fail rather than leave the students out.
+    """
+    error_msg = u"Grade report subtask failed: {}".format(exc)
+    try:
+        report_store.delete_partial(course_id, grade_partial)
+        report_store.store_partial_rows(course_id, err_partial, itertools.chain(
+            [["id", "username", "error_msg"]],
+            ([student.id, student.username, error_msg] for student in students)
+        ))
+        report_store.store_partial_rows(course_id, grade_partial, [])
+    except Exception:  # pylint: disable=broad-except
+        TASK_LOG.exception("Could not store the failed students of a grade report subtask")
+
+
+class GradeReportMergeError(Exception):
+    """
+    Error raised when the partial files of a grade report can't be merged.
+    """
+    pass
+
+
+def merge_grade_report(entry_id, course_id, timestamp_str):
+    """
+    Merge the partial files written by the subtasks of the grade report
+    InstructorTask `entry_id` into the final grade report, plus an error
+    report if any students could not be graded. Every partial file is read
+    once and rows are streamed straight into the final file, keeping only the
+    first header row. Partial files are deleted afterwards, and only then is
+    the InstructorTask marked as successful.
+
+    Raises GradeReportMergeError if the grade partial of a subtask is
+    missing. The merge can be retried until it succeeds: the final files are
+    simply written again.
+    """
+    entry = InstructorTask.objects.get(pk=entry_id)
+    if entry.task_state == SUCCESS:
+        TASK_LOG.warning("Grade report of instructor task %d has already been merged", entry_id)
+        return
+    num_subtasks = json.loads(entry.subtasks)['total']
     report_store = ReportStore.from_config()
+
+    def merged_rows(partial_names):
+        """Yield the rows of all `partial_names`, with a single header row."""
+        header_written = False
+        for partial_name in partial_names:
+            rows = report_store.partial_rows(course_id, partial_name)
+            header = next(rows, None)
+            if header is None:
+                continue
+            if not header_written:
+                header_written = True
+                yield header
+            for row in rows:
+                yield row
+
+    grade_partials = [_grade_report_partial_name(entry.task_id, index) for index in range(num_subtasks)]
+    err_partials = [_grade_report_partial_name(entry.task_id, index, err=True) for index in range(num_subtasks)]
+
+    # Every subtask leaves a grade partial (empty if it failed, with its
+    # students in its error partial), so a missing one means lost students.
+    missing = [name for name in grade_partials if not report_store.has_partial(course_id, name)]
+    if missing:
+        raise GradeReportMergeError(
+            u"Missing grade report partial files: {}".format(u", ".join(missing))
+        )
+
     report_store.store_rows(
         course_id,
-        u"{}_grade_report_{}.csv".format(course_id_prefix, timestamp_str),
-        rows
+        _grade_report_filename(course_id, timestamp_str),
+        merged_rows(grade_partials)
     )
 
-    # If there are any error rows (don't count the header), write them out as well
-    if len(err_rows) > 1:
+    # If there are any error rows, write them out as well
+    err_rows = merged_rows(err_partials)
+    err_header = next(err_rows, None)
+    if err_header is not None:
         report_store.store_rows(
             course_id,
-            u"{}_grade_report_{}_err.csv".format(course_id_prefix, timestamp_str),
-            err_rows
+            _grade_report_filename(course_id, timestamp_str, err=True),
+            itertools.chain([err_header], err_rows)
         )
 
-    # One last update before we close out...
-    return update_task_progress()
+    _delete_grade_report_partials(entry, course_id, report_store)
+    InstructorTask.objects.filter(pk=entry_id).update(task_state=SUCCESS)
+
+
+def fail_grade_report(entry_id, course_id, exception, traceback_string):
+    """
+    Mark the grade report InstructorTask `entry_id` as failed with
+    `exception`, once merging its partial files has been given up on, and
+    delete the partial files.
+    """
+    entry = InstructorTask.objects.get(pk=entry_id)
+    _delete_grade_report_partials(entry, course_id, ReportStore.from_config())
+    entry.task_state = FAILURE
+    entry.task_output = InstructorTask.create_output_for_failure(exception, traceback_string)
+    entry.save_now()
+
+
+def _delete_grade_report_partials(entry, course_id, report_store):
+    """Delete all the partial files of the grade report InstructorTask `entry`."""
+    for index in range(json.loads(entry.subtasks)['total']):
+        report_store.delete_partial(course_id, _grade_report_partial_name(entry.task_id, index))
+        report_store.delete_partial(course_id, _grade_report_partial_name(entry.task_id, index, err=True))
+
+
+def _grade_report_filename(course_id, timestamp_str, err=False):
+    """Return the name of the (error) grade report for `course_id` started at `timestamp_str`."""
+    course_id_prefix = urllib.quote(course_id.replace("/", "_"))
+    return u"{}_grade_report_{}{}.csv".format(course_id_prefix, timestamp_str, "_err" if err else "")
+
+
+def _grade_report_partial_name(task_id, subtask_index, err=False):
+    """Return the name of the partial file of a grade report subtask."""
+    return u"{}_{:05d}{}.csv".format(task_id, subtask_index, "_err" if err else "")
@@ -5,12 +5,18 @@ Runs tasks on answers to course problems to validate that code
 paths actually work.
 
 """
+import csv
 import json
+import os
+import shutil
+import tempfile
 from uuid import uuid4
 
 from mock import Mock, MagicMock, patch
 
 from celery.states import SUCCESS, FAILURE
+from django.conf import settings
+from django.test.utils import override_settings
 
 from xmodule.modulestore.exceptions import ItemNotFoundError
 
@@ -18,10 +24,15 @@ from courseware.models import StudentModule
 from courseware.tests.factories import StudentModuleFactory
 from student.tests.factories import UserFactory, CourseEnrollmentFactory
 
-from instructor_task.models import InstructorTask
+from instructor_task.models import InstructorTask, ReportStore
 from instructor_task.tests.test_base import InstructorTaskModuleTestCase
 from instructor_task.tests.factories import InstructorTaskFactory
-from instructor_task.tasks import rescore_problem, reset_problem_attempts, delete_problem_state
+from instructor_task.tasks import (
+    rescore_problem,
+    reset_problem_attempts,
+    delete_problem_state,
+    calculate_grades_csv,
+)
 from instructor_task.tasks_helper import UpdateProblemModuleStateError
 
 PROBLEM_URL_NAME = "test_urlname"
@@ -437,3 +448,110 @@ class TestDeleteStateInstructorTask(TestInstructorTasks):
                 StudentModule.objects.get(course_id=self.course.id,
                                           student=student,
                                           module_state_key=self.problem_url)
+
+
+class TestGradeReportInstructorTask(TestInstructorTasks):
+    """Tests instructor task that generates the grade report in subtasks."""
+
+    def setUp(self):
+        super(TestGradeReportInstructorTask, self).setUp()
+        self.report_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.report_root)
+
+    def _run_grade_report(self, students_per_task):
+        """Run the grade report task, and return the InstructorTask entry and the report store."""
+        grades_download = {'STORAGE_TYPE': 'localfs', 'ROOT_PATH': self.report_root}
+        with override_settings(GRADES_DOWNLOAD=grades_download,
+                               GRADES_DOWNLOAD_STUDENTS_PER_TASK=students_per_task):
+            task_entry = self._create_input_entry(use_problem_url=False)
+            self._run_task_with_mock_celery(calculate_grades_csv, task_entry.id, task_entry.task_id)
+            return InstructorTask.objects.get(id=task_entry.id), ReportStore.from_config()
+
+    def _read_report(self, report_store, filename):
+        """Return the rows of the report `filename`."""
+        with open(report_store.path_to(self.course.id, filename), "rb") as report_file:
+            return list(csv.reader(report_file))
+
+    def test_grade_report_in_subtasks(self):
+        # The instructor is enrolled too, so this is split into three subtasks.
+        students = self._create_students_with_state(4)
+        entry, report_store = self._run_grade_report(students_per_task=2)
+
+        self.assertEquals(entry.task_state, SUCCESS)
+        subtask_info = json.loads(entry.subtasks)
+        self.assertEquals(subtask_info['total'], 3)
+        self.assertEquals(subtask_info['succeeded'], 3)
+        output = json.loads(entry.task_output)
+        self.assertEquals(output['succeeded'], 5)
+        self.assertEquals(output['failed'], 0)
+
+        # A single report, with one header and a row for every student
+        links = report_store.links_for(self.course.id)
+        self.assertEquals(len(links), 1)
+        rows = self._read_report(report_store, links[0][0])
+        self.assertEquals(rows[0][:4], ["id", "email", "username", "grade"])
+        self.assertEquals(
+            sorted(row[2] for row in rows[1:]),
+            sorted([student.username for student in students] + [self.instructor.username])
+        )
+
+        # The partial files have been cleaned up.
+        partials_dir = os.path.dirname(report_store.partial_path_to(self.course.id, 'x'))
+        self.assertEquals(os.listdir(partials_dir), [])
+
+    def test_grade_report_errors(self):
+        self._create_students_with_state(2)
+        with patch('courseware.grades._bulk_grade') as mock_grade:
+            mock_grade.side_effect = Exception("Grading failed")
+            entry, report_store = self._run_grade_report(students_per_task=2)
+
+        self.assertEquals(entry.task_state, SUCCESS)
+        output = json.loads(entry.task_output)
+        self.assertEquals(output['succeeded'], 0)
+        self.assertEquals(output['failed'], 3)
+
+        # The grade report is empty, and the error report has a single header.
+        filenames = [filename for filename, _url in report_store.links_for(self.course.id)]
+        self.assertEquals(len(filenames), 2)
+        err_filename = [filename for filename in filenames if filename.endswith("_err.csv")][0]
+        err_rows = self._read_report(report_store, err_filename)
+        self.assertEquals(err_rows[0], ["id", "username", "error_msg"])
+        self.assertEquals(len(err_rows), 4)
+
+    def test_grade_report_failed_subtask(self):
+        students = self._create_students_with_state(3)
+        with patch('instructor_task.tasks_helper.iterate_bulk_grades_for') as mock_iterate:
+            mock_iterate.side_effect = Exception("Subtask failed")
+            entry, report_store = self._run_grade_report(students_per_task=2)
+
+        self.assertEquals(entry.task_state, SUCCESS)
+        subtask_info = json.loads(entry.subtasks)
+        self.assertEquals(subtask_info['failed'], 2)
+        output = json.loads(entry.task_output)
+        self.assertEquals(output['succeeded'], 0)
+        self.assertEquals(output['failed'], 4)
+
+        # The students of the failed subtasks are all in the error report.
+        filenames = [filename for filename, _url in report_store.links_for(self.course.id)]
+        err_filename = [filename for filename in filenames if filename.endswith("_err.csv")][0]
+        err_rows = self._read_report(report_store, err_filename)
+        self.assertEquals(
+            sorted(row[1] for row in err_rows[1:]),
+            sorted([student.username for student in students] + [self.instructor.username])
+        )
+        partials_dir = os.path.dirname(report_store.partial_path_to(self.course.id, 'x'))
+        self.assertEquals(os.listdir(partials_dir), [])
+
+    def test_grade_report_failed_merge(self):
+        self._create_students_with_state(2)
+        with patch('instructor_task.models.LocalFSReportStore.store_rows') as mock_store_rows:
+            mock_store_rows.side_effect = IOError("Storage failed")
+            entry, report_store = self._run_grade_report(students_per_task=2)
+
+        # The merge was retried, then the task marked as failed and cleaned up.
+        self.assertEquals(mock_store_rows.call_count, settings.GRADES_DOWNLOAD_MERGE_MAX_RETRIES + 1)
+        self.assertEquals(entry.task_state, FAILURE)
+        self.assertEquals(json.loads(entry.task_output)['message'], "Storage failed")
+        self.assertEquals(report_store.links_for(self.course.id), [])
+        partials_dir = os.path.dirname(report_store.partial_path_to(self.course.id, 'x'))
+        self.assertEquals(os.listdir(partials_dir), [])
@@ -245,6 +245,7 @@ for name, value in ENV_TOKENS.get("CODE_JAIL", {}).items():
         CODE_JAIL[name] = value
 
 COURSES_WITH_UNSAFE_CODE = ENV_TOKENS.get("COURSES_WITH_UNSAFE_CODE", [])
+SAFE_EXEC_RESULT_CACHE_SIZE = ENV_TOKENS.get("SAFE_EXEC_RESULT_CACHE_SIZE", SAFE_EXEC_RESULT_CACHE_SIZE)
 
 # Event Tracking
 if "TRACKING_IGNORE_URL_PATTERNS" in ENV_TOKENS:
@@ -366,6 +367,10 @@ VERIFY_STUDENT = AUTH_TOKENS.get("VERIFY_STUDENT", VERIFY_STUDENT)
 GRADES_DOWNLOAD_ROUTING_KEY = HIGH_MEM_QUEUE
 
 GRADES_DOWNLOAD = ENV_TOKENS.get("GRADES_DOWNLOAD", GRADES_DOWNLOAD)
+GRADES_DOWNLOAD_STUDENTS_PER_TASK = ENV_TOKENS.get('GRADES_DOWNLOAD_STUDENTS_PER_TASK', GRADES_DOWNLOAD_STUDENTS_PER_TASK)
+GRADES_DOWNLOAD_STUDENTS_PER_QUERY = ENV_TOKENS.get('GRADES_DOWNLOAD_STUDENTS_PER_QUERY', GRADES_DOWNLOAD_STUDENTS_PER_QUERY)
+GRADES_DOWNLOAD_MERGE_MAX_RETRIES = ENV_TOKENS.get('GRADES_DOWNLOAD_MERGE_MAX_RETRIES', GRADES_DOWNLOAD_MERGE_MAX_RETRIES)
+GRADES_DOWNLOAD_MERGE_RETRY_DELAY = ENV_TOKENS.get('GRADES_DOWNLOAD_MERGE_RETRY_DELAY', GRADES_DOWNLOAD_MERGE_RETRY_DELAY)
 
 ##### ACCOUNT LOCKOUT DEFAULT PARAMETERS #####
 MAX_FAILED_LOGIN_ATTEMPTS_ALLOWED = ENV_TOKENS.get("MAX_FAILED_LOGIN_ATTEMPTS_ALLOWED", 5)
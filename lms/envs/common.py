@@ -207,6 +207,23 @@ FEATURES = {
     # grades CSV files to S3 and give links for downloads.
     'ENABLE_S3_GRADE_DOWNLOADS': False,
 
+    # Persist per-section scores for each student (StudentSectionScore), so
+    # that grading and the progress page only rescore sections whose student
+    # state or content changed since they were last scored.
+    'ENABLE_PERSISTENT_SECTION_SCORES': False,
+
+    # Buffer the student state (StudentModule etc.) written during a request,
+    # and write it, along with its history, in bulk at the end of the request.
+    'ENABLE_BUFFERED_STUDENT_STATE_WRITES': False,
+
+    # Write StudentModuleHistory rows in batches from a background thread
+    # (see STUDENT_MODULE_HISTORY_WRITER) instead of during the request.
+    'ENABLE_ASYNC_STUDENT_MODULE_HISTORY': False,
+
+    # Cache the rendered student_view of XBlocks which are the same for every
+    # user (see XModule.has_user_independent_student_view), per course version.
+    'ENABLE_XBLOCK_FRAGMENT_CACHE': False,
+
     # whether to use password policy enforcement or not
     'ENFORCE_PASSWORD_POLICY': False,
 
@@ -384,6 +401,24 @@ COURSE_SETTINGS = {
 LMS_MIGRATION_ALLOWED_IPS = []
 
 
+########################## Student module history #############################
+
+# Used when FEATURES['ENABLE_ASYNC_STUDENT_MODULE_HISTORY'] is on
+STUDENT_MODULE_HISTORY_WRITER = {
+    'BATCH_SIZE': 500,
+    'FLUSH_INTERVAL': 1.0,
+    'MAX_QUEUE_SIZE': 10000,
+}
+
+# Enforced by the clean_history management command. None keeps everything.
+STUDENT_MODULE_HISTORY_RETENTION = {
+    # number of history rows kept per student module
+    'KEEP_VERSIONS': None,
+    # history rows older than this are deleted, except the last one of each
+    # student module
+    'MAX_AGE_DAYS': None,
+}
+
 ############################## EVENT TRACKING #################################
 
 # FIXME: Should we be doing this truncation?
@@ -463,8 +498,20 @@ CODE_JAIL = {
         # How many CPU seconds can jailed code use?
         'CPU': 1,
     },
+
+    # Warm sandboxed interpreters (see capa.safe_exec.sandbox_pool).
+    'pool': {
+        # How many per process?  0 starts an interpreter for each execution.
+        'size': 0,
+        # How many executions does an interpreter run before it's replaced?
+        'max_jobs': 100,
+    },
 }
 
+# How many results of capa's sandboxed code are kept in each process, in front
+# of the cache.  0 (the default) only uses the cache.
+SAFE_EXEC_RESULT_CACHE_SIZE = 0
+
 # Some courses are allowed to run unsafe code. This is a list of regexes, one
 # of them must match the course id for that course to run unsafe code.
 #
@@ -745,6 +792,8 @@ MIDDLEWARE_CLASSES = (
     'django.middleware.locale.LocaleMiddleware',
 
     'django.middleware.transaction.TransactionMiddleware',
+    # Must come after TransactionMiddleware
+    'courseware.middleware.StudentStateWriteMiddleware',
     # 'debug_toolbar.middleware.DebugToolbarMiddleware',
 
     'django_comment_client.utils.ViewNameMiddleware',
@@ -1269,6 +1318,15 @@ GRADES_DOWNLOAD = {
     'ROOT_PATH': '/tmp/edx-s3/grades',
 }
 
+# Parameters for breaking down course enrollment into grade report subtasks.
+GRADES_DOWNLOAD_STUDENTS_PER_TASK = 1000
+GRADES_DOWNLOAD_STUDENTS_PER_QUERY = 10000
+
+# How many times, and how many seconds apart, merging the partial grade reports
+# into the final report is retried before the report is marked as failed.
+GRADES_DOWNLOAD_MERGE_MAX_RETRIES = 5
+GRADES_DOWNLOAD_MERGE_RETRY_DELAY = 60
+
 #### PASSWORD POLICY SETTINGS #####
 
 PASSWORD_MIN_LENGTH = None
@@ -175,8 +175,19 @@ class UserTagsService(object):
 class LmsModuleSystem(LmsHandlerUrls, ModuleSystem):  # pylint: disable=abstract-method
     """
     ModuleSystem specialized to the LMS
+
+    student_view_cache_key - if not None, the student_view of blocks which
+        declare it user independent (see
+        XModule.has_user_independent_student_view) is cached under this key,
+        once rendered and wrapped.
     """
-    def __init__(self, **kwargs):
+    # How long rendered student_views are cached. The cache key changes with
+    # each version of the course, so this only bounds how long unused
+    # fragments stay in the cache.
+    STUDENT_VIEW_CACHE_TIMEOUT = 60 * 60 * 24
+
+    def __init__(self, student_view_cache_key=None, **kwargs):
+        self.student_view_cache_key = student_view_cache_key
         services = kwargs.setdefault('services', {})
         services['user_tags'] = UserTagsService(self)
         services['partitions'] = LmsPartitionService(
@@ -185,3 +196,27 @@ class LmsModuleSystem(LmsHandlerUrls, ModuleSystem):  # pylint: disable=abstract
             track_function=kwargs.get('track_function', None),
         )
         super(LmsModuleSystem, self).__init__(**kwargs)
+
+    def render(self, block, view_name, context=None):
+        """
+        Render `view_name` of `block`, reusing the cached student_view of
+        user independent blocks.
+        """
+        if not self._student_view_cacheable(block, view_name, context):
+            return super(LmsModuleSystem, self).render(block, view_name, context)
+
+        frag = self.cache.get(self.student_view_cache_key)
+        if frag is None:
+            frag = super(LmsModuleSystem, self).render(block, view_name, context)
+            self.cache.set(self.student_view_cache_key, frag, self.STUDENT_VIEW_CACHE_TIMEOUT)
+        return frag
+
+    def _student_view_cacheable(self, block, view_name, context):
+        """
+        Whether rendering `view_name` of `block` in `context` can use the
+        student_view cache.
+        """
+        if self.student_view_cache_key is None or view_name != 'student_view' or context:
+            return False
+        has_user_independent_student_view = getattr(block, 'has_user_independent_student_view', None)
+        return has_user_independent_student_view is not None and has_user_independent_student_view()
@@ -4,10 +4,11 @@ Tests of the LMS XBlock Runtime and associated utilities
 
 from django.contrib.auth.models import User
 from ddt import ddt, data
-from mock import Mock
+from mock import Mock, patch
 from unittest import TestCase
 from urlparse import urlparse
 from lms.lib.xblock.runtime import quote_slashes, unquote_slashes, LmsModuleSystem
+from xmodule.x_module import ModuleSystem
 
 TEST_STRINGS = [
     '',
@@ -136,3 +137,59 @@ class TestUserServiceAPI(TestCase):
         # Try to get tag in wrong scope
         with self.assertRaises(ValueError):
             self.runtime.service(self.mock_block, 'user_tags').get_tag('fake_scope', self.key)
+
+
+class DictCache(dict):
+    """A cache backed by a dict, ignoring timeouts"""
+    def set(self, key, value, timeout=None):  # pylint: disable=unused-argument
+        self[key] = value
+
+
+class TestStudentViewCache(TestCase):
+    """Test the caching of user independent student_views"""
+
+    def setUp(self):
+        self.cache = DictCache()
+        patcher = patch.object(ModuleSystem, 'render', create=True, side_effect=lambda block, view, context: Mock())
+        self.render = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _runtime(self, student_view_cache_key='fragment_key'):
+        """Return an LmsModuleSystem caching student_views under `student_view_cache_key`"""
+        return LmsModuleSystem(
+            static_url='/static',
+            track_function=Mock(),
+            get_module=Mock(),
+            render_template=Mock(),
+            replace_urls=str,
+            course_id="org/course/run",
+            descriptor_runtime=Mock(),
+            cache=self.cache,
+            student_view_cache_key=student_view_cache_key,
+        )
+
+    def _block(self, user_independent):
+        """Return a block declaring whether its student_view is user independent"""
+        block = Mock()
+        block.has_user_independent_student_view.return_value = user_independent
+        return block
+
+    def test_user_independent_view_cached(self):
+        block = self._block(True)
+        first = self._runtime().render(block, 'student_view')
+        second = self._runtime().render(block, 'student_view')
+
+        self.assertIs(first, second)
+        self.assertEqual(self.render.call_count, 1)
+        self.assertIs(self.cache['fragment_key'], first)
+
+    def test_not_cached(self):
+        # user dependent blocks, other views, views rendered in a context and
+        # runtimes without a cache key all render every time
+        self._runtime().render(self._block(False), 'student_view')
+        self._runtime().render(self._block(True), 'studio_view')
+        self._runtime().render(self._block(True), 'student_view', {'child_of_vertical': True})
+        self._runtime(None).render(self._block(True), 'student_view')
+
+        self.assertEqual(self.render.call_count, 4)
+        self.assertEqual(self.cache, {})
@@ -29,6 +29,8 @@ def run():
     if settings.FEATURES.get('ENABLE_THIRD_PARTY_AUTH', False):
         enable_third_party_auth()
 
+    configure_safe_exec()
+
 
 def enable_theme():
     """
@@ -104,6 +106,18 @@ def enable_microsites():
         settings.STATICFILES_DIRS.insert(0, microsites_root)
 
 
+def configure_safe_exec():
+    """
+    Keep warm sandboxed interpreters for the code of capa problems, as
+    configured by CODE_JAIL['pool'], and the results of that code in process.
+    """
+    from capa.safe_exec import configure_sandbox_pool, configure_result_cache
+
+    pool = settings.CODE_JAIL.get('pool', {})
+    configure_sandbox_pool(pool.get('size', 0), pool.get('max_jobs', 100))
+    configure_result_cache(settings.SAFE_EXEC_RESULT_CACHE_SIZE)
+
+
 def enable_third_party_auth():
     """
     Enable the use of third_party_auth, which allows users to sign in to edX